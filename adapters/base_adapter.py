@@ -1,12 +1,33 @@
 # -*- coding: utf-8 -*-
 
 from abc import ABC, abstractmethod
-from datetime import datetime, timedelta
+from datetime import datetime, time, timedelta, timezone
+from odoo.addons.external_appointment_scheduler.tools.circuit_breaker import get_breaker
+from odoo.addons.external_appointment_scheduler.tools.deadline import DeadlineExceeded
+from odoo.addons.external_appointment_scheduler.tools.rate_limit import QuotaExhausted
+from odoo.addons.external_appointment_scheduler.tools import metrics, tracing
+import functools
 import logging
 
 _logger = logging.getLogger(__name__)
 
 
+def _instrument_call(name, method):
+    """Return `method` timed into ``external_appointment_adapter_call_duration_seconds``
+    and traced as a child span of the current request.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.env is None:
+            return method(self, *args, **kwargs)
+        adapter = type(self).__name__
+        with tracing.span('adapter %s' % name, kind='CLIENT', adapter=adapter), \
+                metrics.timed(self.env.cr.dbname, 'external_appointment_adapter_call_duration_seconds',
+                              adapter=adapter, method=name):
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
 class BaseCalendarAdapter(ABC):
     """Abstract base class for calendar provider adapters.
     
@@ -14,6 +35,26 @@ class BaseCalendarAdapter(ABC):
     and implement the required abstract methods.
     """
     
+    # Working hours used to generate candidate slots (UTC)
+    BUSINESS_START_HOUR = 9
+    BUSINESS_END_HOUR = 17
+    
+    # Provider methods timed into the adapter call histogram when a
+    # subclass implements them
+    INSTRUMENTED_METHODS = (
+        'exchange_code_for_token', 'refresh_access_token', 'revoke_token', 'test_connection',
+        'get_available_slots', 'get_busy_times', 'create_event', 'update_event', 'cancel_event',
+        'get_event', 'setup_webhook', 'stop_webhook', 'process_webhook',
+    )
+    
+    def __init_subclass__(cls, **kwargs):
+        """Wrap the provider methods of every adapter class with call metrics."""
+        super().__init_subclass__(**kwargs)
+        for name in cls.INSTRUMENTED_METHODS:
+            method = cls.__dict__.get(name)
+            if callable(method):
+                setattr(cls, name, _instrument_call(name, method))
+    
     def __init__(self, env=None, config=None):
         """Initialize the adapter.
 
@@ -170,6 +211,108 @@ class BaseCalendarAdapter(ABC):
     
     # ===== Optional methods with default implementations =====
     
+    def get_busy_times(self, date_from, date_to, constraints):
+        """Get busy periods of the provider calendar.
+        
+        Args:
+            date_from (datetime): Start of the period (naive UTC)
+            date_to (datetime): End of the period (naive UTC)
+            constraints (dict): Additional constraints (duration, buffer, calendar_id)
+            
+        Returns:
+            list: Busy periods, each with naive UTC 'start' and 'end' datetimes
+        """
+        return []
+    
+    def get_busy_times_guarded(self, date_from, date_to, constraints):
+        """Call `get_busy_times` through the circuit breaker of this configuration.
+        
+        A ``deadline`` in `constraints` is checked before the call and
+        adapters use its remaining time as HTTP timeout. A call failing once
+        the deadline has expired (e.g. on that timeout) raises
+        `DeadlineExceeded` inside the breaker, which does not count it: a
+        client sending tiny budgets must not open the breaker shared by all
+        clients of the configuration.
+        
+        Raises:
+            CircuitOpenError: If the provider failed or was too slow repeatedly
+            DeadlineExceeded: If the time budget ran out before or during the call
+        """
+        deadline = constraints.get('deadline')
+        if deadline:
+            deadline.check(resume_at=date_from)
+        
+        def fetch():
+            try:
+                return self.get_busy_times(date_from, date_to, constraints)
+            except DeadlineExceeded as e:
+                if e.resume_at is None:
+                    raise DeadlineExceeded(resume_at=date_from) from e
+                raise
+            except Exception as e:
+                if deadline and deadline.expired():
+                    raise DeadlineExceeded(resume_at=date_from) from e
+                raise
+        
+        return self._get_circuit_breaker().call(fetch)
+    
+    def _get_circuit_breaker(self):
+        """Return the circuit breaker shared by every adapter of this configuration."""
+        params = self.env['ir.config_parameter'].sudo()
+        breaker = get_breaker(
+            (self.env.cr.dbname, self.config.id),
+            failure_threshold=int(params.get_param('external_appointment_scheduler.breaker_failures', 5)),
+            latency_threshold=int(params.get_param('external_appointment_scheduler.breaker_latency_ms', 3000)) / 1000,
+            reset_timeout=int(params.get_param('external_appointment_scheduler.breaker_reset_seconds', 30)),
+        )
+        breaker.neutral_exceptions = (DeadlineExceeded, QuotaExhausted)
+        return breaker
+    
+    def iter_available_slots(self, service, date_from, date_to, constraints, chunk_days=None):
+        """Yield available slots in chronological order, day by day.
+        
+        Busy times are fetched lazily: the whole window at once by default,
+        or in chunks of `chunk_days` days that double after each fetch, so
+        consumers that stop early never query far-away days.
+        
+        Args:
+            service: external.appointment.service record
+            date_from (datetime): Start of the window (naive UTC)
+            date_to (datetime): End of the window (naive UTC)
+            constraints (dict): Additional constraints (duration, buffer,
+                calendar_id, optional deadline)
+            chunk_days (int, optional): Size of the first busy-time chunk in days
+            
+        Yields:
+            dict: Slot with 'start' and 'end' datetimes
+            
+        Raises:
+            DeadlineExceeded: When ``constraints['deadline']`` expires, with
+                the start of the first day not generated as ``resume_at``
+        """
+        duration = constraints.get('duration', 60)
+        buffer = constraints.get('buffer', 15)
+        deadline = constraints.get('deadline')
+        day = date_from.date()
+        last_day = date_to.date()
+        chunk = chunk_days
+        
+        while day <= last_day:
+            chunk_last = min(last_day, day + timedelta(days=chunk - 1)) if chunk else last_day
+            busy_times = self.get_busy_times_guarded(
+                max(date_from, datetime.combine(day, time.min)),
+                min(date_to, datetime.combine(chunk_last + timedelta(days=1), time.min)),
+                constraints,
+            )
+            while day <= chunk_last:
+                if deadline:
+                    deadline.check(resume_at=max(date_from, datetime.combine(day, time.min)))
+                day_slots = self._generate_day_slots(day, date_from, date_to, duration, buffer)
+                yield from self._filter_slots_by_busy_times(day_slots, busy_times)
+                day += timedelta(days=1)
+            if chunk:
+                chunk *= 2
+    
     def setup_webhook(self, webhook_url, calendar_id=None):
         """Setup webhook subscription for calendar changes.
         
@@ -298,6 +441,30 @@ class BaseCalendarAdapter(ABC):
         
         return slots
     
+    def _generate_day_slots(self, day, not_before, not_after, duration_minutes, buffer_minutes=0):
+        """Generate the working-hour slots of a single day.
+        
+        Args:
+            day (date): Day to generate slots for
+            not_before (datetime): No slot starts before this datetime
+            not_after (datetime): No slot ends after this datetime
+            duration_minutes (int): Slot duration in minutes
+            buffer_minutes (int): Buffer time after each slot
+            
+        Returns:
+            list: Slots of the day with start and end times
+        """
+        day_start = datetime.combine(day, time(self.BUSINESS_START_HOUR))
+        day_end = datetime.combine(day, time(self.BUSINESS_END_HOUR))
+        
+        # Ensure we stay inside the requested window; the grid stays anchored
+        # on the start of the working hours whatever the window start is
+        if day_end > not_after:
+            day_end = not_after
+        
+        slots = self._generate_time_slots(day_start, day_end, duration_minutes, buffer_minutes)
+        return [slot for slot in slots if slot['start'] >= not_before]
+    
     def _filter_slots_by_busy_times(self, slots, busy_times):
         """Filter out slots that overlap with busy times.
         
@@ -355,6 +522,34 @@ class BaseCalendarAdapter(ABC):
             str: Formatted datetime string
         """
         return dt.isoformat()
+    
+    def _format_rfc3339(self, dt):
+        """Format a datetime as RFC 3339 with an explicit UTC offset.
+        
+        Naive datetimes are taken as UTC, following the Odoo convention.
+        
+        Args:
+            dt (datetime): Datetime object
+            
+        Returns:
+            str: Formatted datetime string
+        """
+        if dt.tzinfo is None:
+            return dt.isoformat() + 'Z'
+        return dt.astimezone(timezone.utc).isoformat()
+    
+    def _to_naive_utc(self, dt):
+        """Convert a datetime to naive UTC, the representation used by Odoo.
+        
+        Args:
+            dt (datetime): Naive (UTC) or timezone-aware datetime
+            
+        Returns:
+            datetime: Naive UTC datetime
+        """
+        if dt.tzinfo is None:
+            return dt
+        return dt.astimezone(timezone.utc).replace(tzinfo=None)
 
 
 # Module-level backwards-compatible alias (safe assignment)
@@ -1,9 +1,18 @@
 # -*- coding: utf-8 -*-
 
 from odoo.addons.external_appointment_scheduler.adapters.base_adapter import BaseAdapter
+from odoo.addons.external_appointment_scheduler.tools.deadline import DeadlineExceeded
+from odoo.addons.external_appointment_scheduler.tools.rate_limit import (
+    PRIORITY_WAIT, REQUEST_MAX_WAIT, QuotaExhausted, SharedTokenBucket,
+)
+from odoo.addons.external_appointment_scheduler.tools.request_log import get_log_policy, timed_event
+from odoo.addons.external_appointment_scheduler.tools.tracing import outgoing_headers
+from odoo.http import request as http_request
 from datetime import datetime, timedelta
 import logging
 import json
+import random
+import time
 
 _logger = logging.getLogger(__name__)
 
@@ -11,8 +20,11 @@ try:
     from google.oauth2.credentials import Credentials
     from google_auth_oauthlib.flow import Flow
     from googleapiclient.discovery import build
+    from googleapiclient.errors import HttpError
     from google.auth.transport.requests import Request
     import google.auth.exceptions
+    import google_auth_httplib2
+    import httplib2
 except ImportError:
     _logger.warning("Google Calendar API libraries not installed. Run: pip install google-auth google-auth-oauthlib google-auth-httplib2 google-api-python-client")
 
@@ -25,9 +37,18 @@ class GoogleCalendarAdapter(BaseAdapter):
         'https://www.googleapis.com/auth/calendar.events'
     ]
     
+    # Error reasons Google uses for quota and rate limiting on 403 responses
+    RATE_LIMIT_REASONS = {'rateLimitExceeded', 'userRateLimitExceeded', 'quotaExceeded'}
+    
+    # Exponential backoff with full jitter on rate-limited responses
+    MAX_RETRIES = 5
+    BACKOFF_BASE = 0.5
+    BACKOFF_MAX = 32
+    
     def __init__(self, env=None, config=None):
         super().__init__(env, config)
         self.service = None
+        self.credentials = None
 
     def _format_event_data(self, summary, description, start_datetime, end_datetime, attendee_email=None, location=None):
         """Helper to normalize event payload used by tests.
@@ -74,9 +95,110 @@ class GoogleCalendarAdapter(BaseAdapter):
         )
         
         # Build service
+        self.credentials = credentials
         self.service = build('calendar', 'v3', credentials=credentials)
         return self.service
     
+    def _execute(self, request, deadline=None):
+        """Execute an API request within the quota budget of this configuration.
+        
+        Every attempt takes a token from the configuration's bucket, waiting
+        according to the priority class in the ``calendar_priority`` context
+        key ('booking', 'interactive' or 'background'), and never longer than
+        `REQUEST_MAX_WAIT` while serving an HTTP request. Rate-limited answers
+        (429, or 403 with a rate limit reason) are retried with exponential
+        backoff and full jitter, and pause the bucket for the other callers.
+        
+        Args:
+            request: googleapiclient HttpRequest
+            deadline (Deadline, optional): Request time budget
+            
+        Returns:
+            dict: API response
+            
+        Raises:
+            QuotaExhausted: If no quota became available in time
+            DeadlineExceeded: If the backoff would outlast `deadline`
+        """
+        priority = self.env.context.get('calendar_priority', 'interactive')
+        bucket = self._get_quota_bucket()
+        with timed_event(get_log_policy(self.env), 'provider_call', 'provider', provider='google',
+                         config_id=self.config.id, method=getattr(request, 'methodId', None),
+                         priority=priority) as fields:
+            for attempt in range(self.MAX_RETRIES + 1):
+                fields['attempts'] = attempt + 1
+                wait = PRIORITY_WAIT.get(priority, PRIORITY_WAIT['interactive'])
+                if http_request:
+                    wait = min(wait, REQUEST_MAX_WAIT)
+                if deadline:
+                    wait = min(wait, deadline.remaining())
+                if not bucket.acquire(priority, timeout=wait):
+                    raise QuotaExhausted(f"Google API quota exhausted for config {self.config.id} ({priority})")
+                try:
+                    return self._execute_once(request, deadline)
+                except HttpError as e:
+                    fields['status'] = e.resp.status
+                    if not self._is_rate_limited(e) or attempt == self.MAX_RETRIES:
+                        raise
+                    delay = random.uniform(0, min(self.BACKOFF_MAX, self.BACKOFF_BASE * 2 ** attempt))
+                    bucket.penalize(delay)
+                    if deadline and delay >= deadline.remaining():
+                        raise DeadlineExceeded() from e
+                    _logger.warning(
+                        "Google API rate limited for config %s (HTTP %s), retry %s/%s in %.2fs",
+                        self.config.id, e.resp.status, attempt + 1, self.MAX_RETRIES, delay,
+                    )
+                    time.sleep(delay)
+    
+    def _execute_once(self, request, deadline=None):
+        """Execute an API request once, bounded by the remaining time of `deadline`.
+        
+        The request carries the correlation ID of the current trace.
+        """
+        request.headers.update(outgoing_headers())
+        if not deadline:
+            return request.execute()
+        # One-off transport whose socket timeout is what is left of the budget
+        http = google_auth_httplib2.AuthorizedHttp(
+            self.credentials, http=httplib2.Http(timeout=max(deadline.remaining(), 0.1))
+        )
+        try:
+            return request.execute(http=http)
+        except OSError as e:
+            # The socket timeout is the caller's budget, not a provider failure
+            if deadline.expired():
+                raise DeadlineExceeded() from e
+            raise
+    
+    def _is_rate_limited(self, error):
+        """Return True if an HttpError is a rate limit or quota answer."""
+        status = error.resp.status
+        if status == 429:
+            return True
+        if status != 403:
+            return False
+        try:
+            errors = json.loads(error.content.decode('utf-8')).get('error', {}).get('errors', [])
+        except (ValueError, AttributeError):
+            return False
+        return any(err.get('reason') in self.RATE_LIMIT_REASONS for err in errors)
+    
+    def _get_quota_bucket(self):
+        """Return the token bucket of this configuration's quota, shared by all workers.
+        
+        The quota (``external_appointment_scheduler.google_quota_per_minute``)
+        is kept in the ``external.appointment.rate.limit`` table, so every
+        worker and node draws from the same budget.
+        """
+        quota = int(self.env['ir.config_parameter'].sudo().get_param(
+            'external_appointment_scheduler.google_quota_per_minute', 600
+        ))
+        rate = max(quota, 1) / 60
+        # Allow bursts of about ten seconds of quota
+        return SharedTokenBucket(
+            self.env['external.appointment.rate.limit'], 'quota:google:%s' % self.config.id, rate, rate * 10,
+        )
+    
     def get_authorization_url(self):
         """Get OAuth2 authorization URL.
         
@@ -206,7 +328,7 @@ class GoogleCalendarAdapter(BaseAdapter):
         revoke_url = 'https://oauth2.googleapis.com/revoke'
         response = requests.post(revoke_url, 
             params={'token': token},
-            headers={'content-type': 'application/x-www-form-urlencoded'}
+            headers=dict(outgoing_headers(), **{'content-type': 'application/x-www-form-urlencoded'})
         )
         
         if response.status_code != 200:
@@ -221,7 +343,7 @@ class GoogleCalendarAdapter(BaseAdapter):
         service = self._get_service()
         
         # Try to list calendars
-        calendar_list = service.calendarList().list(maxResults=10).execute()
+        calendar_list = self._execute(service.calendarList().list(maxResults=10))
         
         return {
             'success': True,
@@ -241,18 +363,33 @@ class GoogleCalendarAdapter(BaseAdapter):
         Returns:
             list: Available slots
         """
+        return list(self.iter_available_slots(service, date_from, date_to, constraints))
+    
+    def get_busy_times(self, date_from, date_to, constraints):
+        """Get busy periods from the Google free/busy API.
+        
+        Args:
+            date_from (datetime): Start date
+            date_to (datetime): End date
+            constraints (dict): Constraints (duration, buffer, calendar_id)
+            
+        Returns:
+            list: Busy periods with naive UTC start/end
+        """
         calendar_service = self._get_service()
         calendar_id = constraints.get('calendar_id') or 'primary'
         
         # Get free/busy information
         body = {
-            "timeMin": self._format_datetime(date_from),
-            "timeMax": self._format_datetime(date_to),
+            "timeMin": self._format_rfc3339(date_from),
+            "timeMax": self._format_rfc3339(date_to),
             "items": [{"id": calendar_id}],
             "timeZone": "UTC"
         }
         
-        freebusy_result = calendar_service.freebusy().query(body=body).execute()
+        freebusy_result = self._execute(
+            calendar_service.freebusy().query(body=body), constraints.get('deadline')
+        )
         
         # Extract busy times
         busy_times = []
@@ -260,23 +397,11 @@ class GoogleCalendarAdapter(BaseAdapter):
         
         for busy_period in calendar_busy:
             busy_times.append({
-                'start': self._parse_datetime(busy_period['start']),
-                'end': self._parse_datetime(busy_period['end'])
+                'start': self._to_naive_utc(self._parse_datetime(busy_period['start'])),
+                'end': self._to_naive_utc(self._parse_datetime(busy_period['end'])),
             })
         
-        # Generate potential slots based on working hours
-        # For now, generate slots during business hours (9 AM - 5 PM)
-        all_slots = self._generate_business_hour_slots(
-            date_from,
-            date_to,
-            constraints.get('duration', 60),
-            constraints.get('buffer', 15)
-        )
-        
-        # Filter out busy slots
-        available_slots = self._filter_slots_by_busy_times(all_slots, busy_times)
-        
-        return available_slots
+        return busy_times
     
     def _generate_business_hour_slots(self, start_date, end_date, duration_minutes, buffer_minutes):
         """Generate slots during business hours.
@@ -292,30 +417,11 @@ class GoogleCalendarAdapter(BaseAdapter):
         """
         slots = []
         current_date = start_date.date()
-        end_date_only = end_date.date()
-        
-        # Business hours: 9 AM to 5 PM
-        business_start_hour = 9
-        business_end_hour = 17
-        
-        while current_date <= end_date_only:
-            # Create datetime for business start and end
-            day_start = datetime.combine(current_date, datetime.min.time()).replace(
-                hour=business_start_hour, minute=0, second=0, microsecond=0
-            )
-            day_end = datetime.combine(current_date, datetime.min.time()).replace(
-                hour=business_end_hour, minute=0, second=0, microsecond=0
-            )
-            
-            # Ensure we don't start before the requested start_date
-            if day_start < start_date:
-                day_start = start_date
-            
-            # Generate slots for this day
-            day_slots = self._generate_time_slots(day_start, day_end, duration_minutes, buffer_minutes)
-            slots.extend(day_slots)
-            
-            # Move to next day
+        
+        while current_date <= end_date.date():
+            slots.extend(self._generate_day_slots(
+                current_date, start_date, end_date, duration_minutes, buffer_minutes
+            ))
             current_date += timedelta(days=1)
         
         return slots
@@ -362,9 +468,9 @@ class GoogleCalendarAdapter(BaseAdapter):
             ],
         }
         
-        created_event = service.events().insert(calendarId=calendar_id, body=event).execute()
+        created_event = self._execute(service.events().insert(calendarId=calendar_id, body=event))
         
-        _logger.info(f"Created Google Calendar event: {created_event['id']}")
+        _logger.info("Created Google Calendar event: %s", created_event['id'])
         return created_event['id']
     
     def update_event(self, event_id, event_data):
@@ -381,7 +487,7 @@ class GoogleCalendarAdapter(BaseAdapter):
         calendar_id = 'primary'
         
         # Get existing event
-        event = service.events().get(calendarId=calendar_id, eventId=event_id).execute()
+        event = self._execute(service.events().get(calendarId=calendar_id, eventId=event_id))
         
         # Update fields
         event['summary'] = event_data.get('summary', event.get('summary'))
@@ -405,13 +511,13 @@ class GoogleCalendarAdapter(BaseAdapter):
         if 'attendees' in event_data:
             event['attendees'] = event_data['attendees']
         
-        updated_event = service.events().update(
+        updated_event = self._execute(service.events().update(
             calendarId=calendar_id,
             eventId=event_id,
             body=event
-        ).execute()
+        ))
         
-        _logger.info(f"Updated Google Calendar event: {event_id}")
+        _logger.info("Updated Google Calendar event: %s", event_id)
         return True
     
     def cancel_event(self, event_id):
@@ -426,9 +532,9 @@ class GoogleCalendarAdapter(BaseAdapter):
         service = self._get_service()
         calendar_id = 'primary'
         
-        service.events().delete(calendarId=calendar_id, eventId=event_id).execute()
+        self._execute(service.events().delete(calendarId=calendar_id, eventId=event_id))
         
-        _logger.info(f"Deleted Google Calendar event: {event_id}")
+        _logger.info("Deleted Google Calendar event: %s", event_id)
         return True
     
     def get_event(self, event_id):
@@ -443,7 +549,7 @@ class GoogleCalendarAdapter(BaseAdapter):
         service = self._get_service()
         calendar_id = 'primary'
         
-        event = service.events().get(calendarId=calendar_id, eventId=event_id).execute()
+        event = self._execute(service.events().get(calendarId=calendar_id, eventId=event_id))
         
         return {
             'id': event['id'],
@@ -479,7 +585,7 @@ class GoogleCalendarAdapter(BaseAdapter):
             'token': self.config.webhook_secret,
         }
         
-        watch_response = service.events().watch(calendarId=calendar_id, body=body).execute()
+        watch_response = self._execute(service.events().watch(calendarId=calendar_id, body=body))
         
         # Parse expiration
         expiration_ms = int(watch_response['expiration'])
@@ -507,7 +613,7 @@ class GoogleCalendarAdapter(BaseAdapter):
             'resourceId': self.config.webhook_resource_id,
         }
         
-        service.channels().stop(body=body).execute()
+        self._execute(service.channels().stop(body=body))
         
         _logger.info(f"Stopped webhook channel: {channel_id}")
         return True
@@ -526,7 +632,7 @@ class GoogleCalendarAdapter(BaseAdapter):
         resource_id = webhook_data.get('resource_id')
         resource_state = webhook_data.get('resource_state')
         
-        _logger.info(f"Processing Google Calendar webhook: {resource_state}")
+        _logger.debug("Processing Google Calendar webhook: %s", resource_state)
         
         # Sync calendar changes
         # This is a simplified version - in production you'd want to:
@@ -1,19 +1,42 @@
 # -*- coding: utf-8 -*-
 
-from odoo import http, _
+from odoo import api, http, _
+from odoo.exceptions import UserError, ValidationError
 from odoo.http import request
-from datetime import datetime, timedelta
+from odoo.service.model import PG_CONCURRENCY_EXCEPTIONS_TO_RETRY
+from odoo.addons.external_appointment_scheduler.tools import metrics
+from odoo.addons.external_appointment_scheduler.tools.deadline import Deadline
+from odoo.addons.external_appointment_scheduler.tools.request_log import logged_endpoint
+from odoo.addons.external_appointment_scheduler.tools.tracing import span
+from odoo.addons.external_appointment_scheduler.tools.uploads import UploadRejected
+from datetime import datetime, timedelta, timezone as dt_timezone
+import calendar
+import hashlib
+import hmac
 import json
-import base64
 import logging
 
 _logger = logging.getLogger(__name__)
 
 
+class _BookingRejected(Exception):
+    """A booking refused with an HTTP answer, raised to roll its savepoint back."""
+
+    def __init__(self, response):
+        super().__init__(response.status_code)
+        self.response = response
+
+
+def _epoch(dt):
+    """Return the epoch seconds of a naive UTC datetime."""
+    return calendar.timegm(dt.utctimetuple())
+
+
 class AppointmentAPIController(http.Controller):
     """JSON API endpoints for appointment operations."""
     
     @http.route('/api/appointments/availability', type='http', auth='public', methods=['GET', 'POST'], csrf=False)
+    @logged_endpoint('availability')
     def get_availability(self, **kw):
         """Get available time slots for a service.
         
@@ -22,83 +45,424 @@ class AppointmentAPIController(http.Controller):
             date_from (str): Start date (ISO format)
             date_to (str): End date (ISO format)
             timezone (str): Timezone
+            format (str, optional): 'json' (default), 'compact' (epoch
+                seconds, run-length encoded) or 'ndjson' (streamed per day)
+            cursor (int, optional): Continue from this epoch second, as
+                returned in ``next_cursor``
+            limit (int, optional): Maximum number of slots to return
+            budget_ms (int, optional): Time budget in milliseconds, at most
+                the configured availability budget; when it runs out the
+                response is ``partial`` with a ``next_cursor``
             
         Returns:
             dict: Available slots and service info
         """
+        limited = self._check_rate_limit()
+        if limited:
+            return limited
         try:
             # Support GET query params and POST JSON bodies
+            params = kw
             if request.httprequest.method == 'POST' and request.httprequest.headers.get('Content-Type', '').startswith('application/json'):
                 try:
                     body = request.httprequest.get_data().decode('utf-8') or '{}'
-                    payload = json.loads(body)
+                    params = json.loads(body)
                 except Exception:
-                    payload = {}
-                service_id = payload.get('service_id') or payload.get('service')
-                date_from = payload.get('date_from') or payload.get('start')
-                date_to = payload.get('date_to') or payload.get('end')
-                timezone = payload.get('timezone', 'UTC')
-            else:
-                service_id = kw.get('service_id') or kw.get('service')
-                date_from = kw.get('date_from') or kw.get('start')
-                date_to = kw.get('date_to') or kw.get('end')
-                timezone = kw.get('timezone', 'UTC')
+                    params = {}
+            service_id = params.get('service_id') or params.get('service')
+            date_from = params.get('date_from') or params.get('start')
+            date_to = params.get('date_to') or params.get('end')
+            timezone = params.get('timezone', 'UTC')
+            response_format = params.get('format') or 'json'
+            cursor = params.get('cursor')
+            limit = int(params.get('limit') or 0) or None
+            deadline = self._get_availability_deadline(params.get('budget_ms'))
 
             if not service_id:
                 err = {'error': 'Missing required parameter: service_id'}
                 return request.make_response(json.dumps(err), headers=[('Content-Type', 'application/json')])
 
+            if response_format not in ('json', 'compact', 'ndjson'):
+                err = {'error': 'Unsupported format: %s' % response_format}
+                return request.make_response(json.dumps(err), headers=[('Content-Type', 'application/json')])
+
             service = request.env['external.appointment.service'].sudo().browse(int(service_id))
             if not service.exists() or not service.active:
-                return {'error': 'Service not found or inactive'}
+                err = {'error': 'Service not found or inactive'}
+                return request.make_response(json.dumps(err), headers=[('Content-Type', 'application/json')])
 
             # Parse dates or provide sensible defaults (7 day window)
             if date_from and date_to:
-                dt_from = datetime.fromisoformat(date_from.replace('Z', '+00:00'))
-                dt_to = datetime.fromisoformat(date_to.replace('Z', '+00:00'))
+                dt_from = aligned_from = self._parse_datetime_param(date_from)
+                dt_to = self._parse_datetime_param(date_to)
             else:
-                now_dt = datetime.utcnow()
-                dt_from = now_dt
-                dt_to = now_dt + timedelta(days=7)
+                # Align the default window on the cache TTL so repeated
+                # requests share one version (and one ETag) per period; the
+                # slots themselves never start before now.
+                ttl = service._get_cache_ttl()
+                now_ts = datetime.utcnow().timestamp()
+                aligned_from = datetime.utcfromtimestamp(now_ts - now_ts % ttl)
+                dt_from = datetime.utcfromtimestamp(now_ts)
+                dt_to = aligned_from + timedelta(days=7)
+
+            # Never compute beyond the booking horizon of the service
+            dt_to = min(dt_to, datetime.utcnow() + timedelta(days=service.max_lead_days))
+            if cursor:
+                dt_from = max(dt_from, datetime.utcfromtimestamp(int(cursor)))
+                aligned_from = max(aligned_from, dt_from)
+
+            if response_format == 'ndjson':
+                return self._stream_availability(service, dt_from, dt_to, limit, deadline)
+
+            # Answer conditional requests before computing any slot
+            version = service._get_availability_version(aligned_from, dt_to, timezone)
+            etag = '%s-%s-%s' % (version, response_format, limit or '')
+            if request.httprequest.if_none_match.contains(etag):
+                return self._make_cached_json_response('', etag, self._availability_cache_control)
 
             # Get available slots
-            slots = service.get_available_slots(dt_from, dt_to, timezone)
+            availability = service._get_availability(
+                dt_from, dt_to, timezone, version=version, limit=limit, deadline=deadline
+            )
+            slots = availability['slots']
+            next_cursor = availability['next_cursor'] and _epoch(availability['next_cursor'])
+            if availability['stale']:
+                # Never let a client revalidate stale slots as current ones
+                etag += '-stale'
+            cache_control = self._availability_cache_control
+            if availability['partial']:
+                etag += '-partial'
+                cache_control = 'no-store'
+            
+            service_info = {
+                'id': service.id,
+                'name': service.name,
+                'duration': service.duration_minutes,
+                'price': service.price,
+                'currency': service.currency_id.name,
+            }
             
-            # Format slots for response
-            formatted_slots = []
-            for slot in slots:
-                start_dt = slot['start']
-                end_dt = slot['end']
-                formatted_slots.append({
-                    'id': slot.get('id'),
-                    'start': start_dt.isoformat(),
-                    'end': end_dt.isoformat(),
-                    'start_display': start_dt.strftime('%B %d, %Y at %I:%M %p'),
-                    'end_display': end_dt.strftime('%I:%M %p'),
-                    'available': True,
-                    'capacity': slot.get('capacity'),
-                })
+            if response_format == 'compact':
+                result = {
+                    'success': True,
+                    'format': 'compact',
+                    'service': service_info,
+                    'duration': service.duration_minutes * 60,
+                    'capacity': service.capacity or 1,
+                    'runs': self._encode_slot_runs(slots),
+                    'next_cursor': next_cursor,
+                    'partial': availability['partial'],
+                    'stale': availability['stale'],
+                }
+                return self._make_cached_json_response(json.dumps(result), etag, cache_control)
+            
+            result = {
+                'success': True,
+                'slots': [self._format_slot(slot) for slot in slots],
+                'service': service_info,
+                'next_cursor': next_cursor,
+                'partial': availability['partial'],
+                'stale': availability['stale'],
+            }
+
+            return self._make_cached_json_response(json.dumps(result), etag, cache_control)
+            
+        except Exception as e:
+            _logger.error(f"Error getting availability: {e}")
+            return self._make_error_response(e)
+
+    @http.route('/api/appointments/availability/summary', type='http', auth='public', methods=['GET'], csrf=False)
+    @logged_endpoint('availability_summary')
+    def get_availability_summary(self, service_id=None, date_from=None, date_to=None, **kw):
+        """Get per-day free slot counts of a service, e.g. for month views.
+        
+        Args:
+            service_id (int): Service ID
+            date_from (str, optional): Start date (ISO format), default now
+            date_to (str, optional): End date (ISO format), default 30 days later
             
+        Returns:
+            dict: One entry per day with ``date``, ``count`` and ``first``
+        """
+        limited = self._check_rate_limit()
+        if limited:
+            return limited
+        try:
+            if not service_id:
+                err = {'error': 'Missing required parameter: service_id'}
+                return request.make_response(json.dumps(err), headers=[('Content-Type', 'application/json')])
+
+            service = request.env['external.appointment.service'].sudo().browse(int(service_id))
+            if not service.exists() or not service.active:
+                err = {'error': 'Service not found or inactive'}
+                return request.make_response(json.dumps(err), headers=[('Content-Type', 'application/json')])
+
+            if date_from and date_to:
+                dt_from = aligned_from = self._parse_datetime_param(date_from)
+                dt_to = self._parse_datetime_param(date_to)
+            else:
+                # Same TTL alignment as the slot listing, one ETag per period
+                ttl = service._get_cache_ttl()
+                now_ts = datetime.utcnow().timestamp()
+                aligned_from = datetime.utcfromtimestamp(now_ts - now_ts % ttl)
+                dt_from = datetime.utcfromtimestamp(now_ts)
+                dt_to = aligned_from + timedelta(days=self._summary_default_days)
+            dt_to = min(dt_to, datetime.utcnow() + timedelta(days=service.max_lead_days))
+
+            version = service._get_availability_version(aligned_from, dt_to, 'summary')
+            etag = '%s-summary' % version
+            if request.httprequest.if_none_match.contains(etag):
+                return self._make_cached_json_response('', etag, self._availability_cache_control)
+
+            summary = service.get_availability_summary(dt_from, dt_to, version=version)
+            if summary['stale']:
+                etag += '-stale'
             result = {
                 'success': True,
-                'slots': formatted_slots,
                 'service': {
                     'id': service.id,
                     'name': service.name,
                     'duration': service.duration_minutes,
-                    'price': service.price,
-                    'currency': service.currency_id.name,
-                }
+                },
+                'stale': summary['stale'],
+                'days': [{
+                    'date': day['date'].isoformat(),
+                    'count': day['count'],
+                    'first': day['first'] and day['first'].isoformat(),
+                } for day in summary['days']],
             }
+            return self._make_cached_json_response(json.dumps(result), etag, self._availability_cache_control)
+
+        except Exception as e:
+            _logger.error(f"Error getting availability summary: {e}")
+            return self._make_error_response(e)
 
-            return request.make_response(json.dumps(result), headers=[('Content-Type', 'application/json')])
+    _summary_default_days = 30
+
+    @http.route('/api/appointments/next_available', type='http', auth='public', methods=['GET'], csrf=False)
+    @logged_endpoint('next_available')
+    def get_next_available(self, service_id=None, n=1, after=None, **kw):
+        """Get the next available slots of a service.
+        
+        Args:
+            service_id (int): Service ID
+            n (int, optional): Number of slots wanted (default 1, at most 50)
+            after (str, optional): Earliest start (ISO format)
             
+        Returns:
+            dict: Next available slots
+        """
+        limited = self._check_rate_limit()
+        if limited:
+            return limited
+        try:
+            if not service_id:
+                err = {'error': 'Missing required parameter: service_id'}
+                return request.make_response(json.dumps(err), headers=[('Content-Type', 'application/json')])
+
+            service = request.env['external.appointment.service'].sudo().browse(int(service_id))
+            if not service.exists() or not service.active:
+                err = {'error': 'Service not found or inactive'}
+                return request.make_response(json.dumps(err), headers=[('Content-Type', 'application/json')])
+
+            count = max(1, min(int(n or 1), self._next_available_max))
+            dt_after = self._parse_datetime_param(after) if after else None
+            slots = service.next_available(count, dt_after)
+
+            result = {
+                'success': True,
+                'slots': [self._format_slot(slot) for slot in slots],
+            }
+            return request.make_response(json.dumps(result), headers=[
+                ('Content-Type', 'application/json'),
+                ('Cache-Control', 'no-cache'),
+            ])
+
         except Exception as e:
-            _logger.error(f"Error getting availability: {e}")
-            return request.make_response(json.dumps({'error': str(e)}), headers=[('Content-Type', 'application/json')])
+            _logger.error(f"Error getting next available slots: {e}")
+            return self._make_error_response(e)
+
+    _next_available_max = 50
+
+    def _format_slot(self, slot):
+        """Serialize a slot for the JSON API."""
+        start_dt = slot['start']
+        end_dt = slot['end']
+        return {
+            'id': slot.get('id'),
+            'start': start_dt.isoformat(),
+            'end': end_dt.isoformat(),
+            'start_display': start_dt.strftime('%B %d, %Y at %I:%M %p'),
+            'end_display': end_dt.strftime('%I:%M %p'),
+            'available': True,
+            'capacity': slot.get('capacity'),
+        }
+
+    def _parse_datetime_param(self, value):
+        """Parse an ISO 8601 request parameter into a naive UTC datetime."""
+        dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        if dt.tzinfo:
+            dt = dt.astimezone(dt_timezone.utc).replace(tzinfo=None)
+        return dt
+
+    def _encode_slot_runs(self, slots):
+        """Run-length encode slots as ``[first_start, step, count]`` triples.
+
+        Consecutive slots whose starts are evenly spaced collapse into one
+        run; all values are epoch seconds.
+        """
+        runs = []
+        for slot in slots:
+            start = _epoch(slot['start'])
+            if runs:
+                run = runs[-1]
+                last_start = run[0] + run[1] * (run[2] - 1)
+                if run[2] == 1 and start > last_start:
+                    run[1] = start - last_start
+                    run[2] = 2
+                    continue
+                if start - last_start == run[1]:
+                    run[2] += 1
+                    continue
+            runs.append([start, 0, 1])
+        return runs
+
+    def _stream_availability(self, service, dt_from, dt_to, limit=None, deadline=None):
+        """Stream availability as NDJSON, one line per day.
+
+        The first line describes the service, then each day with free slots
+        yields ``{"date": ..., "slots": [epoch, ...]}`` and the last line is
+        ``{"end": true, "next_cursor": ..., "stale": ...}``. The response body
+        is produced after the request transaction ends, so it uses its own
+        cursor.
+        """
+        registry = request.env.registry
+        uid = request.env.uid
+        context = dict(request.env.context)
+        service_id = service.id
+        header = {
+            'service': {
+                'id': service.id,
+                'name': service.name,
+                'duration': service.duration_minutes,
+                'price': service.price,
+                'currency': service.currency_id.name,
+            },
+            'duration': service.duration_minutes * 60,
+        }
+
+        def generate():
+            yield json.dumps(header) + '\n'
+            next_cursor = None
+            state = {}
+            with registry.cursor() as cr:
+                env = api.Environment(cr, uid, context)
+                service = env['external.appointment.service'].sudo().browse(service_id)
+                count = 0
+                current_day, day_slots = None, []
+                for slot in service._iter_available_slots(dt_from, dt_to, chunk_days=1, state=state, deadline=deadline):
+                    if limit and count >= limit:
+                        next_cursor = _epoch(slot['start'])
+                        break
+                    day = slot['start'].date()
+                    if day != current_day and day_slots:
+                        yield json.dumps({'date': current_day.isoformat(), 'slots': day_slots}) + '\n'
+                        day_slots = []
+                    current_day = day
+                    day_slots.append(_epoch(slot['start']))
+                    count += 1
+                if day_slots:
+                    yield json.dumps({'date': current_day.isoformat(), 'slots': day_slots}) + '\n'
+            if next_cursor is None and state.get('cursor'):
+                next_cursor = _epoch(state['cursor'])
+            yield json.dumps({
+                'end': True,
+                'next_cursor': next_cursor,
+                'partial': bool(state.get('cursor')),
+                'stale': bool(state.get('stale')),
+            }) + '\n'
+
+        return request.make_response(generate(), headers=[
+            ('Content-Type', 'application/x-ndjson'),
+            ('Cache-Control', 'no-store'),
+        ])
     
     @http.route('/api/appointments/book', type='http', auth='public', methods=['POST'], csrf=False)
+    @logged_endpoint('book')
     def book_appointment(self, **kw):
+        """Create a new appointment booking, at most once per ``Idempotency-Key``.
+        
+        A request repeating the key of an earlier successful booking gets the
+        original response back (with ``Idempotent-Replayed: true``) and
+        books nothing. The key is claimed in the booking transaction, so
+        concurrent requests with one key are serialized: a duplicate waits
+        until the first booking commits or rolls back.
+        Reusing a key with a different payload is rejected with 422.
+        
+        Returns:
+            Response: Booking result, see `_book_appointment`
+        """
+        limited = self._check_rate_limit()
+        if limited:
+            return limited
+        key = request.httprequest.headers.get('Idempotency-Key')
+        if not key:
+            return self._book_appointment(**kw)
+        
+        # Keys are scoped to the client, as for rate limiting
+        client = request.httprequest.headers.get('X-API-Key') or request.httprequest.remote_addr
+        scoped_key = hashlib.sha256(f"{client}\n{key}".encode()).hexdigest()
+        fingerprint = self._booking_fingerprint(kw)
+        ttl_hours = int(request.env['ir.config_parameter'].sudo().get_param(
+            'external_appointment_scheduler.idempotency_ttl_hours', 24
+        ))
+        Idempotency = request.env['external.appointment.idempotency']
+        stored = Idempotency._claim(scoped_key, fingerprint, ttl_hours)
+        if stored:
+            if stored['fingerprint'] != fingerprint:
+                err = {'error': 'Idempotency-Key was already used with a different request'}
+                return request.make_response(json.dumps(err), headers=[('Content-Type', 'application/json')], status=422)
+            return request.make_response(
+                stored['body'],
+                headers=stored['headers'] + [('Idempotent-Replayed', 'true')],
+                status=stored['status'],
+            )
+        
+        response = self._book_appointment(**kw)
+        if self._is_booking_success(response):
+            Idempotency._store(scoped_key, response)
+        else:
+            Idempotency._release(scoped_key)
+        return response
+    
+    def _booking_fingerprint(self, kw):
+        """Return a digest of everything a booking request sends.
+        
+        Covers the raw body (JSON bookings), the form fields and the content
+        of every uploaded file, so a retry attaching other files is told
+        apart from a replay.
+        """
+        digest = hashlib.sha256(request.httprequest.get_data())
+        digest.update(json.dumps(sorted(kw.items()), default=str).encode())
+        for field, upload in sorted(request.httprequest.files.items(multi=True), key=lambda item: item[0]):
+            digest.update(json.dumps([field, upload.filename, upload.mimetype]).encode())
+            for chunk in iter(lambda: upload.stream.read(65536), b''):
+                digest.update(chunk)
+            upload.stream.seek(0)
+        return digest.hexdigest()
+    
+    def _is_booking_success(self, response):
+        """Return True if `response` of `_book_appointment` reports a booking."""
+        if response.status_code >= 400:
+            return False
+        if response.headers.get('Content-Type', '').startswith('application/json'):
+            try:
+                return 'error' not in json.loads(response.get_data())
+            except ValueError:
+                return False
+        return True
+    
+    def _book_appointment(self, **kw):
         """Create a new appointment booking.
         
         Args:
@@ -109,158 +473,251 @@ class AppointmentAPIController(http.Controller):
             partner_email (str, optional): Customer email
             partner_phone (str, optional): Customer phone
             notes (str, optional): Appointment notes
+            hold_token (str, optional): Token of the slot hold taken at slot selection
+            async (bool, optional): Process the booking in the background
+                (also requested with a ``Prefer: respond-async`` header)
             
         Returns:
-            dict: Booking result
+            dict: Booking result, or 202 with a status URL for asynchronous bookings
         """
         try:
-            # Parse JSON body if present
-            payload = {}
-            if request.httprequest.headers.get('Content-Type', '').startswith('application/json'):
-                try:
-                    payload = json.loads(request.httprequest.get_data() or b'{}')
-                except Exception:
-                    payload = {}
-
-            service_id = payload.get('service_id') or payload.get('service') or kw.get('service_id') or kw.get('service')
-            start_datetime = payload.get('start') or payload.get('start_datetime') or kw.get('start_datetime') or kw.get('start')
-            partner_id = payload.get('partner_id') or kw.get('partner_id')
-            partner_name = payload.get('customer_name') or payload.get('partner_name') or kw.get('customer_name') or kw.get('partner_name') or kw.get('name')
-            partner_email = payload.get('customer_email') or payload.get('partner_email') or kw.get('customer_email') or kw.get('partner_email') or kw.get('email')
-            partner_phone = payload.get('customer_phone') or payload.get('partner_phone') or kw.get('customer_phone') or kw.get('partner_phone') or kw.get('phone')
-            notes = payload.get('notes') or kw.get('notes')
-
-            # Debug logging: record what was received to help diagnose missing partner fields
+            # Anything the booking wrote (partner, hold, draft, attachments) is
+            # rolled back with the savepoint when it fails or is rejected
+            with request.env.cr.savepoint():
+                return self._create_booking(**kw)
+        except _BookingRejected as e:
+            return e.response
+        except PG_CONCURRENCY_EXCEPTIONS_TO_RETRY:
+            # Let Odoo retry the whole request
+            raise
+        except Exception as e:
+            _logger.error(f"Error booking appointment: {e}")
+            return self._make_error_response(e)
+    
+    def _create_booking(self, **kw):
+        """Book an appointment for `_book_appointment`, inside its savepoint.
+        
+        Raises:
+            _BookingRejected: With the HTTP answer, when the booking is refused
+                after it started writing
+        """
+        # Parse JSON body if present
+        payload = {}
+        if request.httprequest.headers.get('Content-Type', '').startswith('application/json'):
             try:
-                received_body = request.httprequest.get_data().decode('utf-8') if request.httprequest.get_data() else ''
+                payload = json.loads(request.httprequest.get_data() or b'{}')
             except Exception:
-                received_body = '<unreadable>'
-            _logger.info(
-                'Booking request received: headers=%s, form_keys=%s, payload_keys=%s, body=%s',
-                dict(request.httprequest.headers),
-                list(kw.keys()),
-                list(payload.keys()),
-                (received_body[:200] + '...') if len(received_body) > 200 else received_body,
-            )
+                payload = {}
 
-            if not service_id or not start_datetime:
-                err = {'error': 'Missing required parameters: service_id and start_datetime'}
-                return request.make_response(json.dumps(err), headers=[('Content-Type', 'application/json')])
+        service_id = payload.get('service_id') or payload.get('service') or kw.get('service_id') or kw.get('service')
+        start_datetime = payload.get('start') or payload.get('start_datetime') or kw.get('start_datetime') or kw.get('start')
+        partner_id = payload.get('partner_id') or kw.get('partner_id')
+        partner_name = payload.get('customer_name') or payload.get('partner_name') or kw.get('customer_name') or kw.get('partner_name') or kw.get('name')
+        partner_email = payload.get('customer_email') or payload.get('partner_email') or kw.get('customer_email') or kw.get('partner_email') or kw.get('email')
+        partner_phone = payload.get('customer_phone') or payload.get('partner_phone') or kw.get('customer_phone') or kw.get('partner_phone') or kw.get('phone')
+        notes = payload.get('notes') or kw.get('notes')
+        hold_token = payload.get('hold_token') or kw.get('hold_token')
 
-            service = request.env['external.appointment.service'].sudo().browse(int(service_id))
-            if not service.exists() or not service.active:
-                err = {'error': 'Service not found or inactive'}
-                return request.make_response(json.dumps(err), headers=[('Content-Type', 'application/json')])
+        if not service_id or not start_datetime:
+            err = {'error': 'Missing required parameters: service_id and start_datetime'}
+            return request.make_response(json.dumps(err), headers=[('Content-Type', 'application/json')], status=400)
 
-            # Parse start datetime
-            start_dt = datetime.fromisoformat(start_datetime.replace('Z', '+00:00'))
-            end_dt = start_dt + timedelta(minutes=service.duration_minutes)
-            
-            # Get or create partner
-            if partner_id:
-                partner = request.env['res.partner'].sudo().browse(int(partner_id))
-                # Update partner phone if provided
-                if partner_phone and partner.phone != partner_phone:
-                    partner.write({'phone': partner_phone})
-            elif partner_email:
-                # Search for existing partner
-                partner = request.env['res.partner'].sudo().search([
-                    ('email', '=', partner_email)
-                ], limit=1)
-                
-                if not partner:
-                    # Create new partner
-                    partner = request.env['res.partner'].sudo().create({
-                        'name': partner_name or partner_email,
-                        'email': partner_email,
-                        'phone': partner_phone,
-                    })
-                else:
-                    # Update existing partner phone if provided
-                    if partner_phone and partner.phone != partner_phone:
-                        partner.write({'phone': partner_phone})
-            else:
-                # Provide more context in the error to aid debugging (safe: only keys, not full values)
-                err = {
-                    'error': 'Partner information required',
-                    'received': {
-                        'form_keys': list(kw.keys()),
-                        'json_keys': list(payload.keys()),
-                    }
+        service = request.env['external.appointment.service'].sudo().browse(int(service_id))
+        if not service.exists() or not service.active:
+            err = {'error': 'Service not found or inactive'}
+            return request.make_response(json.dumps(err), headers=[('Content-Type', 'application/json')], status=404)
+
+        # Parse start datetime (stored as naive UTC)
+        start_dt = self._parse_datetime_param(start_datetime)
+        end_dt = start_dt + timedelta(minutes=service.duration_minutes)
+        
+        content_type = request.httprequest.headers.get('Content-Type', '')
+        is_api_call = content_type.startswith('application/json')
+        is_async = self._is_async_booking(payload, kw)
+        
+        # Get or create partner
+        if partner_id:
+            partner = request.env['res.partner'].sudo().browse(int(partner_id))
+            # Update partner phone if provided
+            if partner_phone and partner.phone != partner_phone:
+                partner.write({'phone': partner_phone})
+        elif partner_email:
+            # Case-insensitive lookup, created if unknown; the booking keeps its own phone
+            with span('orm resolve_partner'):
+                partner = request.env['res.partner'].sudo()._resolve_booking_partners([{
+                    'name': partner_name,
+                    'email': partner_email,
+                    'phone': partner_phone,
+                }])[0]
+        else:
+            # Provide more context in the error to aid debugging (safe: only keys, not full values)
+            err = {
+                'error': 'Partner information required',
+                'received': {
+                    'form_keys': list(kw.keys()),
+                    'json_keys': list(payload.keys()),
                 }
-                _logger.warning('Partner info missing for booking: %s', err['received'])
-                return request.make_response(json.dumps(err), headers=[('Content-Type', 'application/json')])
-            
-            # Create appointment
-            # Determine created_via and portal user without relying on request.website
-            public_user = request.env.ref('base.public_user', False)
-            public_user_id = public_user.id if public_user else None
-
-            appointment_vals = {
-                'service_id': service.id,
-                'partner_id': partner.id,
-                'start_datetime': start_dt,
-                'end_datetime': end_dt,
-                'notes': notes,
-                'customer_email': partner_email,
-                'customer_phone': partner_phone,
-                'created_via': 'api' if request.env.user.id == public_user_id else 'portal',
-                'status': 'draft',
             }
-            
-            # Set portal user if logged in
-            if request.env.user.id != public_user_id:
-                appointment_vals['portal_user_id'] = request.env.user.id
-            
-            appointment = request.env['external.appointment'].sudo().create(appointment_vals)
-
-            # Process file attachments if any
-            if request.httprequest.files:
-                IrAttachment = request.env['ir.attachment'].sudo()
-                # Get all files from the 'attachments' field (multiple files)
-                files = request.httprequest.files.getlist('attachments')
-                for file_upload in files:
-                    if file_upload and file_upload.filename:
-                        # Read file data
-                        file_data = file_upload.read()
-                        # Create attachment
-                        IrAttachment.create({
-                            'name': file_upload.filename,
-                            'datas': base64.b64encode(file_data),
-                            'res_model': 'external.appointment',
-                            'res_id': appointment.id,
-                            'type': 'binary',
-                        })
-
-            # Confirm appointment
-            appointment.action_confirm()
+            _logger.warning('Partner info missing for booking: %s', err['received'])
+            return request.make_response(json.dumps(err), headers=[('Content-Type', 'application/json')], status=400)
+        
+        # Create appointment
+        # Determine created_via and portal user without relying on request.website
+        public_user = request.env.ref('base.public_user', False)
+        public_user_id = public_user.id if public_user else None
 
-            # Check if this is a form submission (form POST) vs API call (JSON)
-            content_type = request.httprequest.headers.get('Content-Type', '')
-            is_api_call = content_type.startswith('application/json')
-            
-            if is_api_call:
-                # API call - return JSON response
-                response = {
-                    'success': True,
-                    'appointment_id': appointment.id,
-                    'appointment_ref': appointment.name,
-                    'status': appointment.status,
-                    'provider_event_id': appointment.provider_event_id,
-                    'message': _('Appointment booked successfully! Confirmation email sent.'),
-                    'id': appointment.id,
-                    'reference': appointment.name,
-                }
-                return request.make_response(json.dumps(response), headers=[('Content-Type', 'application/json')])
-            else:
-                # Form submission - redirect to appointment detail page
+        appointment_vals = {
+            'service_id': service.id,
+            'partner_id': partner.id,
+            'start_datetime': start_dt,
+            'end_datetime': end_dt,
+            'notes': notes,
+            'customer_email': partner_email,
+            'customer_phone': partner_phone,
+            'created_via': 'api' if request.env.user.id == public_user_id else 'portal',
+            'status': 'draft',
+        }
+        
+        # Set portal user if logged in
+        if request.env.user.id != public_user_id:
+            appointment_vals['portal_user_id'] = request.env.user.id
+        
+        # File attachments from the 'attachments' field (already spooled by werkzeug),
+        # checked before they are copied into the filestore
+        Appointment = request.env['external.appointment'].sudo()
+        uploads = [
+            upload for upload in request.httprequest.files.getlist('attachments')
+            if upload and upload.filename
+        ]
+        upload_limits = Appointment._get_upload_limits()
+        try:
+            upload_limits.check(
+                [(upload.filename, upload.mimetype) for upload in uploads],
+                request.httprequest.content_length,
+            )
+            # A refused claim or a failed create gives the hold back
+            with request.env.cr.savepoint(), span('orm create_appointment', uploads=len(uploads)):
+                self._claim_slot(service, start_dt, end_dt, hold_token)
+                appointment = Appointment.create(appointment_vals)
+                if uploads:
+                    appointment._attach_uploads(uploads, upload_limits)
+        except UploadRejected as e:
+            raise _BookingRejected(request.make_response(json.dumps({'error': str(e)}), headers=[
+                ('Content-Type', 'application/json'),
+            ], status=e.status))
+
+        if is_async:
+            ticket = request.env['external.appointment.booking.ticket'].sudo().create({
+                'appointment_id': appointment.id,
+            })
+            if not is_api_call:
                 return request.redirect('/my/appointments/%s?booking_success=1' % appointment.id)
+            status_url = '/api/appointments/book/status/%s' % ticket.token
+            response = dict(ticket._get_status(), status_url=status_url)
+            return request.make_response(json.dumps(response), headers=[
+                ('Content-Type', 'application/json'),
+                ('Location', status_url),
+                ('Retry-After', '1'),
+            ], status=202)
 
-        except Exception as e:
-            _logger.error(f"Error booking appointment: {e}")
-            return request.make_response(json.dumps({'error': str(e)}), headers=[('Content-Type', 'application/json')])
+        # Confirm appointment (provider sync and confirmation email are child spans)
+        with span('orm confirm_appointment'):
+            appointment.action_confirm()
+
+        # Check if this is a form submission (form POST) vs API call (JSON)
+        if is_api_call:
+            # API call - return JSON response
+            response = {
+                'success': True,
+                'appointment_id': appointment.id,
+                'appointment_ref': appointment.name,
+                'status': appointment.status,
+                'provider_event_id': appointment.provider_event_id,
+                'message': _('Appointment booked successfully! Confirmation email sent.'),
+                'id': appointment.id,
+                'reference': appointment.name,
+            }
+            return request.make_response(json.dumps(response), headers=[('Content-Type', 'application/json')])
+        else:
+            # Form submission - redirect to appointment detail page
+            return request.redirect('/my/appointments/%s?booking_success=1' % appointment.id)
+
+    
+    @http.route('/api/appointments/hold', type='http', auth='public', methods=['POST'], csrf=False)
+    @logged_endpoint('hold')
+    def hold_slot(self, service_id=None, start=None, **kw):
+        """Hold a slot for the duration of the checkout.
+        
+        Args:
+            service_id (int): Service ID
+            start (str): Slot start (ISO format)
+            
+        Returns:
+            dict: ``hold_token`` to send with the booking and ``expires_at``;
+            409 if the slot is no longer available
+        """
+        limited = self._check_rate_limit()
+        if limited:
+            return limited
+        if request.httprequest.headers.get('Content-Type', '').startswith('application/json'):
+            try:
+                payload = json.loads(request.httprequest.get_data() or b'{}')
+            except ValueError:
+                payload = {}
+            service_id = payload.get('service_id', service_id)
+            start = payload.get('start', start)
+        if not service_id or not start:
+            err = {'error': 'Missing required parameters: service_id and start'}
+            return request.make_response(json.dumps(err), headers=[('Content-Type', 'application/json')], status=400)
+        
+        service = request.env['external.appointment.service'].sudo().browse(int(service_id))
+        if not service.exists() or not service.active:
+            err = {'error': 'Service not found or inactive'}
+            return request.make_response(json.dumps(err), headers=[('Content-Type', 'application/json')], status=404)
+        try:
+            hold = request.env['external.appointment.slot.hold'].sudo()._hold_slot(service, self._parse_datetime_param(start))
+        except ValidationError as e:
+            return request.make_response(json.dumps({'error': str(e)}), headers=[
+                ('Content-Type', 'application/json'),
+            ], status=409)
+        result = {
+            'hold_token': hold.token,
+            'start': hold.start_datetime.isoformat(),
+            'end': hold.end_datetime.isoformat(),
+            'expires_at': hold.expires_at.isoformat(),
+        }
+        return request.make_response(json.dumps(result), headers=[('Content-Type', 'application/json')], status=201)
+    
+    @http.route('/api/appointments/hold/<string:token>', type='http', auth='public', methods=['DELETE'], csrf=False)
+    @logged_endpoint('release_hold')
+    def release_hold(self, token, **kw):
+        """Release a slot hold when the customer leaves the checkout."""
+        request.env['external.appointment.slot.hold'].sudo().search([('token', '=', token)]).unlink()
+        return request.make_response('', status=204)
+    
+    @http.route('/api/appointments/book/status/<string:token>', type='http', auth='public', methods=['GET'], csrf=False)
+    @logged_endpoint('booking_status')
+    def get_booking_status(self, token, **kw):
+        """Return the processing status of an asynchronous booking.
+        
+        Args:
+            token (str): Ticket token from the booking response
+            
+        Returns:
+            dict: Ticket state (pending, done or failed) and appointment status
+        """
+        ticket = request.env['external.appointment.booking.ticket'].sudo().search([('token', '=', token)], limit=1)
+        if not ticket:
+            return request.make_response(json.dumps({'error': 'Booking ticket not found'}), headers=[
+                ('Content-Type', 'application/json'),
+            ], status=404)
+        headers = [('Content-Type', 'application/json'), ('Cache-Control', 'no-store')]
+        if ticket.state == 'pending':
+            headers.append(('Retry-After', '1'))
+        return request.make_response(json.dumps(ticket._get_status()), headers=headers)
     
     @http.route('/api/appointments/<int:appointment_id>/cancel', type='jsonrpc', auth='user', methods=['POST'])
+    @logged_endpoint('cancel')
     def cancel_appointment(self, appointment_id, **kw):
         """Cancel an appointment.
         
@@ -295,6 +752,7 @@ class AppointmentAPIController(http.Controller):
             return {'error': str(e)}
     
     @http.route('/api/appointments/<int:appointment_id>/reschedule', type='jsonrpc', auth='user', methods=['POST'])
+    @logged_endpoint('reschedule')
     def reschedule_appointment(self, appointment_id, new_start_datetime, **kw):
         """Reschedule an appointment.
         
@@ -337,36 +795,182 @@ class AppointmentAPIController(http.Controller):
             _logger.error(f"Error rescheduling appointment: {e}")
             return {'error': str(e)}
     
-    @http.route('/api/services', type='jsonrpc', auth='public', methods=['GET'])
+    @http.route('/api/services', type='http', auth='public', methods=['GET'], csrf=False)
+    @logged_endpoint('services')
     def get_services(self, **kw):
         """Get list of active services.
         
+        The catalogue is served from a versioned cache and carries an
+        ``ETag``; a matching ``If-None-Match`` is answered with 304.
+        
         Returns:
             dict: List of services
         """
         try:
-            services = request.env['external.appointment.service'].sudo().search([
-                ('active', '=', True)
-            ], order='sequence, name')
-            
-            service_list = []
-            for service in services:
-                service_list.append({
-                    'id': service.id,
-                    'name': service.name,
-                    'description': service.description,
-                    'duration': service.duration_minutes,
-                    'price': service.price,
-                    'currency': service.currency_id.name,
-                    'allow_cancellation': service.allow_cancellation,
-                    'allow_reschedule': service.allow_reschedule,
-                })
-            
-            return {
-                'success': True,
-                'services': service_list,
-            }
+            catalogue = request.env['external.appointment.service']._get_service_catalogue()
+            return self._make_cached_json_response(
+                catalogue['body'], catalogue['version'], self._catalogue_cache_control
+            )
             
         except Exception as e:
             _logger.error(f"Error getting services: {e}")
-            return {'error': str(e)}
+            return self._make_error_response(e)
+
+    @http.route('/api/appointments/metrics', type='http', auth='public', methods=['GET'], csrf=False)
+    def get_metrics(self, token=None, **kw):
+        """Expose the scheduler metrics of all workers in Prometheus text format.
+        
+        Requires the ``external_appointment_scheduler.metrics_token`` token,
+        sent as ``Authorization: Bearer <token>`` or as the ``token``
+        parameter. The endpoint answers 404 while no token is configured.
+        
+        Returns:
+            Response: Request, provider call and cron latency histograms,
+            cache and single-flight counters
+        """
+        expected = request.env['ir.config_parameter'].sudo().get_param('external_appointment_scheduler.metrics_token')
+        if not expected:
+            return request.make_response('', status=404)
+        auth = request.httprequest.headers.get('Authorization', '')
+        if auth.startswith('Bearer '):
+            token = auth[len('Bearer '):].strip()
+        if not token or not hmac.compare_digest(token.encode(), expected.encode()):
+            return request.make_response('', headers=[('WWW-Authenticate', 'Bearer')], status=401)
+        # Include this worker's latest observations in the scrape
+        metrics.flush(request.env.cr.dbname)
+        return request.make_response(metrics.render(request.env.cr), headers=[
+            ('Content-Type', 'text/plain; version=0.0.4; charset=utf-8'),
+            ('Cache-Control', 'no-store'),
+        ])
+
+    def _make_error_response(self, error):
+        """Return the JSON answer of an endpoint to an exception it caught.
+        
+        Invalid input (``ValueError``, ``UserError``) answers 400 and anything
+        else 500, so request logs and metrics count real failures as errors.
+        """
+        status = 400 if isinstance(error, (ValueError, UserError)) else 500
+        return request.make_response(json.dumps({'error': str(error)}), headers=[
+            ('Content-Type', 'application/json'),
+        ], status=status)
+
+    _catalogue_cache_control = 'public, max-age=60'
+    # Availability must always be revalidated; unchanged windows cost a 304
+    _availability_cache_control = 'public, no-cache'
+
+    def _check_rate_limit(self):
+        """Enforce the API rate limit per client IP and per ``X-API-Key``.
+
+        Uses ``external_appointment_scheduler.api_rate_limit`` requests per
+        minute (0 disables it) with bursts up to one minute of requests.
+
+        Returns:
+            Response: 429 with ``Retry-After`` when the client is over the
+            limit, None otherwise
+        """
+        # Odoo retries requests failing on a concurrency error; the verdict
+        # of the first attempt stands, so a retry never takes another token
+        environ = request.httprequest.environ
+        if self._rate_limit_environ_key not in environ:
+            environ[self._rate_limit_environ_key] = self._consume_rate_limit()
+        retry_after = environ[self._rate_limit_environ_key]
+        if not retry_after:
+            return None
+        return request.make_response(json.dumps({'error': 'Too many requests'}), headers=[
+            ('Content-Type', 'application/json'),
+            ('Retry-After', str(retry_after)),
+        ], status=429)
+
+    _rate_limit_environ_key = 'external_appointment_scheduler.retry_after'
+
+    def _consume_rate_limit(self):
+        """Take a token for the current request.
+
+        Returns:
+            int: Seconds the client must wait before retrying, 0 if allowed
+        """
+        limit = int(request.env['ir.config_parameter'].sudo().get_param(
+            'external_appointment_scheduler.api_rate_limit', 60
+        ) or 0)
+        if limit <= 0:
+            return 0
+        keys = ['ip:%s' % request.httprequest.remote_addr]
+        api_key = request.httprequest.headers.get('X-API-Key')
+        if api_key:
+            keys.append('key:%s' % hashlib.sha256(api_key.encode()).hexdigest()[:32])
+        try:
+            allowed, retry_after = request.env['external.appointment.rate.limit']._consume(keys, limit / 60, limit)
+        except Exception as e:
+            # Never turn a limiter failure into an outage
+            _logger.warning(f"API rate limiter unavailable: {e}")
+            return 0
+        return 0 if allowed else retry_after
+
+    def _claim_slot(self, service, start_dt, end_dt, hold_token=None):
+        """Take the slot for a booking about to be created.
+
+        The booking's own hold is consumed first, so that the capacity check
+        that follows, under the service lock, counts bookings and the holds
+        of other visitors only. Every booking goes through that check: holds
+        reserve capacity, they do not merely hide slots from availability.
+
+        Call it inside the booking's savepoint: a refused claim raises, so the
+        savepoint rolls back and a consumed hold is given back.
+
+        Raises:
+            _BookingRejected: 409 if the hold expired or the slot is taken
+        """
+        try:
+            if hold_token:
+                request.env['external.appointment.slot.hold'].sudo()._consume_hold(hold_token, service, start_dt)
+            service._reserve_slot(start_dt, end_dt)
+        except ValidationError as e:
+            raise _BookingRejected(request.make_response(json.dumps({'error': str(e)}), headers=[
+                ('Content-Type', 'application/json'),
+            ], status=409))
+
+    def _is_async_booking(self, payload, kw):
+        """Return True if the booking should be processed in the background.
+
+        Clients opt in with ``async`` or a ``Prefer: respond-async`` header;
+        ``external_appointment_scheduler.booking_async`` makes it the default.
+        """
+        if 'respond-async' in request.httprequest.headers.get('Prefer', ''):
+            return True
+        requested = payload.get('async', kw.get('async'))
+        if requested is not None:
+            return str(requested).lower() in ('1', 'true', 'yes')
+        return bool(request.env['ir.config_parameter'].sudo().get_param(
+            'external_appointment_scheduler.booking_async', False
+        ))
+
+    def _get_availability_deadline(self, budget_ms=None):
+        """Return the time budget of an availability request.
+
+        The configured budget (``external_appointment_scheduler.availability_budget_ms``,
+        0 for none) is an upper bound; clients may only ask for less.
+        """
+        configured = int(request.env['ir.config_parameter'].sudo().get_param(
+            'external_appointment_scheduler.availability_budget_ms', 5000
+        ))
+        requested = int(budget_ms or 0)
+        if requested > 0 and (not configured or requested < configured):
+            return Deadline.from_ms(requested)
+        return Deadline.from_ms(configured)
+
+    def _make_cached_json_response(self, body, version, cache_control):
+        """Return `body` as JSON with validators, or 304 if the client is current.
+
+        Args:
+            body (str): Serialized JSON payload
+            version (str): Opaque version used as the entity tag
+            cache_control (str): Cache-Control header value
+
+        Returns:
+            Response: 200 with body or 304 without body
+        """
+        etag = '"%s"' % version
+        headers = [('ETag', etag), ('Cache-Control', cache_control)]
+        if request.httprequest.if_none_match.contains(version):
+            return request.make_response('', headers=headers, status=304)
+        return request.make_response(body, headers=headers + [('Content-Type', 'application/json')])
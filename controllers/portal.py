@@ -5,6 +5,7 @@ from odoo.http import request
 from odoo.addons.portal.controllers.portal import CustomerPortal, pager as portal_pager
 from odoo.exceptions import AccessError, MissingError
 from datetime import datetime, timedelta
+from urllib.parse import urlencode
 import logging
 
 _logger = logging.getLogger(__name__)
@@ -32,16 +33,19 @@ class AppointmentPortalController(CustomerPortal):
 
         appointment_count = 0
         if request.env.user.id != website_user_id:
-            appointment_count = request.env['external.appointment'].search_count([
-                ('portal_user_id', '=', request.env.user.id)
-            ])
+            appointment_count = request.env['external.appointment']._get_portal_appointment_count(
+                request.env.user.id
+            )
         values['appointment_count'] = appointment_count
 
-        # Ensure the async portal counters know about our appointment count
+        # Ensure the async portal counters know about our appointment count.
+        # Only assign when the value changes: any assignment marks the session
+        # dirty and costs a session store write.
         try:
-            portal_counters = request.session.get('portal_counters', {}).copy()
-            portal_counters['appointment_count'] = bool(appointment_count)
-            request.session['portal_counters'] = portal_counters
+            portal_counters = request.session.get('portal_counters', {})
+            if portal_counters.get('appointment_count') != bool(appointment_count):
+                portal_counters = dict(portal_counters, appointment_count=bool(appointment_count))
+                request.session['portal_counters'] = portal_counters
         except Exception:
             pass
         
@@ -65,8 +69,9 @@ class AppointmentPortalController(CustomerPortal):
         
         searchbar_filters = {
             'all': {'label': _('All'), 'domain': []},
-            'upcoming': {'label': _('Upcoming'), 'domain': [('start_datetime', '>=', datetime.now()), ('status', 'in', ['confirmed', 'checked_in'])]},
-            'past': {'label': _('Past'), 'domain': [('start_datetime', '<', datetime.now())]},
+            'upcoming': {'label': _('Upcoming'), 'domain': [('is_past', '=', False), ('status', 'in', ['confirmed', 'checked_in'])]},
+            'past': {'label': _('Past'), 'domain': [('is_past', '=', True)]},
+            'cancellable': {'label': _('Cancellable'), 'domain': [('can_cancel', '=', True)]},
             'confirmed': {'label': _('Confirmed'), 'domain': [('status', '=', 'confirmed')]},
             'checked_in': {'label': _('Checked In'), 'domain': [('status', '=', 'checked_in')]},
             'completed': {'label': _('Completed'), 'domain': [('status', '=', 'completed')]},
@@ -82,20 +87,50 @@ class AppointmentPortalController(CustomerPortal):
         order = searchbar_sortings[sortby]['order']
         domain += searchbar_filters[filterby]['domain']
         
-        # Count for pager
-        appointment_count = AppointmentObj.search_count(domain)
-        
-        # Pager
-        pager = portal_pager(
-            url="/my/appointments",
-            url_args={'date_begin': date_begin, 'date_end': date_end, 'sortby': sortby, 'filterby': filterby},
-            total=appointment_count,
-            page=page,
-            step=self._items_per_page
-        )
+        # Keyset (cursor) pagination on (start_datetime, id) for the date sort:
+        # deep pages cost the same as the first one and no count is needed.
+        # ``pagination=offset`` (and the numbered /page/<n> URLs) keep the pager.
+        next_cursor = next_url = False
+        use_keyset = sortby == 'date' and page == 1 and kw.get('pagination') != 'offset'
+        if use_keyset:
+            pager = False
+            page_domain = list(domain)
+            cursor = self._parse_appointment_cursor(kw.get('cursor'))
+            if cursor:
+                cursor_dt, cursor_id = cursor
+                page_domain += [
+                    '|', ('start_datetime', '<', cursor_dt),
+                    '&', ('start_datetime', '=', cursor_dt), ('id', '<', cursor_id),
+                ]
+            appointments = AppointmentObj.search(
+                page_domain, order='start_datetime desc, id desc', limit=self._items_per_page + 1
+            )
+            if len(appointments) > self._items_per_page:
+                appointments = appointments[:self._items_per_page]
+                next_cursor = self._format_appointment_cursor(appointments[-1])
+                next_url = '/my/appointments?%s' % urlencode({
+                    key: value for key, value in (
+                        ('date_begin', date_begin), ('date_end', date_end),
+                        ('sortby', sortby), ('filterby', filterby), ('cursor', next_cursor),
+                    ) if value
+                })
+        else:
+            # Count for pager
+            appointment_count = AppointmentObj.search_count(domain)
+            
+            # Pager
+            pager = portal_pager(
+                url="/my/appointments",
+                url_args={'date_begin': date_begin, 'date_end': date_end, 'sortby': sortby, 'filterby': filterby},
+                total=appointment_count,
+                page=page,
+                step=self._items_per_page
+            )
+            
+            # Get appointments
+            appointments = AppointmentObj.search(domain, order=order, limit=self._items_per_page, offset=pager['offset'])
         
-        # Get appointments
-        appointments = AppointmentObj.search(domain, order=order, limit=self._items_per_page, offset=pager['offset'])
+        appointments._prefetch_portal_values()
         request.session['my_appointments_history'] = appointments.ids[:100]
         
         values.update({
@@ -107,10 +142,31 @@ class AppointmentPortalController(CustomerPortal):
             'searchbar_filters': searchbar_filters,
             'sortby': sortby,
             'filterby': filterby,
+            'keyset_pagination': bool(use_keyset),
+            'next_cursor': next_cursor,
+            'next_url': next_url,
         })
         
         return request.render("external_appointment_scheduler.portal_my_appointments", values)
     
+    def _format_appointment_cursor(self, appointment):
+        """Encode the keyset position of ``appointment`` as an URL-safe token."""
+        return '%s_%s' % (appointment.start_datetime.strftime('%Y%m%d%H%M%S'), appointment.id)
+    
+    def _parse_appointment_cursor(self, cursor):
+        """Decode a cursor produced by `_format_appointment_cursor`.
+        
+        Returns:
+            tuple: (start_datetime, id) or None for a missing/invalid cursor
+        """
+        if not cursor:
+            return None
+        try:
+            dt_part, id_part = cursor.split('_', 1)
+            return datetime.strptime(dt_part, '%Y%m%d%H%M%S'), int(id_part)
+        except (ValueError, TypeError):
+            return None
+    
     @http.route(['/my/appointments/<int:appointment_id>'], type='http', auth="user", website=True)
     def portal_my_appointment(self, appointment_id, access_token=None, **kw):
         """Display appointment details."""
@@ -138,8 +194,8 @@ class AppointmentPortalController(CustomerPortal):
         else:
             service = False
         
-        # Get all active services
-        services = ServiceObj.search([('active', '=', True)], order='sequence, name')
+        # Get all active services (ids come from the cached catalogue)
+        services = ServiceObj.browse(ServiceObj._get_service_catalogue()['service_ids'])
         
         values = {
             'service': service,
@@ -2,6 +2,7 @@
 
 from odoo import http
 from odoo.http import request
+from odoo.addons.external_appointment_scheduler.tools.request_log import logged_endpoint
 import logging
 import json
 
@@ -12,6 +13,7 @@ class CalendarWebhookController(http.Controller):
     """Webhook controller for calendar provider notifications."""
     
     @http.route('/webhook/calendar/google/<int:config_id>', type='http', auth='public', methods=['POST'], csrf=False)
+    @logged_endpoint('webhook_google')
     def google_calendar_webhook(self, config_id=None, **kw):
         """Handle Google Calendar webhook notifications.
         
@@ -26,7 +28,7 @@ class CalendarWebhookController(http.Controller):
             resource_uri = headers.get('X-Goog-Resource-URI')
             token = headers.get('X-Goog-Channel-Token')
             
-            _logger.info(f"Google webhook received: channel={channel_id}, state={resource_state}")
+            _logger.debug("Google webhook received: channel=%s, state=%s", channel_id, resource_state)
             
             # Prefer to locate config by provided URL parameter (config_id)
             config = None
@@ -38,19 +40,19 @@ class CalendarWebhookController(http.Controller):
                 ], limit=1)
             
             if not config or not config.exists():
-                _logger.warning(f"No configuration found for channel {channel_id} or id {config_id}")
+                _logger.warning("No configuration found for channel %s or id %s", channel_id, config_id)
                 return "OK"
             
             # Validate token
             if token != config.webhook_secret:
-                _logger.warning(f"Invalid webhook token for channel {channel_id}")
+                _logger.warning("Invalid webhook token for channel %s", channel_id)
                 return ("Unauthorized", 401)
             
             if resource_state == 'sync':
-                _logger.info("Google Calendar sync message received")
+                _logger.debug("Google Calendar sync message received")
                 
             elif resource_state == 'exists':
-                _logger.info("Google Calendar has changes, triggering sync")
+                _logger.debug("Google Calendar has changes, triggering sync")
                 request.env['external.appointment'].sudo()._process_google_webhook(config, resource_id)
             
             return "OK"
@@ -60,6 +62,7 @@ class CalendarWebhookController(http.Controller):
             return "Error", 500
     
     @http.route('/webhook/calendar/calendly/<int:config_id>', type='http', auth='public', methods=['POST'], csrf=False)
+    @logged_endpoint('webhook_calendly')
     def calendly_webhook(self, config_id=None, **kw):
         """Handle Calendly webhook notifications.
         
@@ -71,7 +74,7 @@ class CalendarWebhookController(http.Controller):
             signature = request.httprequest.headers.get('Calendly-Webhook-Signature')
             data = json.loads(payload)
             
-            _logger.info(f"Calendly webhook received: {data.get('event')}")
+            _logger.debug("Calendly webhook received: %s", data.get('event'))
             
             # Find configuration by id if provided, otherwise find an active Calendly config
             config = None
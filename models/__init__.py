@@ -2,7 +2,16 @@
 
 from . import external_appointment
 from . import external_appointment_service
+from . import external_appointment_slot_snapshot
+from . import external_appointment_slot_hold
+from . import external_appointment_slot_flight
+from . import external_appointment_rate_limit
+from . import external_appointment_booking_ticket
+from . import external_appointment_idempotency
+from . import external_appointment_metrics
 from . import external_calendar_config
 from . import external_calendar_token
 from . import res_config_settings
+from . import mail_template
+from . import res_partner
 from . import res_users_patch
@@ -2,11 +2,27 @@
 
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError, UserError
+from odoo.tools import SQL
+from odoo.tools.sql import create_index
+from odoo.addons.external_appointment_scheduler.tools.cache import get_cache, invalidate
+from odoo.addons.external_appointment_scheduler.tools.uploads import UploadLimits, copy_stream
+from odoo.addons.external_appointment_scheduler.tools.metrics import instrumented_cron
 from datetime import timedelta
+import io
 import logging
+import mimetypes
+import os
+import tempfile
 
 _logger = logging.getLogger(__name__)
 
+# Per-user appointment counts for the portal home page. Entries are dropped
+# when the user's appointments are created, deleted or reassigned.
+_portal_counter_cache = get_cache('portal_appointment_count', ttl=60)
+
+# Attachment types accepted with bookings unless configured otherwise
+DEFAULT_UPLOAD_TYPES = 'pdf,png,jpg,jpeg,gif,webp,txt,doc,docx,odt'
+
 
 class ExternalAppointment(models.Model):
     _name = 'external.appointment'
@@ -165,18 +181,21 @@ class ExternalAppointment(models.Model):
     is_past = fields.Boolean(
         string='Is Past',
         compute='_compute_is_past',
+        search='_search_is_past',
         store=False
     )
     
     can_cancel = fields.Boolean(
         string='Can Cancel',
         compute='_compute_can_cancel',
+        search='_search_can_cancel',
         store=False
     )
     
     can_reschedule = fields.Boolean(
         string='Can Reschedule',
         compute='_compute_can_reschedule',
+        search='_search_can_reschedule',
         store=False
     )
     
@@ -195,6 +214,30 @@ class ExternalAppointment(models.Model):
     )
     
     # SQL Constraints are handled via Python constraints in Odoo 19
+
+    def init(self):
+        """Create the indexes backing portal pagination and availability versions."""
+        super().init()
+        create_index(
+            self.env.cr,
+            'external_appointment_portal_user_start_id_index',
+            self._table,
+            ['portal_user_id', 'start_datetime DESC', 'id DESC'],
+        )
+        # Latest booking change per service, used for availability versions
+        create_index(
+            self.env.cr,
+            'external_appointment_service_write_date_index',
+            self._table,
+            ['service_id', 'write_date'],
+        )
+        # Bookings of a service over a window, used to block full slots
+        create_index(
+            self.env.cr,
+            'external_appointment_service_start_index',
+            self._table,
+            ['service_id', 'start_datetime'],
+        )
     
     @api.model_create_multi
     def create(self, vals_list):
@@ -222,6 +265,9 @@ class ExternalAppointment(models.Model):
             processed.append(vals)
 
         appointments = super(ExternalAppointment, self).create(processed)
+        self._invalidate_portal_counters(appointments.portal_user_id.ids)
+        appointments.service_id._invalidate_availability_cache()
+        appointments._queue_snapshot_refresh()
 
         # Sync with provider if status is confirmed
         for appointment in appointments:
@@ -240,8 +286,21 @@ class ExternalAppointment(models.Model):
         sync_fields = {'start_datetime', 'end_datetime', 'service_id', 'partner_id', 'notes', 'status'}
         needs_sync = bool(set(vals.keys()) & sync_fields)
         
+        if 'portal_user_id' in vals:
+            self._invalidate_portal_counters(self.portal_user_id.ids + [vals['portal_user_id']])
+        
+        # Slots freed at the old position, taken at the new one
+        refresh_snapshot = bool(set(vals) & {'start_datetime', 'end_datetime', 'service_id', 'status'})
+        if refresh_snapshot:
+            self.service_id._invalidate_availability_cache()
+            self._queue_snapshot_refresh()
+        
         result = super(ExternalAppointment, self).write(vals)
         
+        if refresh_snapshot:
+            self.service_id._invalidate_availability_cache()
+            self._queue_snapshot_refresh()
+        
         # Send email notifications for status or datetime changes
         for appointment in self:
             # Status changed to cancelled - send cancellation email
@@ -299,7 +358,34 @@ class ExternalAppointment(models.Model):
                 except Exception as e:
                     _logger.warning(f"Failed to cancel provider event before deletion: {e}")
         
-        return super(ExternalAppointment, self).unlink()
+        self._invalidate_portal_counters(self.portal_user_id.ids)
+        self.service_id._invalidate_availability_cache()
+        self._queue_snapshot_refresh()
+        # Deleting an active booking frees its slot: bump the service write
+        # date so availability versions (and ETags) change.
+        services = self.filtered(lambda a: a.status != 'cancelled').service_id
+        result = super(ExternalAppointment, self).unlink()
+        if services:
+            self.env.cr.execute(
+                "UPDATE external_appointment_service SET write_date = (now() at time zone 'UTC') WHERE id IN %s",
+                [tuple(services.ids)],
+            )
+            services.invalidate_recordset(['write_date'])
+        return result
+    
+    def _queue_snapshot_refresh(self):
+        """Queue the availability snapshot days these appointments occupy for refresh."""
+        service_days = set()
+        for appointment in self:
+            if not appointment.service_id.use_availability_snapshot or not appointment.start_datetime:
+                continue
+            day = appointment.start_datetime.date()
+            last_day = (appointment.end_datetime or appointment.start_datetime).date()
+            while day <= last_day:
+                service_days.add((appointment.service_id.id, day))
+                day += timedelta(days=1)
+        if service_days:
+            self.env['external.appointment.service']._queue_snapshot_refresh(service_days)
     
     @api.depends('start_datetime', 'end_datetime')
     def _compute_duration(self):
@@ -360,6 +446,57 @@ class ExternalAppointment(models.Model):
             else:
                 appointment.can_reschedule = False
     
+    @api.model
+    def _is_positive_flag_search(self, operator, value):
+        """Normalize a boolean field search to "records where the flag is set?".
+
+        Returns:
+            bool: True when the domain selects records with the flag set
+        """
+        if operator in ('in', 'not in'):
+            values = {bool(v) for v in value}
+            if len(values) != 1:
+                raise UserError(_('Unsupported search on a computed flag: %s %s') % (operator, value))
+            operator = '=' if operator == 'in' else '!='
+            value = values.pop()
+        if operator not in ('=', '!='):
+            raise UserError(_('Unsupported search on a computed flag: %s %s') % (operator, value))
+        return (operator == '=') == bool(value)
+
+    def _search_is_past(self, operator, value):
+        """Search appointments starting before now."""
+        now = fields.Datetime.now()
+        if self._is_positive_flag_search(operator, value):
+            return [('start_datetime', '<', now)]
+        return [('start_datetime', '>=', now)]
+
+    def _search_can_cancel(self, operator, value):
+        """Search cancellable appointments in SQL, mirroring `_compute_can_cancel`."""
+        query = SQL(
+            """(SELECT a.id
+                 FROM external_appointment a
+                 JOIN external_appointment_service s ON s.id = a.service_id
+                WHERE a.status NOT IN ('cancelled', 'completed', 'no_show', 'checked_in')
+                  AND a.start_datetime >= %s + make_interval(hours => COALESCE(s.cancellation_hours, 0)))""",
+            fields.Datetime.now(),
+        )
+        positive = self._is_positive_flag_search(operator, value)
+        return [('id', 'in' if positive else 'not in', query)]
+
+    def _search_can_reschedule(self, operator, value):
+        """Search reschedulable appointments in SQL, mirroring `_compute_can_reschedule`."""
+        query = SQL(
+            """(SELECT a.id
+                 FROM external_appointment a
+                 JOIN external_appointment_service s ON s.id = a.service_id
+                WHERE a.status NOT IN ('cancelled', 'completed', 'no_show')
+                  AND s.allow_reschedule
+                  AND a.start_datetime >= %s + make_interval(hours => COALESCE(s.cancellation_hours, 0)))""",
+            fields.Datetime.now(),
+        )
+        positive = self._is_positive_flag_search(operator, value)
+        return [('id', 'in' if positive else 'not in', query)]
+    
     @api.constrains('start_datetime', 'end_datetime')
     def _check_dates(self):
         """Validate appointment dates."""
@@ -464,6 +601,33 @@ class ExternalAppointment(models.Model):
             }
         }
     
+    @api.model
+    def _get_portal_appointment_count(self, user_id):
+        """Return the number of appointments owned by a portal user, cached per user."""
+        key = (self.env.cr.dbname, user_id)
+        count = _portal_counter_cache.get(key)
+        if count is None:
+            count = self.sudo().search_count([('portal_user_id', '=', user_id)])
+            _portal_counter_cache.set(key, count)
+        return count
+
+    @api.model
+    def _invalidate_portal_counters(self, user_ids):
+        """Drop cached portal counters of the given users in every worker."""
+        for user_id in set(user_ids):
+            if user_id:
+                invalidate(self.env.cr, 'portal_appointment_count', user_id)
+
+    def _prefetch_portal_values(self):
+        """Load everything a portal list row renders in a fixed number of queries.
+
+        Rows show the reference, date, status and service name; fetching the
+        services of the whole page at once avoids one query per row.
+        """
+        self.fetch(['name', 'start_datetime', 'status', 'service_id'])
+        self.service_id.fetch(['name'])
+        return self
+
     def _sync_to_provider(self, operation):
         """Sync appointment to external provider.
         
@@ -472,8 +636,9 @@ class ExternalAppointment(models.Model):
         """
         self.ensure_one()
         
-        # Get the appropriate adapter
-        adapter = self._get_provider_adapter()
+        # Get the appropriate adapter; bookings get quota before background sync
+        priority = self.env.context.get('calendar_priority', 'booking')
+        adapter = self.with_context(calendar_priority=priority)._get_provider_adapter()
         if not adapter:
             _logger.warning(f"No adapter available for provider: {self.provider}")
             return
@@ -531,12 +696,89 @@ class ExternalAppointment(models.Model):
             'location': '',
         }
     
+    @api.model
+    def _get_upload_limits(self):
+        """Return the attachment limits configured for bookings."""
+        get_param = self.env['ir.config_parameter'].sudo().get_param
+        return UploadLimits(
+            max_size=int(get_param('external_appointment_scheduler.upload_max_mb', 10)) * 1024 * 1024,
+            max_count=int(get_param('external_appointment_scheduler.upload_max_files', 5)),
+            allowed_types=get_param('external_appointment_scheduler.upload_allowed_types', DEFAULT_UPLOAD_TYPES).split(','),
+        )
+
+    def _attach_uploads(self, uploads, limits=None):
+        """Attach uploaded files to this appointment without loading them in memory.
+
+        With file storage, each upload is streamed into a temporary file of
+        the filestore while its checksum is computed, then moved to its
+        content-addressed location; the attachment only references it.
+
+        Args:
+            uploads (list): werkzeug FileStorage objects
+            limits (UploadLimits, optional): Limits to enforce, default the
+                configured ones
+
+        Returns:
+            recordset: Created ir.attachment records
+
+        Raises:
+            UploadRejected: If a file exceeds the limits
+        """
+        self.ensure_one()
+        limits = limits or self._get_upload_limits()
+        IrAttachment = self.env['ir.attachment'].sudo()
+        vals_list = []
+        for upload in uploads:
+            vals = {
+                'name': upload.filename,
+                'res_model': self._name,
+                'res_id': self.id,
+                'type': 'binary',
+                'mimetype': mimetypes.guess_type(upload.filename)[0] or 'application/octet-stream',
+            }
+            if IrAttachment._storage() != 'file':
+                buffer = io.BytesIO()
+                copy_stream(upload.stream, buffer, limits.max_size)
+                vals['raw'] = buffer.getvalue()
+            else:
+                vals.update(self._stream_to_filestore(upload.stream, limits.max_size))
+            vals_list.append(vals)
+        return IrAttachment.create(vals_list)
+
+    @api.model
+    def _stream_to_filestore(self, stream, max_size):
+        """Store `stream` in the filestore and return the attachment storage values."""
+        IrAttachment = self.env['ir.attachment'].sudo()
+        filestore = IrAttachment._filestore()
+        os.makedirs(filestore, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=filestore, prefix='upload-', delete=False) as target:
+            try:
+                checksum, size = copy_stream(stream, target, max_size)
+            except Exception:
+                target.close()
+                os.unlink(target.name)
+                raise
+        fname = f'{checksum[:2]}/{checksum}'
+        full_path = IrAttachment._full_path(fname)
+        if os.path.exists(full_path):
+            os.unlink(target.name)
+        else:
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            os.replace(target.name, full_path)
+        # Removed by the filestore garbage collector if the transaction rolls back
+        IrAttachment._mark_for_gc(fname)
+        return {'store_fname': fname, 'checksum': checksum, 'file_size': size}
+
     def _send_confirmation_email(self):
-        """Send confirmation email to customer."""
+        """Send confirmation email to customer.
+
+        The ``appointment_mail_force_send`` context key set to False queues
+        the email instead, so it is only sent if the transaction commits.
+        """
         self.ensure_one()
         template = self.env.ref('external_appointment_scheduler.mail_template_appointment_confirmation', False)
         if template:
-            template.send_mail(self.id, force_send=True)
+            template.send_mail(self.id, force_send=self.env.context.get('appointment_mail_force_send', True))
     
     def _send_cancellation_email(self):
         """Send cancellation email to customer."""
@@ -559,6 +801,7 @@ class ExternalAppointment(models.Model):
                 _logger.exception('Failed to mark reminder_sent for appointment %s', self.id)
     
     @api.model
+    @instrumented_cron
     def _cron_send_reminders(self):
         """Cron job to send appointment reminders."""
         # Send reminders based on configured reminder hours (add small buffer)
@@ -581,6 +824,7 @@ class ExternalAppointment(models.Model):
                 _logger.error(f"Failed to send reminder for appointment {appointment.id}: {e}")
     
     @api.model
+    @instrumented_cron
     def _cron_cleanup_old_appointments(self):
         """Cron job to archive old completed/cancelled appointments."""
         # Archive appointments older than 1 year
@@ -641,6 +885,14 @@ class ExternalAppointment(models.Model):
                 'sync_status': 'success',
             })
 
+            # Busy times changed somewhere in the calendar: rebuild in the
+            # snapshot cron; the diff-based refresh only rewrites the days
+            # that actually changed.
+            self.env['external.appointment.service'].sudo().search([
+                ('provider_id', '=', config.id),
+                ('use_availability_snapshot', '=', True),
+            ])._queue_full_snapshot_refresh()
+
         except Exception as e:
             _logger.error(f"Webhook processing failed: {e}")
             if config:
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api
+from odoo.tools.sql import create_index
+from odoo.addons.external_appointment_scheduler.tools.metrics import instrumented_cron
+from datetime import timedelta
+import logging
+import secrets
+
+_logger = logging.getLogger(__name__)
+
+
+class ExternalAppointmentBookingTicket(models.Model):
+    """Booking accepted by the API but not yet fully processed.
+
+    Asynchronous bookings only reserve their slot (a draft appointment)
+    inside the request; the ticket records the remaining work: confirming
+    the appointment, creating the provider event and sending the
+    confirmation email. Tickets are processed by a cron triggered when
+    they are created, and clients poll the ticket status URL.
+    """
+    _name = 'external.appointment.booking.ticket'
+    _description = 'Appointment Booking Ticket'
+    _order = 'id'
+
+    MAX_ATTEMPTS = 3
+
+    token = fields.Char(
+        string='Token',
+        required=True,
+        readonly=True,
+        copy=False,
+        default=lambda self: secrets.token_urlsafe(24)
+    )
+
+    appointment_id = fields.Many2one(
+        'external.appointment',
+        string='Appointment',
+        required=True,
+        ondelete='cascade'
+    )
+
+    state = fields.Selection([
+        ('pending', 'Pending'),
+        ('done', 'Done'),
+        ('failed', 'Failed')
+    ], string='State', default='pending', required=True)
+
+    attempts = fields.Integer(
+        string='Attempts',
+        default=0
+    )
+
+    error = fields.Text(
+        string='Error'
+    )
+
+    def init(self):
+        """Create the indexes for status lookups and the processing queue."""
+        super().init()
+        create_index(
+            self.env.cr,
+            'external_appointment_booking_ticket_token_index',
+            self._table,
+            ['token'],
+            unique=True,
+        )
+        create_index(
+            self.env.cr,
+            'external_appointment_booking_ticket_pending_index',
+            self._table,
+            ['id'],
+            where="state = 'pending'",
+        )
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        """Override create to wake the processing cron once the request commits."""
+        tickets = super().create(vals_list)
+        cron = self.env.ref('external_appointment_scheduler.cron_process_booking_tickets', raise_if_not_found=False)
+        if cron:
+            cron._trigger()
+        return tickets
+
+    def _get_status(self):
+        """Return the ticket status as exposed by the API.
+
+        Returns:
+            dict: Ticket state with the appointment reference and status
+        """
+        self.ensure_one()
+        appointment = self.appointment_id
+        return {
+            'ticket': self.token,
+            'state': self.state,
+            'appointment_id': appointment.id,
+            'appointment_ref': appointment.name,
+            'status': appointment.status,
+            'provider_event_id': appointment.provider_event_id or None,
+            'error': self.error or None,
+        }
+
+    def _process(self):
+        """Sync the appointment to the provider, confirm it and notify the customer.
+
+        The provider event comes first, so the confirmation email goes out
+        for an appointment that is in the calendar. The email is queued: it
+        commits with the ticket, and a failed attempt never sends it.
+        """
+        self.ensure_one()
+        appointment = self.appointment_id.with_context(calendar_priority='booking', appointment_mail_force_send=False)
+        if appointment.status in ('draft', 'confirmed') and not appointment.provider_event_id \
+                and (appointment.calendar_config_id or appointment.provider):
+            appointment._sync_to_provider('create')
+        if appointment.status == 'draft':
+            appointment.action_confirm()
+        self.write({'state': 'done', 'error': False})
+
+    def _fail(self):
+        """Cancel the draft appointment of a ticket that gave up, freeing its slot."""
+        self.ensure_one()
+        draft = self.appointment_id.filtered(lambda appointment: appointment.status == 'draft')
+        if draft:
+            draft.write({'status': 'cancelled'})
+
+    @api.model
+    @instrumented_cron
+    def _cron_process_booking_tickets(self, batch_size=50):
+        """Process pending tickets in arrival order.
+
+        Each ticket runs in its own savepoint: a failing ticket is retried on
+        the next run and marked failed after `MAX_ATTEMPTS`, without holding
+        back the others. A failed ticket cancels its draft appointment, which
+        would otherwise hold the slot forever.
+        """
+        tickets = self.search([('state', '=', 'pending')], limit=batch_size)
+        for ticket in tickets:
+            try:
+                with self.env.cr.savepoint():
+                    ticket._process()
+            except Exception as e:
+                _logger.error(f"Failed to process booking ticket {ticket.id}: {e}")
+                failed = ticket.attempts + 1 >= self.MAX_ATTEMPTS
+                ticket.write({
+                    'attempts': ticket.attempts + 1,
+                    'state': 'failed' if failed else 'pending',
+                    'error': str(e),
+                })
+                if failed:
+                    try:
+                        with self.env.cr.savepoint():
+                            ticket._fail()
+                    except Exception as cancel_error:
+                        _logger.error(f"Failed to cancel the draft of booking ticket {ticket.id}: {cancel_error}")
+        if len(tickets) == batch_size:
+            self.env.ref('external_appointment_scheduler.cron_process_booking_tickets')._trigger()
+
+    @api.autovacuum
+    def _gc_booking_tickets(self, days=7):
+        """Delete processed tickets once clients have had time to poll them."""
+        self.search([
+            ('state', '!=', 'pending'),
+            ('create_date', '<', fields.Datetime.now() - timedelta(days=days)),
+        ]).unlink()
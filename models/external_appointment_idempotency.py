@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, api
+from odoo.addons.external_appointment_scheduler.tools.metrics import instrumented_cron
+import json
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+class ExternalAppointmentIdempotency(models.AbstractModel):
+    """Stored responses of booking requests sent with an ``Idempotency-Key``.
+
+    Claims, responses and releases all go through the request cursor, in
+    the booking's own transaction: the claim row commits or rolls back
+    together with the booking. Concurrent requests with the same key are
+    therefore serialized on the row lock of the uncommitted insert, and a
+    duplicate waits until the first booking has finished. Under Odoo's
+    repeatable read isolation its insert then fails with a serialization
+    error, and the retried request finds the stored response and replays
+    it instead of booking again. If the booking fails, the row is removed
+    with it and the next attempt runs normally. Keys expire after a TTL.
+    """
+    _name = 'external.appointment.idempotency'
+    _description = 'Appointment API Idempotency Keys'
+
+    _table_name = 'external_appointment_api_idempotency'
+
+    # Response headers replayed with the stored body
+    REPLAYED_HEADERS = ('Content-Type', 'Location')
+
+    def init(self):
+        """Create the key table and the index used to expire keys."""
+        super().init()
+        self.env.cr.execute(f"""
+            CREATE TABLE IF NOT EXISTS {self._table_name} (
+                key varchar PRIMARY KEY,
+                fingerprint varchar NOT NULL,
+                status integer,
+                headers text,
+                body text,
+                created_at timestamp NOT NULL
+            )
+        """)
+        self.env.cr.execute(f"""
+            CREATE INDEX IF NOT EXISTS {self._table_name}_created_at_index
+                ON {self._table_name} (created_at)
+        """)
+
+    @api.model
+    def _claim(self, key, fingerprint, ttl_hours):
+        """Claim `key` in the request transaction, or return its stored response.
+
+        Blocks until another transaction holding an uncommitted claim on the
+        key commits or rolls back (the request is then retried by Odoo if
+        that transaction committed). An expired key is claimed again.
+
+        Args:
+            key (str): Client-scoped idempotency key
+            fingerprint (str): Hash of the request payload
+            ttl_hours (int): Lifetime of stored responses
+
+        Returns:
+            dict: None if the key was claimed, otherwise the stored
+            ``fingerprint``, ``status``, ``headers`` and ``body``
+        """
+        self.env.cr.execute(f"""
+            INSERT INTO {self._table_name} AS i (key, fingerprint, created_at)
+            VALUES (%(key)s, %(fingerprint)s, now() at time zone 'UTC')
+            ON CONFLICT (key) DO UPDATE SET
+                fingerprint = EXCLUDED.fingerprint,
+                status = NULL,
+                headers = NULL,
+                body = NULL,
+                created_at = EXCLUDED.created_at
+             WHERE i.created_at < (now() at time zone 'UTC') - make_interval(hours => %(ttl)s)
+            RETURNING key
+        """, {'key': key, 'fingerprint': fingerprint, 'ttl': ttl_hours})
+        if self.env.cr.fetchone():
+            return None
+        self.env.cr.execute(
+            f"SELECT fingerprint, status, headers, body FROM {self._table_name} WHERE key = %s",
+            [key],
+        )
+        fingerprint, status, headers, body = self.env.cr.fetchone()
+        return {
+            'fingerprint': fingerprint,
+            'status': status,
+            'headers': json.loads(headers or '[]'),
+            'body': body,
+        }
+
+    @api.model
+    def _store(self, key, response):
+        """Save the response of the request holding the claim on `key`."""
+        headers = [
+            (name, response.headers[name]) for name in self.REPLAYED_HEADERS if name in response.headers
+        ]
+        self.env.cr.execute(
+            f"UPDATE {self._table_name} SET status = %s, headers = %s, body = %s WHERE key = %s",
+            [response.status_code, json.dumps(headers), response.get_data(as_text=True), key],
+        )
+
+    @api.model
+    def _release(self, key):
+        """Drop the claim on `key` so that a retry of a failed request runs again."""
+        self.env.cr.execute(f"DELETE FROM {self._table_name} WHERE key = %s", [key])
+
+    @api.model
+    @instrumented_cron
+    def _cron_purge_idempotency_keys(self):
+        """Delete expired keys through the creation date index."""
+        ttl_hours = int(self.env['ir.config_parameter'].sudo().get_param(
+            'external_appointment_scheduler.idempotency_ttl_hours', 24
+        ))
+        self.env.cr.execute(
+            f"DELETE FROM {self._table_name} WHERE created_at < (now() at time zone 'UTC') - make_interval(hours => %s)",
+            [ttl_hours],
+        )
+        _logger.info(f"Purged {self.env.cr.rowcount} expired API idempotency keys")
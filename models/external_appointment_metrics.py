@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models
+from odoo.addons.external_appointment_scheduler.tools import metrics
+
+
+class ExternalAppointmentMetrics(models.AbstractModel):
+    """Totals of the scheduler metrics, shared by all workers.
+
+    Workers add their in-memory deltas to the table periodically (see
+    ``tools/metrics.py``). The table is UNLOGGED: it is not written to the
+    WAL, so flushes stay cheap, and it is emptied by a crash, which
+    Prometheus handles as a counter reset.
+    """
+    _name = 'external.appointment.metrics'
+    _description = 'Appointment Metrics'
+
+    def init(self):
+        """Create the metrics table."""
+        super().init()
+        self.env.cr.execute(f"""
+            CREATE UNLOGGED TABLE IF NOT EXISTS {metrics.TABLE} (
+                series varchar PRIMARY KEY,
+                name varchar NOT NULL,
+                kind varchar NOT NULL,
+                value double precision NOT NULL
+            )
+        """)
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, api
+from odoo.addons.external_appointment_scheduler.tools.metrics import instrumented_cron
+from contextlib import contextmanager
+import logging
+import math
+import time
+
+_logger = logging.getLogger(__name__)
+
+
+class ExternalAppointmentRateLimit(models.AbstractModel):
+    """Token-bucket rate limiter for the public appointment API.
+
+    Buckets live in an UNLOGGED table shared by every worker and node: one
+    row per client key (IP address or API key). A request refills and takes
+    a token from all its buckets in one short transaction on its own
+    cursor, so concurrent requests of one client never wait for each
+    other's transactions and nothing is written to the WAL.
+
+    The same table holds the provider quota buckets (``quota:*`` keys) used
+    by `tools.rate_limit.SharedTokenBucket`, so the quota of a calendar
+    account is shared by all workers instead of split between them.
+    """
+    _name = 'external.appointment.rate.limit'
+    _description = 'Appointment API Rate Limiter'
+
+    _table_name = 'external_appointment_api_rate_limit'
+
+    def init(self):
+        """Create the UNLOGGED bucket table."""
+        super().init()
+        self.env.cr.execute(f"""
+            CREATE UNLOGGED TABLE IF NOT EXISTS {self._table_name} (
+                key varchar PRIMARY KEY,
+                tokens double precision NOT NULL,
+                granted boolean NOT NULL,
+                updated_at timestamp NOT NULL
+            )
+        """)
+
+    @contextmanager
+    def _bucket_cursor(self):
+        """Return a cursor of its own for bucket updates, committed on exit.
+
+        Buckets are read-modify-write rows: at read committed isolation a
+        request waiting for another one's row lock continues from the row
+        it committed instead of failing with a serialization error, as it
+        would under Odoo's default repeatable read.
+        """
+        with self.env.registry.cursor() as cr:
+            cr.execute("SET TRANSACTION ISOLATION LEVEL READ COMMITTED")
+            yield cr
+
+    @api.model
+    def _consume(self, keys, rate, capacity):
+        """Take one token from the bucket of every key, or from none of them.
+
+        The buckets are refilled and locked (in key order, so concurrent
+        requests never deadlock) by one UPSERT; the tokens are then taken by
+        a second statement, only if every bucket has one. A client over one
+        of its limits therefore never drains its other buckets.
+
+        Args:
+            keys (list): Bucket keys, e.g. ``['ip:1.2.3.4', 'key:<hash>']``
+            rate (float): Tokens added per second
+            capacity (float): Bucket size (largest burst)
+
+        Returns:
+            tuple: (allowed, retry_after) where `retry_after` is the number of
+            seconds until every bucket has a token again
+        """
+        keys = sorted(set(keys))
+        now = "(clock_timestamp() at time zone 'UTC')"
+        refilled = f"LEAST(%(capacity)s, b.tokens + EXTRACT(EPOCH FROM {now} - b.updated_at) * %(rate)s)"
+        with self._bucket_cursor() as cr:
+            cr.execute(f"""
+                INSERT INTO {self._table_name} AS b (key, tokens, granted, updated_at)
+                SELECT k, %(capacity)s, false, {now}
+                  FROM unnest(%(keys)s::varchar[]) AS k
+                 ORDER BY k
+                ON CONFLICT (key) DO UPDATE SET
+                    tokens = {refilled},
+                    granted = false,
+                    updated_at = {now}
+                RETURNING tokens
+            """, {'keys': keys, 'rate': rate, 'capacity': capacity})
+            lowest = min(tokens for (tokens,) in cr.fetchall())
+            if lowest < 1:
+                return False, max(1, math.ceil((1 - lowest) / rate))
+            cr.execute(
+                f"UPDATE {self._table_name} SET tokens = tokens - 1, granted = true WHERE key = ANY(%s)",
+                [keys],
+            )
+        return True, 0
+
+    @api.model
+    def _benchmark_consume(self, keys=2, repeat=200):
+        """Measure the cost of `_consume` on this database.
+
+        Meant to be run from an Odoo shell, e.g.
+        ``env['external.appointment.rate.limit']._benchmark_consume()``.
+        Uses throwaway ``bench:*`` buckets large enough to always allow,
+        and one that always denies.
+
+        Returns:
+            dict: Median and 95th percentile wall time in milliseconds of an
+            allowed and of a denied call
+        """
+        allowed_keys = ['bench:%s' % i for i in range(keys)]
+
+        def timings(call_keys, rate, capacity):
+            samples = []
+            for _i in range(repeat):
+                start = time.perf_counter()
+                self._consume(call_keys, rate, capacity)
+                samples.append((time.perf_counter() - start) * 1000)
+            samples.sort()
+            return round(samples[len(samples) // 2], 3), round(samples[int(len(samples) * 0.95)], 3)
+
+        allowed = timings(allowed_keys, 1e6, 1e6)
+        denied = timings(allowed_keys[:-1] + ['bench:empty'], 1e-6, 1)
+        with self._bucket_cursor() as cr:
+            cr.execute(f"DELETE FROM {self._table_name} WHERE key LIKE 'bench:%%'")
+        result = {
+            'keys': keys,
+            'allowed_p50_ms': allowed[0],
+            'allowed_p95_ms': allowed[1],
+            'denied_p50_ms': denied[0],
+            'denied_p95_ms': denied[1],
+        }
+        _logger.info("API rate limiter benchmark: %s", result)
+        return result
+
+    @api.model
+    def _take(self, key, rate, capacity, reserve=0.0):
+        """Take one token from the bucket `key` if it keeps at least `reserve` tokens.
+
+        Args:
+            key (str): Bucket key, e.g. ``'quota:google:<config id>'``
+            rate (float): Tokens added per second
+            capacity (float): Bucket size; a new bucket starts full
+            reserve (float): Tokens that must remain after taking one
+
+        Returns:
+            float: 0 if a token was taken, otherwise the estimated seconds
+            until one can be
+        """
+        now = "(clock_timestamp() at time zone 'UTC')"
+        refilled = f"LEAST(%(capacity)s, b.tokens + EXTRACT(EPOCH FROM {now} - b.updated_at) * %(rate)s)"
+        with self._bucket_cursor() as cr:
+            cr.execute(f"""
+                INSERT INTO {self._table_name} AS b (key, tokens, granted, updated_at)
+                VALUES (%(key)s, %(capacity)s - 1, true, {now})
+                ON CONFLICT (key) DO UPDATE SET
+                    tokens = CASE WHEN {refilled} - 1 >= %(reserve)s THEN {refilled} - 1 ELSE {refilled} END,
+                    granted = {refilled} - 1 >= %(reserve)s,
+                    updated_at = {now}
+                RETURNING tokens, granted
+            """, {'key': key, 'rate': rate, 'capacity': capacity, 'reserve': reserve})
+            tokens, granted = cr.fetchone()
+        return 0 if granted else (reserve + 1 - tokens) / rate
+
+    @api.model
+    def _penalize(self, key, rate, seconds):
+        """Empty the bucket `key` for about `seconds` (the provider said slow down)."""
+        now = "(clock_timestamp() at time zone 'UTC')"
+        with self._bucket_cursor() as cr:
+            cr.execute(f"""
+                UPDATE {self._table_name} AS b
+                   SET tokens = LEAST(b.tokens + EXTRACT(EPOCH FROM {now} - b.updated_at) * %(rate)s, 0)
+                                - %(seconds)s * %(rate)s,
+                       updated_at = {now}
+                 WHERE key = %(key)s
+            """, {'key': key, 'rate': rate, 'seconds': seconds})
+
+    @api.model
+    @instrumented_cron
+    def _cron_purge_rate_limits(self, idle_hours=1):
+        """Delete buckets of clients idle long enough for their bucket to be full."""
+        self.env.cr.execute(
+            f"DELETE FROM {self._table_name} WHERE updated_at < (now() at time zone 'UTC') - make_interval(hours => %s)",
+            [idle_hours],
+        )
+        _logger.info(f"Purged {self.env.cr.rowcount} idle API rate limit buckets")
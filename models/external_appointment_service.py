@@ -1,12 +1,64 @@
 # -*- coding: utf-8 -*-
 
-from odoo import models, fields, api, _
+from odoo import models, fields, api, SUPERUSER_ID, _
 from odoo.exceptions import ValidationError
+from odoo.addons.external_appointment_scheduler.tools.cache import cache_stats, get_cache, invalidate
+from odoo.addons.external_appointment_scheduler.tools.deadline import DeadlineExceeded
+from odoo.addons.external_appointment_scheduler.tools.single_flight import flight_stats, get_flight
+from odoo.addons.external_appointment_scheduler.tools import slot_bitmap
+from odoo.addons.external_appointment_scheduler.tools.metrics import instrumented_cron
 from datetime import datetime, timedelta
+import hashlib
+import itertools
+import json
 import logging
+import threading
+import time
 
 _logger = logging.getLogger(__name__)
 
+# Serialized public service catalogue, keyed by catalogue version and language.
+# All caches are per process; changes are broadcast with tools.cache.invalidate.
+_catalogue_cache = get_cache('service_catalogue', ttl=3600, max_size=64)
+
+# Computed slots and per-day summaries, keyed by service and availability
+# version (see _get_availability_version)
+_availability_cache = get_cache('availability', ttl=300, max_size=1024)
+
+# Last known good provider slots per service and day, served (marked stale)
+# while the provider is failing; not affected by availability invalidations
+_last_good_cache = get_cache('availability_last_good', ttl=86400, max_size=512)
+
+# Seconds a stale result is cached before the provider is tried again
+STALE_TTL = 30
+
+# Windows being refreshed in the background after serving stale slots
+_refreshing = set()
+_refresh_lock = threading.Lock()
+
+# Identical slot computations running concurrently in this worker share one
+# result; across workers they go through external.appointment.slot.flight
+_slot_flight = get_flight('available_slots')
+
+# Longest wait (seconds) for the same computation running in another worker
+SLOT_FLIGHT_WAIT = 10
+
+# Appointment statuses that hold a seat of the service. Drafts count: API
+# bookings are drafts until confirmed (asynchronous ones until their ticket
+# is processed, or cancelled if it fails), and drafts created in the back
+# office take their seat as well until they are confirmed or cancelled.
+BOOKED_STATUSES = ('draft', 'confirmed', 'checked_in')
+
+# Age at which the hourly cron rebuilds a snapshot (a bit under the cron
+# interval so every hourly run refreshes all snapshots)
+SNAPSHOT_REFRESH_INTERVAL = timedelta(minutes=50)
+
+# Service fields changing the slots of an availability snapshot
+SNAPSHOT_FIELDS = {
+    'use_availability_snapshot', 'duration_minutes', 'buffer_minutes', 'capacity',
+    'max_lead_days', 'provider_id', 'calendar_id', 'active',
+}
+
 
 class ExternalAppointmentService(models.Model):
     _name = 'external.appointment.service'
@@ -112,6 +164,21 @@ class ExternalAppointmentService(models.Model):
         help='Default calendar provider for this service'
     )
 
+    # Availability snapshot
+    use_availability_snapshot = fields.Boolean(
+        string='Precompute Availability',
+        default=False,
+        help='Store free slots for the whole booking horizon and refresh only the '
+             'affected days on changes. Recommended for high-traffic services.'
+    )
+    
+    availability_snapshot_date = fields.Datetime(
+        string='Availability Snapshot Date',
+        readonly=True,
+        copy=False,
+        help='Last full refresh of the availability snapshot'
+    )
+
     # Backwards-compatible field expected by tests
     calendar_config_id = fields.Many2one(
         'external.calendar.config',
@@ -129,10 +196,11 @@ class ExternalAppointmentService(models.Model):
         string='Appointments'
     )
     
+    # Not stored: a stored count depending on appointment_ids made every
+    # booking reload the full appointment history of its service.
     appointment_count = fields.Integer(
         string='Appointment Count',
-        compute='_compute_appointment_count',
-        store=True
+        compute='_compute_appointment_count'
     )
     
     # Display fields
@@ -166,6 +234,35 @@ class ExternalAppointmentService(models.Model):
     
     # SQL Constraints are handled via Python constraints in Odoo 19
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        """Override create to invalidate the service catalogue cache."""
+        services = super(ExternalAppointmentService, self).create(vals_list)
+        invalidate(self.env.cr, 'service_catalogue')
+        services.filtered('use_availability_snapshot')._queue_full_snapshot_refresh()
+        return services
+
+    def write(self, vals):
+        """Override write to invalidate caches and queue availability snapshot rebuilds."""
+        result = super(ExternalAppointmentService, self).write(vals)
+        invalidate(self.env.cr, 'service_catalogue')
+        self._invalidate_availability_cache()
+        if SNAPSHOT_FIELDS & set(vals):
+            self._queue_full_snapshot_refresh()
+        return result
+
+    def unlink(self):
+        """Override unlink to invalidate the service catalogue cache."""
+        self._invalidate_availability_cache()
+        result = super(ExternalAppointmentService, self).unlink()
+        invalidate(self.env.cr, 'service_catalogue')
+        return result
+
+    def _invalidate_availability_cache(self):
+        """Drop cached slots and summaries of these services in every worker."""
+        for service_id in set(self.ids):
+            invalidate(self.env.cr, 'availability', service_id)
+
     @api.constrains('duration_minutes', 'buffer_minutes', 'price', 'capacity')
     def _check_positive_values(self):
         for service in self:
@@ -178,11 +275,15 @@ class ExternalAppointmentService(models.Model):
             if service.capacity is not None and service.capacity <= 0:
                 raise ValidationError(_('Capacity must be at least 1'))
     
-    @api.depends('appointment_ids')
     def _compute_appointment_count(self):
-        """Compute total number of appointments for this service."""
+        """Compute total number of appointments with one grouped count per batch."""
+        counts = dict(self.env['external.appointment'].sudo()._read_group(
+            [('service_id', 'in', self.ids)],
+            ['service_id'],
+            ['__count'],
+        ))
         for service in self:
-            service.appointment_count = len(service.appointment_ids)
+            service.appointment_count = counts.get(service._origin, 0)
 
     def _compute_calendar_config_alias(self):
         for rec in self:
@@ -219,6 +320,262 @@ class ExternalAppointmentService(models.Model):
             }
         }
     
+    @api.model
+    def _get_catalogue_version(self):
+        """Return a version string that changes whenever any service changes.
+
+        Built from the row count and latest write date of the service table,
+        so every worker derives the same version without shared state.
+        """
+        self.env.cr.execute(
+            "SELECT count(*), max(write_date) FROM external_appointment_service"
+        )
+        count, last_write = self.env.cr.fetchone()
+        raw = '%s|%s|%s' % (count, last_write, self.env.lang or '')
+        return hashlib.sha1(raw.encode()).hexdigest()[:20]
+
+    @api.model
+    def _get_service_catalogue(self):
+        """Return the cached public catalogue of active services.
+
+        Returns:
+            dict: ``version``, ``service_ids`` and the serialized JSON ``body``
+        """
+        version = self._get_catalogue_version()
+        key = (self.env.cr.dbname, version)
+        catalogue = _catalogue_cache.get(key)
+        if catalogue is None:
+            services = self.sudo().search([('active', '=', True)], order='sequence, name')
+            service_list = []
+            for service in services:
+                service_list.append({
+                    'id': service.id,
+                    'name': service.name,
+                    'description': service.description,
+                    'duration': service.duration_minutes,
+                    'price': service.price,
+                    'currency': service.currency_id.name,
+                    'allow_cancellation': service.allow_cancellation,
+                    'allow_reschedule': service.allow_reschedule,
+                })
+            catalogue = _catalogue_cache.set(key, {
+                'version': version,
+                'service_ids': services.ids,
+                'body': json.dumps({'success': True, 'services': service_list}),
+            })
+        return catalogue
+    
+    @api.model
+    def _get_cache_ttl(self):
+        """Return the availability cache lifetime in seconds (at least 1).
+
+        The lifetime also aligns cache windows (``now % ttl``), so zero or
+        negative values from the system parameters are clamped.
+        """
+        return max(1, int(self.env['ir.config_parameter'].sudo().get_param(
+            'external_appointment_scheduler.cache_ttl', 300
+        ) or 300))
+
+    def _get_availability_version(self, date_from, date_to, timezone='UTC'):
+        """Return a version string for an availability window of this service.
+
+        The version changes when the service is written, when any booking of
+        the service changes, when a slot hold is taken, released or expires,
+        when the calendar config syncs, and at least once per cache TTL so
+        slots do not drift past "now" forever.
+        """
+        self.ensure_one()
+        self.env.cr.execute(
+            """SELECT (SELECT max(write_date) FROM external_appointment WHERE service_id = %s),
+                      (SELECT string_agg(id::text, ',' ORDER BY id) FROM external_appointment_slot_hold
+                        WHERE service_id = %s AND expires_at > %s)""",
+            [self.id, self.id, fields.Datetime.now()],
+        )
+        last_booking_change, active_holds = self.env.cr.fetchone()
+        ttl = self._get_cache_ttl()
+        config = self.provider_id
+        raw = '|'.join(str(part) for part in (
+            self.id,
+            self.write_date,
+            last_booking_change,
+            active_holds,
+            config.id,
+            config.last_sync_date,
+            date_from,
+            date_to,
+            timezone,
+            int(time.time() // ttl),
+        ))
+        return hashlib.sha1(raw.encode()).hexdigest()[:20]
+
+    def _get_availability(self, date_from, date_to, timezone='UTC', version=None, limit=None, deadline=None):
+        """Return available slots for a window, cached by availability version.
+
+        Args:
+            date_from (datetime): Start date for availability check
+            date_to (datetime): End date for availability check
+            timezone (str): Timezone for the slots
+            version (str, optional): Precomputed `_get_availability_version`
+            limit (int, optional): Maximum number of slots to return
+            deadline (Deadline, optional): Time budget of the computation
+
+        Returns:
+            dict: ``version``, ``slots``, ``next_cursor`` (where to continue
+            after `limit` slots or after the time budget ran out, or None),
+            ``partial`` (True when the budget ran out) and ``stale`` (True
+            when the provider failed and last known good slots were used)
+        """
+        self.ensure_one()
+        version = version or self._get_availability_version(date_from, date_to, timezone)
+        key = (self.env.cr.dbname, self.id, version)
+        availability = _availability_cache.get(key)
+        if availability is None and limit:
+            # Cold cache with a limit: generate lazily, only as far as needed
+            state = {}
+            slots = list(itertools.islice(self._iter_available_slots(
+                date_from, date_to, chunk_days=1, state=state, deadline=deadline,
+            ), limit + 1))
+            availability = {'slots': slots, 'stale': bool(state.get('stale')), 'cursor': state.get('cursor')}
+        elif availability is None:
+            availability = self._compute_available_slots(date_from, date_to, deadline=deadline, version=version)
+            # Stale results are kept briefly so an outage does not hit the
+            # provider on every request, and refreshed in the background.
+            # Partial results are never cached.
+            if not availability['cursor']:
+                ttl = STALE_TTL if availability['stale'] else self._get_cache_ttl()
+                _availability_cache.set(key, availability, ttl=ttl)
+        if availability['stale']:
+            self._schedule_availability_refresh(date_from, date_to, timezone)
+        slots = availability['slots']
+        if slots and slots[0]['start'] < date_from:
+            # Cached for the whole period of the version: drop the slots that started since
+            slots = [slot for slot in slots if slot['start'] >= date_from]
+        next_cursor = availability.get('cursor')
+        if limit and len(slots) > limit:
+            next_cursor = slots[limit]['start']
+            slots = slots[:limit]
+        return {
+            'version': version,
+            'slots': slots,
+            'next_cursor': next_cursor,
+            'partial': bool(availability.get('cursor')),
+            'stale': availability['stale'],
+        }
+
+    def _schedule_availability_refresh(self, date_from, date_to, timezone='UTC'):
+        """Recompute a stale window in a background thread with its own cursor.
+        
+        Only one refresh per service and window runs at a time; while the
+        provider circuit is open the refresh fails fast and the stale result
+        keeps being served.
+        """
+        self.ensure_one()
+        key = (self.env.cr.dbname, self.id, date_from, date_to)
+        with _refresh_lock:
+            if key in _refreshing:
+                return
+            _refreshing.add(key)
+        registry = self.env.registry
+        service_id = self.id
+
+        def refresh():
+            try:
+                with registry.cursor() as cr:
+                    env = api.Environment(cr, SUPERUSER_ID, {'calendar_priority': 'background'})
+                    service = env['external.appointment.service'].browse(service_id)
+                    version = service._get_availability_version(date_from, date_to, timezone)
+                    availability = service._compute_available_slots(date_from, date_to, version=version)
+                    if not availability['stale']:
+                        _availability_cache.set(
+                            (cr.dbname, service_id, version), availability, ttl=service._get_cache_ttl()
+                        )
+            except Exception as e:
+                _logger.warning(f"Background availability refresh failed for service {service_id}: {e}")
+            finally:
+                with _refresh_lock:
+                    _refreshing.discard(key)
+
+        threading.Thread(target=refresh, name=f'availability_refresh_{service_id}', daemon=True).start()
+
+    def next_available(self, n=1, after=None):
+        """Return the next `n` bookable slots of this service.
+        
+        Slots are generated lazily day by day and provider busy times are
+        fetched in growing chunks (1, 2, 4... days), so the search stops as
+        soon as `n` slots are found instead of computing the whole horizon.
+        
+        Args:
+            n (int): Number of slots wanted
+            after (datetime, optional): Earliest start (naive UTC); the
+                minimum lead time is always enforced
+            
+        Returns:
+            list: Up to `n` slots in chronological order
+        """
+        self.ensure_one()
+        now = fields.Datetime.now()
+        earliest = now + timedelta(hours=self.min_lead_hours)
+        date_from = max(after, earliest) if after else earliest
+        horizon = now + timedelta(days=self.max_lead_days)
+        if date_from >= horizon:
+            return []
+        return list(itertools.islice(self._iter_available_slots(date_from, horizon, chunk_days=1), n))
+
+    def _benchmark_next_available(self, n=5, repeat=3):
+        """Compare `next_available` with computing the full booking horizon.
+        
+        Meant to be run from an Odoo shell, e.g.
+        ``env['external.appointment.service'].browse(1)._benchmark_next_available()``.
+        
+        Returns:
+            dict: Best wall time in milliseconds and number of slots of each approach
+        """
+        self.ensure_one()
+        now = fields.Datetime.now()
+        date_from = now + timedelta(hours=self.min_lead_hours)
+        horizon = now + timedelta(days=self.max_lead_days)
+        
+        def best_of(func):
+            timings = []
+            for _i in range(repeat):
+                start = time.perf_counter()
+                result = func()
+                timings.append((time.perf_counter() - start) * 1000)
+            return round(min(timings), 3), len(result)
+        
+        lazy_ms, lazy_count = best_of(lambda: self.next_available(n))
+        full_ms, full_count = best_of(lambda: self.get_available_slots(date_from, horizon)[:n])
+        result = {
+            'n': n,
+            'next_available_ms': lazy_ms,
+            'full_window_ms': full_ms,
+            'slots': lazy_count,
+            'speedup': round(full_ms / lazy_ms, 1) if lazy_ms else None,
+        }
+        _logger.info("next_available benchmark for service %s: %s", self.id, result)
+        return result
+
+    @api.model
+    def _get_availability_stats(self):
+        """Return cache and request coalescing counters of this worker.
+        
+        Meant to be run from an Odoo shell; ``coalescing_ratio`` is the share
+        of slot computations answered by an identical call already in flight.
+        """
+        return {
+            'caches': cache_stats(),
+            'single_flight': flight_stats(),
+        }
+
+    def _get_slot_constraints(self):
+        """Return the slot constraints passed to calendar adapters."""
+        self.ensure_one()
+        return {
+            'duration': self.duration_minutes,
+            'buffer': self.buffer_minutes,
+            'calendar_id': self.calendar_id,
+        }
+    
     def get_available_slots(self, date_from, date_to, timezone='UTC'):
         """Get available time slots for this service.
         
@@ -231,67 +588,546 @@ class ExternalAppointmentService(models.Model):
             list: List of available slots
         """
         self.ensure_one()
+        return list(self._compute_available_slots(date_from, date_to)['slots'])
+    
+    def _compute_available_slots(self, date_from, date_to, deadline=None, version=None):
+        """Compute the slots of a window, sharing the work with identical concurrent calls.
+        
+        Args:
+            date_from (datetime): Start date (naive UTC)
+            date_to (datetime): End date (naive UTC)
+            deadline (Deadline, optional): Time budget; busy times are then
+                fetched in growing chunks so the work done so far is kept
+            version (str, optional): Precomputed `_get_availability_version`
+        
+        Returns:
+            dict: ``slots``, ``stale`` and ``cursor`` (where to continue if
+            the time budget ran out, else None)
+        """
+        self.ensure_one()
+        version = version or self._get_availability_version(date_from, date_to)
         
-        # If no provider configured, generate simple default slots
-        if not self.provider_id:
-            return self._generate_default_slots(date_from, date_to)
+        def compute():
+            state = {}
+            slots = list(self._iter_available_slots(
+                date_from, date_to, chunk_days=1 if deadline else None, state=state, deadline=deadline,
+            ))
+            return {'slots': slots, 'stale': bool(state.get('stale')), 'cursor': state.get('cursor')}
+        
+        def compute_shared():
+            wait = min(SLOT_FLIGHT_WAIT, deadline.remaining()) if deadline else SLOT_FLIGHT_WAIT
+            return self.env['external.appointment.slot.flight']._do(version, compute, self._get_cache_ttl(), wait)
         
-        adapter = self.provider_id._get_adapter()
+        # A burst of visitors asking for the same service and window triggers
+        # one provider call; concurrent requests wait for the first one.
+        # Partial and stale results are never handed to the waiting requests.
+        key = (self.env.cr.dbname, self.id, version, bool(deadline))
+        return _slot_flight.do(key, compute_shared, share=lambda result: not result['stale'] and not result['cursor'])
+    
+    def _iter_available_slots(self, date_from, date_to, chunk_days=None, state=None, deadline=None):
+        """Yield available slots in chronological order.
+        
+        Args:
+            date_from (datetime): Start date (naive UTC)
+            date_to (datetime): End date (naive UTC)
+            chunk_days (int, optional): Fetch provider busy times lazily in
+                growing chunks starting with this many days
+            state (dict, optional): Receives ``stale`` (True when the provider
+                failed and last known good slots were used) and ``cursor``
+                (where to continue when `deadline` expired)
+            deadline (Deadline, optional): Stop generating when it expires
+            
+        Yields:
+            dict: Slot with 'start', 'end' and optional 'id'/'capacity'
+        """
+        self.ensure_one()
+        date_from = max(date_from, self._get_earliest_start())
+        if date_from >= date_to:
+            return
+        if self.use_availability_snapshot:
+            yield from self._iter_snapshot_slots(date_from, date_to)
+            return
+        yield from self._iter_computed_slots(date_from, date_to, chunk_days, state, deadline)
+    
+    def _get_earliest_start(self):
+        """Return the earliest slot start offered now, after the minimum lead time."""
+        self.ensure_one()
+        return fields.Datetime.now() + timedelta(hours=self.min_lead_hours)
+    
+    def _iter_computed_slots(self, date_from, date_to, chunk_days=None, state=None, deadline=None):
+        """Yield slots computed from the provider and bookings, bypassing snapshots."""
+        booked = self._get_booked_intervals(date_from, date_to)
+        candidates = self._iter_candidate_slots(date_from, date_to, chunk_days, state, deadline)
+        yield from self._skip_booked_slots(candidates, booked)
+    
+    def _iter_snapshot_slots(self, date_from, date_to):
+        """Yield the precomputed slots of the window (one indexed range scan).
+        
+        Slots filled since the snapshot of their day was built are skipped,
+        so bookings show up before the snapshot cron rebuilds the day.
+        """
+        snapshots = self.env['external.appointment.slot.snapshot'].sudo().search_fetch([
+            ('service_id', '=', self.id),
+            ('slot_start', '>=', max(date_from, fields.Datetime.now())),
+            ('slot_start', '<', date_to),
+        ], ['slot_start', 'slot_end', 'capacity'], order='slot_start')
+        slots = (
+            {
+                'id': None,
+                'start': snapshot.slot_start,
+                'end': snapshot.slot_end,
+                'capacity': snapshot.capacity,
+            }
+            for snapshot in snapshots if snapshot.slot_end <= date_to
+        )
+        yield from self._skip_booked_slots(slots, self._get_booked_intervals(date_from, date_to))
+    
+    def _refresh_availability_snapshot(self, days=None):
+        """Recompute the availability snapshot of services using one.
+        
+        Slots are computed for the whole horizon (or only for `days`) and
+        compared day by day with the stored rows; only days whose slots
+        changed are rewritten. Services not using snapshots lose their rows.
+        
+        Args:
+            days (iterable, optional): Dates to refresh, default the whole
+                booking horizon
+        """
+        Snapshot = self.env['external.appointment.slot.snapshot'].sudo()
+        Snapshot.search([
+            ('service_id', 'in', self.filtered(lambda s: not s.use_availability_snapshot or not s.active).ids),
+        ]).unlink()
+        now = fields.Datetime.now()
+        for service in self.filtered(lambda s: s.use_availability_snapshot and s.active):
+            horizon = now + timedelta(days=service.max_lead_days)
+            if days is None:
+                windows = [(now, horizon)]
+            else:
+                windows = []
+                for day in sorted(set(days)):
+                    day_start = datetime.combine(day, datetime.min.time())
+                    window = (max(now, day_start), min(horizon, day_start + timedelta(days=1)))
+                    if window[0] < window[1]:
+                        windows.append(window)
+            
+            for date_from, date_to in windows:
+                fresh = {}
+                state = {}
+                for slot in service._iter_computed_slots(date_from, date_to, state=state):
+                    fresh.setdefault(slot['start'].date(), []).append(
+                        (slot['start'], slot['end'], slot.get('capacity') or service.capacity or 1)
+                    )
+                if state.get('stale'):
+                    # Keep the stored rows as they are until the provider recovers
+                    _logger.warning(f"Provider unavailable, availability snapshot of service {service.id} kept")
+                    continue
+                stored = Snapshot.search([
+                    ('service_id', '=', service.id),
+                    ('slot_start', '>=', datetime.combine(date_from.date(), datetime.min.time())),
+                    ('slot_start', '<', date_to),
+                ]).grouped(lambda row: row.slot_start.date())
+                
+                for day in set(fresh) | set(stored):
+                    day_rows = stored.get(day, Snapshot)
+                    current = [(r.slot_start, r.slot_end, r.capacity) for r in day_rows if r.slot_start >= date_from]
+                    if current == fresh.get(day, []) and len(current) == len(day_rows):
+                        continue
+                    day_rows.unlink()
+                    Snapshot.create([{
+                        'service_id': service.id,
+                        'slot_start': start,
+                        'slot_end': end,
+                        'capacity': capacity,
+                    } for start, end, capacity in fresh.get(day, [])])
+            
+            if days is None:
+                # Drop slots that rolled into the past or out of the horizon
+                Snapshot.search([
+                    ('service_id', '=', service.id),
+                    '|', ('slot_start', '<', now), ('slot_start', '>=', horizon),
+                ]).unlink()
+                service.availability_snapshot_date = now
+    
+    @api.model
+    def _queue_snapshot_refresh(self, service_days):
+        """Mark snapshot days dirty and trigger the snapshot cron to rebuild them.
+        
+        The marks are written in the current transaction, so they are only
+        seen (and the days rebuilt) once it commits; requests never wait for
+        provider calls. Until then, snapshot reads skip fully booked slots
+        themselves.
+        
+        Args:
+            service_days (iterable): (service id, date) pairs
+        """
+        service_days = sorted(set(service_days))
+        if not service_days:
+            return
+        dirty_table = self.env['external.appointment.slot.snapshot']._dirty_table
+        self.env.cr.execute(f"""
+            INSERT INTO {dirty_table} (service_id, day)
+            SELECT * FROM unnest(%s::integer[], %s::date[])
+            ON CONFLICT DO NOTHING
+        """, [[service_id for service_id, day in service_days], [day for service_id, day in service_days]])
+        cron = self.env.ref('external_appointment_scheduler.cron_refresh_availability_snapshots', raise_if_not_found=False)
+        if cron:
+            cron._trigger()
+    
+    def _queue_full_snapshot_refresh(self):
+        """Rebuild the whole snapshot of these services in the background.
+        
+        Services no longer using a snapshot lose their rows right away; the
+        others are marked for a full refresh and the snapshot cron is
+        triggered, so form saves and webhooks never wait for provider calls.
+        """
+        self.filtered(lambda s: not s.use_availability_snapshot or not s.active)._refresh_availability_snapshot()
+        services = self.filtered(lambda s: s.use_availability_snapshot and s.active)
+        if not services:
+            return
+        self.env.cr.execute(
+            "UPDATE external_appointment_service SET availability_snapshot_date = NULL WHERE id IN %s",
+            [tuple(services.ids)],
+        )
+        services.invalidate_recordset(['availability_snapshot_date'])
+        cron = self.env.ref('external_appointment_scheduler.cron_refresh_availability_snapshots', raise_if_not_found=False)
+        if cron:
+            cron._trigger()
+    
+    @api.model
+    @instrumented_cron
+    def _cron_refresh_availability_snapshots(self):
+        """Roll availability snapshots forward and catch up with provider changes.
+        
+        Days marked dirty by `_queue_snapshot_refresh` are rebuilt first. The
+        hourly run then finds every snapshot due; a run triggered by
+        `_queue_full_snapshot_refresh` only the services queued since.
+        """
+        self.with_context(calendar_priority='background')._refresh_dirty_snapshot_days()
+        services = self.with_context(calendar_priority='background').search([
+            ('use_availability_snapshot', '=', True),
+            '|', ('availability_snapshot_date', '=', False),
+            ('availability_snapshot_date', '<', fields.Datetime.now() - SNAPSHOT_REFRESH_INTERVAL),
+        ])
+        for service in services:
+            try:
+                service._refresh_availability_snapshot()
+            except Exception as e:
+                _logger.error(f"Failed to refresh availability snapshot of service {service.id}: {e}")
+    
+    @api.model
+    def _refresh_dirty_snapshot_days(self):
+        """Rebuild the snapshot days marked dirty, one service per savepoint.
+        
+        A failed service keeps its marks for the next run.
+        """
+        dirty_table = self.env['external.appointment.slot.snapshot']._dirty_table
+        self.env.cr.execute(f"SELECT DISTINCT service_id FROM {dirty_table}")
+        for (service_id,) in self.env.cr.fetchall():
+            try:
+                with self.env.cr.savepoint():
+                    self.env.cr.execute(
+                        f"DELETE FROM {dirty_table} WHERE service_id = %s RETURNING day", [service_id],
+                    )
+                    days = [day for (day,) in self.env.cr.fetchall()]
+                    service = self.sudo().browse(service_id).exists()
+                    if service:
+                        service._refresh_availability_snapshot(days)
+                        self.env.flush_all()
+            except Exception as e:
+                _logger.error(f"Failed to refresh availability snapshot days of service {service_id}: {e}")
+    
+    def _iter_candidate_slots(self, date_from, date_to, chunk_days=None, state=None, deadline=None):
+        """Yield provider (or default) slots, before removing full bookings.
+        
+        When the provider fails (or its circuit breaker is open), the rest of
+        the window comes from the last known good slots of the service rather
+        than default business hours that ignore real busy times.
+        """
+        # If no provider configured, generate simple default slots
+        adapter = self.provider_id._get_adapter() if self.provider_id else None
         if not adapter:
-            return self._generate_default_slots(date_from, date_to)
+            yield from self._iter_default_slots(date_from, date_to)
+            return
         
         # Get available slots from provider
+        constraints = self._get_slot_constraints()
+        if deadline:
+            constraints['deadline'] = deadline
+        resume_from = date_from
+        fetched = []
         try:
-            slots = adapter.get_available_slots(
-                service=self,
-                date_from=date_from,
-                date_to=date_to,
-                constraints={
-                    'duration': self.duration_minutes,
-                    'buffer': self.buffer_minutes,
-                    'calendar_id': self.calendar_id,
-                }
-            )
-            return slots
+            for slot in adapter.iter_available_slots(
+                self, date_from, date_to, constraints, chunk_days=chunk_days
+            ):
+                resume_from = slot['start'] + timedelta(seconds=1)
+                fetched.append(slot)
+                yield slot
+        except DeadlineExceeded as e:
+            # Out of time: stop here, the caller continues from the cursor
+            _logger.info(f"Time budget exceeded computing slots for service {self.id}, resume at {e.resume_at}")
+            if state is not None:
+                state['cursor'] = e.resume_at or resume_from
+            return
         except Exception as e:
             _logger.error(f"Failed to get available slots for service {self.id}: {e}")
-            return self._generate_default_slots(date_from, date_to)
+            if state is not None:
+                state['stale'] = True
+            yield from self._iter_last_good_slots(resume_from, date_to)
+            return
+        self._store_last_good_slots(date_from, date_to, fetched)
+    
+    def _store_last_good_slots(self, date_from, date_to, slots):
+        """Remember the provider slots of every day of a fully computed window."""
+        key = (self.env.cr.dbname, self.id)
+        days = dict(_last_good_cache.get(key) or {})
+        day = date_from.date()
+        while day <= date_to.date():
+            days[day] = []
+            day += timedelta(days=1)
+        for slot in slots:
+            days[slot['start'].date()].append(slot)
+        _last_good_cache.set(key, days)
+    
+    def _iter_last_good_slots(self, date_from, date_to):
+        """Yield the last known good provider slots inside a window."""
+        days = _last_good_cache.get((self.env.cr.dbname, self.id)) or {}
+        now = fields.Datetime.now()
+        for day in sorted(days):
+            for slot in days[day]:
+                if slot['start'] >= max(date_from, now) and slot['end'] <= date_to:
+                    yield slot
+    
+    def _get_booked_intervals(self, date_from, date_to):
+        """Return the periods where this service is booked at full capacity.
+        
+        Each booking or unexpired slot hold blocks its own time plus the
+        service buffer; with a capacity above one, only periods where
+        bookings reach the capacity are returned.
+        
+        Args:
+            date_from (datetime): Start of the window (naive UTC)
+            date_to (datetime): End of the window (naive UTC)
+            
+        Returns:
+            list: Sorted, non-overlapping (start, end) pairs
+        """
+        self.ensure_one()
+        duration = timedelta(minutes=self.duration_minutes or 0)
+        buffer = timedelta(minutes=self.buffer_minutes or 0)
+        appointments = self.env['external.appointment'].sudo().search_fetch([
+            ('service_id', '=', self.id),
+            ('status', 'in', BOOKED_STATUSES),
+            ('start_datetime', '<', date_to),
+            ('start_datetime', '>=', date_from - duration - buffer - timedelta(days=1)),
+        ], ['start_datetime', 'end_datetime'])
+        intervals = []
+        for appointment in appointments:
+            end = (appointment.end_datetime or appointment.start_datetime + duration) + buffer
+            if end > date_from:
+                intervals.append((appointment.start_datetime, end))
+        # Slots held during checkout take a seat until the hold expires
+        holds = self.env['external.appointment.slot.hold'].sudo().search_fetch([
+            ('service_id', '=', self.id),
+            ('expires_at', '>', fields.Datetime.now()),
+            ('start_datetime', '<', date_to),
+            ('start_datetime', '>=', date_from - duration - buffer - timedelta(days=1)),
+        ], ['start_datetime', 'end_datetime'])
+        for hold in holds:
+            end = hold.end_datetime + buffer
+            if end > date_from:
+                intervals.append((hold.start_datetime, end))
+        return slot_bitmap.intervals_at_capacity(intervals, self.capacity or 1)
+    
+    def _reserve_slot(self, start, end):
+        """Check that a booking fits at `start` and block concurrent bookings of the service.
+
+        The service row is written (with its own write date), not merely
+        locked: a concurrent booking or hold of the service waits for this
+        transaction, then fails with a serialization error because the row
+        changed since its snapshot, and Odoo retries it on a fresh snapshot
+        that includes the draft appointment or hold created here. A plain
+        row lock would let it go on with a snapshot missing them.
+
+        Args:
+            start (datetime): Booking start (naive UTC)
+            end (datetime): Booking end (naive UTC)
+
+        Raises:
+            ValidationError: If the service is fully booked at that time
+        """
+        self.ensure_one()
+        self.env.cr.execute(
+            "UPDATE external_appointment_service SET write_date = write_date WHERE id = %s",
+            [self.id],
+        )
+        blocked_until = end + timedelta(minutes=self.buffer_minutes or 0)
+        for booked_start, booked_end in self._get_booked_intervals(start, blocked_until):
+            if booked_start < blocked_until and booked_end > start:
+                raise ValidationError(_('This time slot is no longer available.'))
+
+    def _check_offered_slot(self, start):
+        """Check that `start` is the start of a slot this service offers.
+
+        The slot must be one the availability endpoints offer: inside the
+        lead time and booking horizon, on the working-hours slot grid (which
+        starts at the beginning of the working day whatever the window) and
+        free of provider busy times. Call it before `_reserve_slot`, so the
+        service lock is not held during provider calls.
+
+        Args:
+            start (datetime): Slot start (naive UTC)
+
+        Raises:
+            ValidationError: If no slot of the service starts at `start`
+        """
+        self.ensure_one()
+        now = fields.Datetime.now()
+        end = start + timedelta(minutes=self.duration_minutes)
+        if start < self._get_earliest_start() or end > now + timedelta(days=self.max_lead_days):
+            raise ValidationError(_('This time slot is not available for booking.'))
+        if not any(slot['start'] == start for slot in self._iter_available_slots(start, end)):
+            raise ValidationError(_('This time slot is not available for booking.'))
+
+    def _skip_booked_slots(self, slots, booked):
+        """Yield the chronological `slots` not overlapping sorted `booked` periods."""
+        booked = iter(booked)
+        current = next(booked, None)
+        for slot in slots:
+            while current and current[1] <= slot['start']:
+                current = next(booked, None)
+            if current and current[0] < slot['end']:
+                continue
+            yield slot
+    
+    def get_availability_summary(self, date_from, date_to, version=None):
+        """Return per-day free slot counts for a window, cached by availability version.
+        
+        Args:
+            date_from (datetime): Start of the window (naive UTC)
+            date_to (datetime): End of the window (naive UTC)
+            version (str, optional): Precomputed `_get_availability_version`
+            
+        Returns:
+            dict: ``version``, ``stale`` and ``days``, a list of dicts with
+            ``date``, ``count`` and ``first`` (start of the first free slot or None)
+        """
+        self.ensure_one()
+        version = version or self._get_availability_version(date_from, date_to, 'summary')
+        key = (self.env.cr.dbname, self.id, 'summary', version)
+        summary = _availability_cache.get(key)
+        if summary is None:
+            state = {}
+            days = self._compute_availability_summary(date_from, date_to, state=state)
+            summary = {'days': days, 'stale': bool(state.get('stale'))}
+            ttl = STALE_TTL if summary['stale'] else self._get_cache_ttl()
+            _availability_cache.set(key, summary, ttl=ttl)
+        return {'version': version, 'days': summary['days'], 'stale': summary['stale']}
+    
+    def _compute_availability_summary(self, date_from, date_to, state=None):
+        """Count free slots per day using minute bitmaps.
+        
+        Provider busy times are fetched once for the whole window and merged
+        with full bookings into one bitmap per day; each candidate slot of
+        the working-hour grid is then checked with a single mask test.
+        """
+        self.ensure_one()
+        if self.use_availability_snapshot:
+            return self._summarize_slots(self._iter_available_slots(date_from, date_to), date_from, date_to)
+        constraints = self._get_slot_constraints()
+        duration = constraints.get('duration', 60)
+        buffer = constraints.get('buffer', 15)
+        booked = self._get_booked_intervals(date_from, date_to)
+        blocked = booked
+        
+        adapter = self.provider_id._get_adapter() if self.provider_id else None
+        if adapter:
+            try:
+                busy_times = adapter.get_busy_times_guarded(date_from, date_to, constraints)
+                blocked = blocked + [(busy['start'], busy['end']) for busy in busy_times]
+            except Exception as e:
+                _logger.error(f"Failed to get busy times for service {self.id}: {e}")
+                if state is not None:
+                    state['stale'] = True
+                last_good = self._iter_last_good_slots(max(date_from, self._get_earliest_start()), date_to)
+                return self._summarize_slots(self._skip_booked_slots(last_good, booked), date_from, date_to)
+        bitmaps = slot_bitmap.bitmaps_by_day(blocked)
+        # Same lead time as the slot listing; the days still cover the window
+        slots_from = max(date_from, self._get_earliest_start())
+        
+        days = []
+        day = date_from.date()
+        while day <= date_to.date():
+            if adapter:
+                candidates = adapter._generate_day_slots(day, slots_from, date_to, duration, buffer)
+            else:
+                candidates = self._default_day_slots(day, slots_from, date_to)
+            bitmap = bitmaps.get(day, 0)
+            origin = datetime.combine(day, datetime.min.time())
+            free = [
+                slot['start'] for slot in candidates
+                if slot_bitmap.is_free(bitmap, origin, slot['start'], slot['end'])
+            ]
+            days.append({'date': day, 'count': len(free), 'first': free[0] if free else None})
+            day += timedelta(days=1)
+        return days
+    
+    def _summarize_slots(self, slots, date_from, date_to):
+        """Build per-day summary entries from chronological slots."""
+        starts = {}
+        for slot in slots:
+            starts.setdefault(slot['start'].date(), []).append(slot['start'])
+        days = []
+        day = date_from.date()
+        while day <= date_to.date():
+            free = starts.get(day, [])
+            days.append({'date': day, 'count': len(free), 'first': free[0] if free else None})
+            day += timedelta(days=1)
+        return days
     
     def _generate_default_slots(self, date_from, date_to):
         """Generate simple default time slots when no provider is configured.
         
         Returns slots from 9 AM to 5 PM on weekdays.
         """
-        slots = []
+        return list(self._iter_default_slots(date_from, date_to))
+    
+    def _iter_default_slots(self, date_from, date_to):
+        """Yield default weekday 9 AM to 5 PM slots inside the window, day by day."""
         current_date = date_from.date()
         end_date = date_to.date()
         
+        while current_date <= end_date:
+            yield from self._default_day_slots(current_date, date_from, date_to)
+            current_date += timedelta(days=1)
+    
+    def _default_day_slots(self, day, date_from, date_to):
+        """Return the default slots of a single day inside the window."""
+        slots = []
+        now = datetime.now()
+        
         # Business hours: 9 AM to 5 PM
         start_hour = 9
         end_hour = 17
         
-        while current_date <= end_date:
-            # Skip weekends
-            if current_date.weekday() < 5:  # Monday=0, Friday=4
-                current_time = datetime.combine(current_date, datetime.min.time()).replace(hour=start_hour)
-                day_end = datetime.combine(current_date, datetime.min.time()).replace(hour=end_hour)
-                
-                while current_time + timedelta(minutes=self.duration_minutes) <= day_end:
-                    slot_end = current_time + timedelta(minutes=self.duration_minutes)
-                    
-                    # Check if slot is in the future
-                    if current_time > datetime.now():
-                        slots.append({
-                            'id': None,
-                            'start': current_time,
-                            'end': slot_end,
-                            'capacity': self.capacity or 1,
-                        })
-                    
-                    # Move to next slot (including buffer time)
-                    current_time = slot_end + timedelta(minutes=self.buffer_minutes or 0)
+        # Skip weekends
+        if day.weekday() < 5:  # Monday=0, Friday=4
+            current_time = datetime.combine(day, datetime.min.time()).replace(hour=start_hour)
+            day_end = datetime.combine(day, datetime.min.time()).replace(hour=end_hour)
             
-            current_date += timedelta(days=1)
+            while current_time + timedelta(minutes=self.duration_minutes) <= day_end:
+                slot_end = current_time + timedelta(minutes=self.duration_minutes)
+                
+                # Check if slot is in the future and inside the window
+                if current_time > now and current_time >= date_from and slot_end <= date_to:
+                    slots.append({
+                        'id': None,
+                        'start': current_time,
+                        'end': slot_end,
+                        'capacity': self.capacity or 1,
+                    })
+                
+                # Move to next slot (including buffer time)
+                current_time = slot_end + timedelta(minutes=self.buffer_minutes or 0)
         
         return slots
     
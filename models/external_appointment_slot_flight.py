@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, api
+from datetime import datetime
+import json
+import logging
+import psycopg2.errors
+
+_logger = logging.getLogger(__name__)
+
+
+class ExternalAppointmentSlotFlight(models.AbstractModel):
+    """Slot computations shared between workers.
+
+    Threads of one worker coalesce through ``tools.single_flight``; this
+    model does the same across workers and nodes. The first worker to
+    compute a window takes a transaction-level advisory lock on its
+    availability version, on its own cursor, and stores the slots in an
+    UNLOGGED table before committing (which releases the lock). The others
+    wait for the lock, then read the stored slots instead of calling the
+    provider again. Only complete, fresh results are stored; a worker whose
+    leader got a partial or stale result computes its own.
+    """
+    _name = 'external.appointment.slot.flight'
+    _description = 'Shared Slot Computations'
+
+    _table_name = 'external_appointment_slot_flight'
+
+    def init(self):
+        """Create the UNLOGGED result table."""
+        super().init()
+        self.env.cr.execute(f"""
+            CREATE UNLOGGED TABLE IF NOT EXISTS {self._table_name} (
+                key varchar PRIMARY KEY,
+                slots text NOT NULL,
+                expires_at timestamp NOT NULL
+            )
+        """)
+
+    @api.model
+    def _do(self, key, compute, ttl, wait):
+        """Return ``compute()``, or the result another worker computed for `key`.
+
+        Args:
+            key (str): Availability version of the window (hexadecimal)
+            compute (callable): Returns a dict with ``slots``, ``stale`` and
+                ``cursor``, as `_compute_available_slots`
+            ttl (int): Seconds the stored result stays valid
+            wait (float): Longest wait in seconds for another worker's
+                computation; the caller computes its own result after that
+
+        Returns:
+            dict: The result of `compute`, possibly computed by another worker
+        """
+        result = self._read(key)
+        if result is not None:
+            return result
+        with self.env.registry.cursor() as cr:
+            cr.execute("SET LOCAL lock_timeout = %s", ['%dms' % max(1, wait * 1000)])
+            try:
+                cr.execute("SELECT pg_advisory_xact_lock(%s)", [int(key[:15], 16)])
+            except psycopg2.errors.LockNotAvailable:
+                cr.rollback()
+                return compute()
+            # The lock cursor's snapshot predates the leader's commit: read on a fresh one
+            result = self._read(key)
+            if result is not None:
+                return result
+            result = compute()
+            if not result['stale'] and not result['cursor']:
+                cr.execute(f"DELETE FROM {self._table_name} WHERE expires_at < (now() at time zone 'UTC')")
+                cr.execute(f"""
+                    INSERT INTO {self._table_name} (key, slots, expires_at)
+                    VALUES (%s, %s, (now() at time zone 'UTC') + make_interval(secs => %s))
+                    ON CONFLICT (key) DO UPDATE SET slots = EXCLUDED.slots, expires_at = EXCLUDED.expires_at
+                """, [key, json.dumps(result['slots'], default=_encode_datetime), ttl])
+            return result
+
+    @api.model
+    def _read(self, key):
+        """Return the stored result of `key`, None if absent or expired."""
+        with self.env.registry.cursor() as cr:
+            cr.execute(
+                f"SELECT slots FROM {self._table_name} WHERE key = %s AND expires_at > (now() at time zone 'UTC')",
+                [key],
+            )
+            row = cr.fetchone()
+        if not row:
+            return None
+        slots = json.loads(row[0])
+        for slot in slots:
+            slot['start'] = datetime.fromisoformat(slot['start'])
+            slot['end'] = datetime.fromisoformat(slot['end'])
+        return {'slots': slots, 'stale': False, 'cursor': None}
+
+
+def _encode_datetime(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
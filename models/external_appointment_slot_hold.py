@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api, _
+from odoo.exceptions import ValidationError
+from odoo.tools.sql import create_index
+from odoo.addons.external_appointment_scheduler.tools.metrics import instrumented_cron
+from datetime import timedelta
+import logging
+import secrets
+
+_logger = logging.getLogger(__name__)
+
+
+class ExternalAppointmentSlotHold(models.Model):
+    """Short-lived reservation of a slot while a customer fills in the booking form.
+
+    Unexpired holds count against the service capacity like bookings. A
+    booking presenting the hold token replaces the hold in the same
+    transaction. Expired holds are ignored and deleted in bulk by a cron.
+    """
+    _name = 'external.appointment.slot.hold'
+    _description = 'Appointment Slot Hold'
+    _order = 'expires_at'
+    _log_access = False
+
+    token = fields.Char(
+        string='Token',
+        required=True,
+        readonly=True,
+        copy=False,
+        default=lambda self: secrets.token_urlsafe(24)
+    )
+
+    service_id = fields.Many2one(
+        'external.appointment.service',
+        string='Service',
+        required=True,
+        ondelete='cascade'
+    )
+
+    start_datetime = fields.Datetime(
+        string='Start',
+        required=True
+    )
+
+    end_datetime = fields.Datetime(
+        string='End',
+        required=True
+    )
+
+    expires_at = fields.Datetime(
+        string='Expires At',
+        required=True
+    )
+
+    def init(self):
+        """Create the indexes for token lookups, capacity checks and purging."""
+        super().init()
+        create_index(
+            self.env.cr,
+            'external_appointment_slot_hold_token_index',
+            self._table,
+            ['token'],
+            unique=True,
+        )
+        create_index(
+            self.env.cr,
+            'external_appointment_slot_hold_service_start_index',
+            self._table,
+            ['service_id', 'start_datetime'],
+        )
+        create_index(
+            self.env.cr,
+            'external_appointment_slot_hold_expires_index',
+            self._table,
+            ['expires_at'],
+        )
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        """Override create to drop cached availability of the held services."""
+        holds = super().create(vals_list)
+        holds._invalidate_availability()
+        return holds
+
+    def unlink(self):
+        """Override unlink to drop cached availability of the released services."""
+        self._invalidate_availability()
+        return super().unlink()
+
+    def _invalidate_availability(self):
+        """Invalidate cached availability and snapshot days of the holds."""
+        self.service_id._invalidate_availability_cache()
+        self._queue_snapshot_refresh([(hold.service_id, hold.start_datetime) for hold in self])
+
+    @api.model
+    def _queue_snapshot_refresh(self, service_starts):
+        """Queue the snapshot days of (service, start) pairs of snapshot services."""
+        service_days = {
+            (service.id, start.date()) for service, start in service_starts if service.use_availability_snapshot
+        }
+        if service_days:
+            self.env['external.appointment.service']._queue_snapshot_refresh(service_days)
+
+    @api.model
+    def _hold_slot(self, service, start):
+        """Hold the slot of `service` starting at `start`.
+
+        Args:
+            service (recordset): external.appointment.service record
+            start (datetime): Slot start (naive UTC)
+
+        Returns:
+            recordset: The new hold
+
+        Raises:
+            ValidationError: If the service offers no slot at `start`, or
+            the slot is fully booked or held
+        """
+        # Anonymous clients must not hold arbitrary times that eat capacity
+        service._check_offered_slot(start)
+        end = start + timedelta(minutes=service.duration_minutes)
+        service._reserve_slot(start, end)
+        minutes = int(self.env['ir.config_parameter'].sudo().get_param(
+            'external_appointment_scheduler.hold_minutes', 5
+        ))
+        return self.create({
+            'service_id': service.id,
+            'start_datetime': start,
+            'end_datetime': end,
+            'expires_at': fields.Datetime.now() + timedelta(minutes=minutes),
+        })
+
+    @api.model
+    def _consume_hold(self, token, service, start):
+        """Remove the hold `token` so that its booking takes the slot.
+
+        The hold row is locked first, so a hold is only ever converted by
+        one booking. Call this in the transaction creating the appointment.
+
+        Raises:
+            ValidationError: If the hold is unknown, expired or for another slot
+        """
+        self.env.cr.execute(
+            f"SELECT id FROM {self._table} WHERE token = %s AND expires_at > %s FOR UPDATE",
+            [token, fields.Datetime.now()],
+        )
+        row = self.env.cr.fetchone()
+        hold = self.browse(row[0] if row else [])
+        if not hold or hold.service_id != service or hold.start_datetime != start:
+            raise ValidationError(_('Your hold on this time slot has expired. Please select a slot again.'))
+        hold.unlink()
+
+    @api.model
+    @instrumented_cron
+    def _cron_purge_expired_holds(self):
+        """Delete expired holds in one statement driven by the expiry index."""
+        self.env.cr.execute(
+            f"DELETE FROM {self._table} WHERE expires_at <= %s RETURNING service_id, start_datetime",
+            [fields.Datetime.now()],
+        )
+        released = self.env.cr.fetchall()
+        if released:
+            # Slots of expired holds are free again
+            Service = self.env['external.appointment.service']
+            Service.browse(list({service_id for service_id, start in released}))._invalidate_availability_cache()
+            self._queue_snapshot_refresh([(Service.browse(service_id), start) for service_id, start in released])
+        _logger.info(f"Purged {len(released)} expired slot holds")
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields
+from odoo.tools.sql import create_index
+
+
+class ExternalAppointmentSlotSnapshot(models.Model):
+    """Precomputed free slot of a service using availability snapshots.
+
+    Rows are derived data, maintained by
+    ``external.appointment.service._refresh_availability_snapshot``. Days
+    whose bookings or holds changed are recorded in a side table and
+    rebuilt by the snapshot cron, outside the transaction that changed them.
+    """
+    _name = 'external.appointment.slot.snapshot'
+    _description = 'Availability Snapshot Slot'
+    _order = 'service_id, slot_start'
+    _log_access = False
+
+    _dirty_table = 'external_appointment_slot_snapshot_dirty'
+
+    service_id = fields.Many2one(
+        'external.appointment.service',
+        string='Service',
+        required=True,
+        ondelete='cascade'
+    )
+
+    slot_start = fields.Datetime(
+        string='Start',
+        required=True
+    )
+
+    slot_end = fields.Datetime(
+        string='End',
+        required=True
+    )
+
+    capacity = fields.Integer(
+        string='Capacity',
+        default=1
+    )
+
+    def init(self):
+        """Create the index serving availability reads as one range scan, and the dirty day table."""
+        super().init()
+        create_index(
+            self.env.cr,
+            'external_appointment_slot_snapshot_service_start_index',
+            self._table,
+            ['service_id', 'slot_start'],
+        )
+        self.env.cr.execute(f"""
+            CREATE TABLE IF NOT EXISTS {self._dirty_table} (
+                service_id integer NOT NULL,
+                day date NOT NULL,
+                PRIMARY KEY (service_id, day)
+            )
+        """)
@@ -2,6 +2,8 @@
 
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError, UserError
+from odoo.addons.external_appointment_scheduler.tools.metrics import instrumented_cron
+from datetime import timedelta
 import secrets
 import logging
 
@@ -370,6 +372,7 @@ class ExternalCalendarConfig(models.Model):
             return None
     
     @api.model
+    @instrumented_cron
     def _cron_refresh_tokens(self):
         """Cron job to refresh expiring OAuth tokens."""
         configs = self.search([('active', '=', True)])
@@ -385,12 +388,13 @@ class ExternalCalendarConfig(models.Model):
                     _logger.error(f"Failed to refresh token for config {config.id}: {e}")
     
     @api.model
+    @instrumented_cron
     def _cron_refresh_webhooks(self):
         """Cron job to refresh expiring webhooks."""
         # Refresh webhooks that expire in next 24 hours
         cutoff = fields.Datetime.now() + fields.timedelta(hours=24)
         
-        configs = self.search([
+        configs = self.with_context(calendar_priority='background').search([
             ('active', '=', True),
             ('webhook_expiration', '!=', False),
             ('webhook_expiration', '<', cutoff)
@@ -403,6 +407,55 @@ class ExternalCalendarConfig(models.Model):
             except Exception as e:
                 _logger.error(f"Failed to refresh webhook for config {config.id}: {e}")
 
+    @api.model
+    def _attach_profile(self, target, stats, report, context):
+        """Store a profile of an API request or cron run as attachments.
+
+        The profile goes to the configuration of the requested service, if
+        any, otherwise to the active configuration (or to the model alone
+        when there is no configuration).
+
+        Args:
+            target (str): Profiled endpoint or cron
+            stats (bytes): cProfile stats, in the ``.prof`` format of `pstats`
+            report (str): Text report with the SQL query log
+            context (dict): Request parameters
+
+        Returns:
+            ir.attachment: The stats and report attachments
+        """
+        config = self.browse()
+        service_id = context.get('service_id')
+        if service_id and str(service_id).isdigit():
+            config = self.env['external.appointment.service'].browse(int(service_id)).exists().provider_id
+        if not config:
+            config = self.search([('is_active', '=', True)], limit=1) or self.search([], limit=1)
+        name = 'profile-%s-%s' % (target, fields.Datetime.now().strftime('%Y%m%d-%H%M%S'))
+        attachments = self.env['ir.attachment'].create([{
+            'name': name + '.prof',
+            'raw': stats,
+            'mimetype': 'application/octet-stream',
+            'res_model': self._name,
+            'res_id': config.id,
+        }, {
+            'name': name + '.txt',
+            'raw': report.encode(),
+            'mimetype': 'text/plain',
+            'res_model': self._name,
+            'res_id': config.id,
+        }])
+        _logger.info("Stored profile of %s on calendar config %s", target, config.id)
+        return attachments
+
+    @api.autovacuum
+    def _gc_profiles(self, days=14):
+        """Delete stored profiles after two weeks."""
+        self.env['ir.attachment'].sudo().search([
+            ('res_model', '=', self._name),
+            ('name', '=like', 'profile-%'),
+            ('create_date', '<', fields.Datetime.now() - timedelta(days=days)),
+        ]).unlink()
+
     @api.constrains('provider', 'is_active')
     def _check_single_active_per_provider(self):
         """Ensure only one configuration per provider is active at a time."""
@@ -452,4 +505,18 @@ class ExternalCalendarConfig(models.Model):
                 if others:
                     others.write({'is_active': False})
 
-        return super(ExternalCalendarConfig, self).write(vals)
+        result = super(ExternalCalendarConfig, self).write(vals)
+        self._invalidate_availability_cache()
+        return result
+
+    def unlink(self):
+        """Override unlink to drop cached availability of the linked services."""
+        self._invalidate_availability_cache()
+        return super(ExternalCalendarConfig, self).unlink()
+
+    def _invalidate_availability_cache(self):
+        """Drop cached availability of services using these configurations."""
+        if self.ids:
+            self.env['external.appointment.service'].sudo().with_context(active_test=False).search([
+                ('provider_id', 'in', self.ids),
+            ])._invalidate_availability_cache()
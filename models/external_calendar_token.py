@@ -148,4 +148,19 @@ class ExternalCalendarToken(models.Model):
                 _logger.info(f"Removing {len(existing_tokens)} existing tokens for config {vals['config_id']}")
                 existing_tokens.unlink()
         
-        return super(ExternalCalendarToken, self).create(vals)
+        token = super(ExternalCalendarToken, self).create(vals)
+        token.config_id._invalidate_availability_cache()
+        return token
+
+    def write(self, vals):
+        """Override write to drop availability cached with the previous credentials."""
+        result = super(ExternalCalendarToken, self).write(vals)
+        self.config_id._invalidate_availability_cache()
+        return result
+
+    def unlink(self):
+        """Override unlink to drop availability cached with these credentials."""
+        configs = self.config_id
+        result = super(ExternalCalendarToken, self).unlink()
+        configs._invalidate_availability_cache()
+        return result
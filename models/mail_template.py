@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models
+from odoo.addons.external_appointment_scheduler.tools.tracing import span
+
+
+class MailTemplate(models.Model):
+    _inherit = 'mail.template'
+
+    def send_mail(self, res_id, *args, **kwargs):
+        """Override send_mail to time rendering and sending within the current trace."""
+        with span('mail send', template=self.id, model=self.model):
+            return super().send_mail(res_id, *args, **kwargs)
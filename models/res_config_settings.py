@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 
 from odoo import models, fields, api
+from odoo.addons.external_appointment_scheduler.models.external_appointment import DEFAULT_UPLOAD_TYPES
 
 
 class ResConfigSettings(models.TransientModel):
@@ -100,3 +101,135 @@ class ResConfigSettings(models.TransientModel):
         config_parameter='external_appointment_scheduler.cache_ttl',
         help='How long to cache availability results (5 minutes default)'
     )
+    
+    # Provider circuit breaker
+    appointment_breaker_failures = fields.Integer(
+        string='Provider Failures Before Opening Circuit',
+        default=5,
+        config_parameter='external_appointment_scheduler.breaker_failures',
+        help='Consecutive failed or slow provider calls after which the provider '
+             'is no longer called and last known good availability is served'
+    )
+    
+    appointment_breaker_latency_ms = fields.Integer(
+        string='Provider Latency Threshold (ms)',
+        default=3000,
+        config_parameter='external_appointment_scheduler.breaker_latency_ms',
+        help='Provider calls slower than this count as failures'
+    )
+    
+    appointment_breaker_reset_seconds = fields.Integer(
+        string='Provider Retry Delay (seconds)',
+        default=30,
+        config_parameter='external_appointment_scheduler.breaker_reset_seconds',
+        help='Time before a single trial call is sent to a provider with an open circuit'
+    )
+    
+    appointment_availability_budget_ms = fields.Integer(
+        string='Availability Time Budget (ms)',
+        default=5000,
+        config_parameter='external_appointment_scheduler.availability_budget_ms',
+        help='Maximum time spent computing availability for one request; when '
+             'exceeded, partial results are returned with a continuation cursor. '
+             '0 disables the limit'
+    )
+    
+    appointment_google_quota_per_minute = fields.Integer(
+        string='Google API Quota (requests/minute)',
+        default=600,
+        config_parameter='external_appointment_scheduler.google_quota_per_minute',
+        help='Google Calendar API requests per minute allowed to this database, '
+             'shared between workers. Booking calls are served first when quota is tight'
+    )
+    
+    appointment_booking_async = fields.Boolean(
+        string='Asynchronous Bookings',
+        config_parameter='external_appointment_scheduler.booking_async',
+        help='Answer API bookings with 202 Accepted once the slot is reserved and '
+             'confirm, sync and notify in the background. Clients can also opt '
+             'in per request with a "Prefer: respond-async" header'
+    )
+    
+    appointment_idempotency_ttl_hours = fields.Integer(
+        string='Idempotency Key Lifetime (hours)',
+        default=24,
+        config_parameter='external_appointment_scheduler.idempotency_ttl_hours',
+        help='How long booking responses are kept for requests retried with '
+             'the same Idempotency-Key header'
+    )
+    
+    appointment_hold_minutes = fields.Integer(
+        string='Slot Hold Duration (minutes)',
+        default=5,
+        config_parameter='external_appointment_scheduler.hold_minutes',
+        help='How long a slot selected in the booking widget stays reserved '
+             'for the customer filling in the booking form'
+    )
+    
+    appointment_upload_max_mb = fields.Integer(
+        string='Maximum Attachment Size (MB)',
+        default=10,
+        config_parameter='external_appointment_scheduler.upload_max_mb',
+        help='Largest file customers may attach to a booking'
+    )
+    
+    appointment_upload_max_files = fields.Integer(
+        string='Maximum Attachments per Booking',
+        default=5,
+        config_parameter='external_appointment_scheduler.upload_max_files'
+    )
+    
+    appointment_upload_allowed_types = fields.Char(
+        string='Allowed Attachment Types',
+        default=DEFAULT_UPLOAD_TYPES,
+        config_parameter='external_appointment_scheduler.upload_allowed_types',
+        help='Comma-separated file extensions or MIME types accepted with bookings; '
+             '"*" accepts any type, empty restores the default list'
+    )
+    
+    appointment_log_levels = fields.Char(
+        string='API Log Levels',
+        config_parameter='external_appointment_scheduler.log_levels',
+        help='Level of successful request events per endpoint, e.g. '
+             '"availability=DEBUG,book=INFO". Endpoints not listed log at INFO; '
+             'errors always log at ERROR'
+    )
+    
+    appointment_log_sample_rate = fields.Float(
+        string='API Log Sample Rate',
+        default=1.0,
+        config_parameter='external_appointment_scheduler.log_sample_rate',
+        help='Share of successful request and provider call events logged '
+             '(0.1 logs one in ten); errors are always logged'
+    )
+    
+    appointment_metrics_token = fields.Char(
+        string='Metrics Token',
+        config_parameter='external_appointment_scheduler.metrics_token',
+        help='Bearer token required to scrape /api/appointments/metrics; '
+             'the endpoint is disabled while empty'
+    )
+    
+    appointment_trace_export = fields.Char(
+        string='Trace Export',
+        config_parameter='external_appointment_scheduler.trace_export',
+        help='Where request traces are exported as Zipkin JSON spans: a collector URL '
+             '(e.g. http://localhost:9411/api/v2/spans) or file:/path/to/spans.jsonl. '
+             'Leave empty to only propagate correlation IDs'
+    )
+    
+    appointment_trace_sample_rate = fields.Float(
+        string='Trace Sample Rate',
+        default=1.0,
+        config_parameter='external_appointment_scheduler.trace_sample_rate',
+        help='Share of requests and cron runs whose spans are exported'
+    )
+    
+    appointment_profile_targets = fields.Char(
+        string='Profiled Endpoints',
+        config_parameter='external_appointment_scheduler.profile_targets',
+        help='Comma-separated endpoints (e.g. "availability,book"), cron method names, '
+             'or "cron" for all crons, run under the profiler. Profiles are attached to '
+             'the calendar configuration. Administrators can also profile a single request '
+             'with the X-Appointment-Profile header'
+    )
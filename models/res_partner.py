@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, api
+from odoo.tools.sql import create_index
+from odoo.addons.external_appointment_scheduler.tools.cache import get_cache, invalidate
+
+# Partner id per normalized email, for customers booking through the API.
+# Entries are dropped when a partner's email changes or it is archived or deleted.
+_booking_partner_cache = get_cache('booking_partner', ttl=3600, max_size=4096)
+
+
+def normalize_email(email):
+    """Return the lookup form of an email address (stripped, lower case)."""
+    return (email or '').strip().lower()
+
+
+class ResPartner(models.Model):
+    _inherit = 'res.partner'
+
+    # One row per normalized email a booking created a partner for, written
+    # by every booking creating one to serialize them (see _resolve_booking_partners)
+    _booking_email_table = 'external_appointment_booking_email'
+
+    def init(self):
+        """Create the case-insensitive email index used to resolve booking customers."""
+        super().init()
+        create_index(
+            self.env.cr,
+            'res_partner_lower_email_index',
+            self._table,
+            ['lower(email)'],
+            where='email IS NOT NULL',
+        )
+        self.env.cr.execute(f"""
+            CREATE TABLE IF NOT EXISTS {self._booking_email_table} (
+                email varchar PRIMARY KEY
+            )
+        """)
+
+    def write(self, vals):
+        """Override write to drop cached booking partners whose email or status changes."""
+        if {'email', 'active'} & set(vals):
+            self._invalidate_booking_partners()
+        return super().write(vals)
+
+    def unlink(self):
+        """Override unlink to drop cached booking partners."""
+        self._invalidate_booking_partners()
+        return super().unlink()
+
+    def _invalidate_booking_partners(self):
+        """Drop the cached lookups of these partners' emails in every worker."""
+        for email in {normalize_email(partner.email) for partner in self}:
+            if email:
+                invalidate(self.env.cr, 'booking_partner', email)
+
+    @api.model
+    def _resolve_booking_partners(self, customers):
+        """Find or create the partners of booking customers, identified by email.
+
+        Emails are compared case-insensitively through the ``lower(email)``
+        index, with recently resolved emails served from a per-worker LRU.
+        Before creating the partner of an unknown email, the booking writes
+        the email's row in ``external_appointment_booking_email``. A
+        concurrent booking of the same new customer waits for that row,
+        then fails with a serialization error, and Odoo retries it on a
+        snapshot that includes the partner created by the first one, so
+        bookings never create two partners for one email. An existing
+        partner's phone is only filled in when it has none.
+
+        Args:
+            customers (list): dicts with ``email`` and optional ``name`` and
+                ``phone``
+
+        Returns:
+            list: res.partner records in the order of `customers` (empty
+            recordset for customers without email)
+        """
+        dbname = self.env.cr.dbname
+        emails = {normalize_email(customer.get('email')) for customer in customers} - {''}
+        partner_ids = {}
+        for email in emails:
+            partner_id = _booking_partner_cache.get((dbname, email))
+            if partner_id:
+                partner_ids[email] = partner_id
+        missing = sorted(emails - set(partner_ids))
+        if missing:
+            found = self._find_partners_by_email(missing)
+            partner_ids.update(found)
+            unknown = sorted(set(missing) - set(found))
+            if unknown:
+                # A write, not just a lock: a transaction that waited for it
+                # must not go on with a snapshot missing the new partner.
+                # Sorted rows: concurrent batches never wait on each other in a cycle.
+                self.env.cr.execute(f"""
+                    INSERT INTO {self._booking_email_table} (email)
+                    SELECT e FROM unnest(%s::varchar[]) AS e ORDER BY e
+                    ON CONFLICT (email) DO UPDATE SET email = EXCLUDED.email
+                """, [unknown])
+            to_create = {}
+            for customer in customers:
+                email = normalize_email(customer.get('email'))
+                if email in missing and email not in found and email not in to_create:
+                    to_create[email] = {
+                        'name': customer.get('name') or customer['email'].strip(),
+                        'email': customer['email'].strip(),
+                        'phone': customer.get('phone'),
+                    }
+            if to_create:
+                created = self.create(list(to_create.values()))
+                partner_ids.update(zip(to_create, created.ids))
+            # Cache only committed ids; a rolled-back partner must not be served
+            resolved = {email: partner_ids[email] for email in missing}
+            self.env.cr.postcommit.add(
+                lambda: [_booking_partner_cache.set((dbname, email), pid) for email, pid in resolved.items()]
+            )
+
+        partners = []
+        for customer in customers:
+            email = normalize_email(customer.get('email'))
+            partner = self.browse(partner_ids.get(email, []))
+            if partner and customer.get('phone') and not partner.phone:
+                partner.phone = customer['phone']
+            partners.append(partner)
+        return partners
+
+    @api.model
+    def _find_partners_by_email(self, emails):
+        """Return {normalized email: partner id} of active partners, oldest first.
+
+        Args:
+            emails (list): Normalized email addresses
+        """
+        if not emails:
+            return {}
+        self.flush_model(['email', 'active'])
+        self.env.cr.execute("""
+            SELECT DISTINCT ON (lower(email)) lower(email), id
+              FROM res_partner
+             WHERE lower(email) = ANY(%s) AND email IS NOT NULL AND active
+             ORDER BY lower(email), id
+        """, [list(emails)])
+        return dict(self.env.cr.fetchall())
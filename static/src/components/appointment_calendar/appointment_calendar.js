@@ -9,6 +9,7 @@
         container.innerHTML = '<div class="ea-calendar-widget"><div class="ea-slot-picker" aria-live="polite">Loading availability...</div><div class="ea-booking-form"></div></div>';
         var slotPickerEl = container.querySelector('.ea-slot-picker');
         var bookingFormEl = container.querySelector('.ea-booking-form');
+        var currentHold = null;
 
         // Check if API is available
         if (typeof window.AppointmentAPI === 'undefined') {
@@ -44,8 +45,23 @@
                 btn.dataset.start = slot.start;
                 btn.dataset.end = slot.end;
                 btn.addEventListener('click', function () {
-                    // render booking form
-                    renderBookingForm(bookingFormEl, serviceId, slot);
+                    // hold the slot, then render booking form
+                    if (currentHold) {
+                        AppointmentAPI.releaseHold(currentHold);
+                        currentHold = null;
+                    }
+                    AppointmentAPI.holdSlot(serviceId, slot.start).then(function (hold) {
+                        if (!hold || !hold.hold_token) {
+                            btn.disabled = true;
+                            bookingFormEl.innerHTML = '<div class="alert alert-warning">' + ((hold && hold.error) || 'This time slot is no longer available.') + '</div>';
+                            return;
+                        }
+                        currentHold = hold.hold_token;
+                        renderBookingForm(bookingFormEl, serviceId, slot, hold.hold_token);
+                    }).catch(function (err) {
+                        console.error(err);
+                        renderBookingForm(bookingFormEl, serviceId, slot, null);
+                    });
                 });
                 slotPickerEl.appendChild(btn);
             });
@@ -55,7 +71,7 @@
         });
     }
 
-    function renderBookingForm(container, serviceId, slot) {
+    function renderBookingForm(container, serviceId, slot, holdToken) {
         container.innerHTML = '';
         var html = '';
         html += '<form class="ea-booking-form-inner">';
@@ -86,6 +102,7 @@
                 slot_id: slot.id || null,
                 start: slot.start,
                 end: slot.end,
+                hold_token: holdToken || null,
                 customer_name: formData.get('name'),
                 customer_email: formData.get('email'),
                 customer_phone: formData.get('phone'),
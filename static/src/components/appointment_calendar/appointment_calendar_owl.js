@@ -19,6 +19,7 @@ export class AppointmentCalendar extends Component {
         this.state = useState({
             slots: [],
             selectedSlot: null,
+            holdToken: null,
             loading: true,
             error: null,
             bookingComplete: false,
@@ -60,10 +61,45 @@ export class AppointmentCalendar extends Component {
         }
     }
 
-    onSlotSelected(slot) {
+    async onSlotSelected(slot) {
+        await this.releaseHold();
+        try {
+            // Hold the slot while the booking form is filled in
+            const response = await fetch('/api/appointments/hold', {
+                method: 'POST',
+                credentials: 'same-origin',
+                headers: {
+                    'Content-Type': 'application/json',
+                    'Accept': 'application/json'
+                },
+                body: JSON.stringify({ service_id: this.props.serviceId, start: slot.start })
+            });
+            const hold = await response.json();
+            if (response.status === 409) {
+                this.notification.add(hold.error || "This time slot is no longer available.", {
+                    type: "warning",
+                });
+                await this.loadAvailability();
+                return;
+            }
+            this.state.holdToken = hold.hold_token || null;
+        } catch (error) {
+            console.error("Failed to hold slot:", error);
+        }
         this.state.selectedSlot = slot;
     }
 
+    async releaseHold() {
+        if (this.state.holdToken) {
+            const token = this.state.holdToken;
+            this.state.holdToken = null;
+            await fetch(`/api/appointments/hold/${encodeURIComponent(token)}`, {
+                method: 'DELETE',
+                credentials: 'same-origin'
+            });
+        }
+    }
+
     async onBookingSubmitted(bookingData) {
         try {
             const payload = {
@@ -71,6 +107,7 @@ export class AppointmentCalendar extends Component {
                 slot_id: bookingData.slot.id || null,
                 start: bookingData.slot.start,
                 end: bookingData.slot.end,
+                hold_token: this.state.holdToken,
                 customer_name: bookingData.name,
                 customer_email: bookingData.email,
                 customer_phone: bookingData.phone,
@@ -90,6 +127,7 @@ export class AppointmentCalendar extends Component {
             const result = await response.json();
 
             if (result.success) {
+                this.state.holdToken = null;
                 this.state.bookingComplete = true;
                 this.state.bookingReference = result.reference || result.id;
                 this.notification.add("Appointment booked successfully!", {
@@ -106,8 +144,9 @@ export class AppointmentCalendar extends Component {
         }
     }
 
-    onBackToSlots() {
+    async onBackToSlots() {
         this.state.selectedSlot = null;
+        await this.releaseHold();
     }
 
     async onRefresh() {
@@ -1,7 +1,7 @@
 (function () {
     // Simple booking form helper. Used by appointment_calendar.
     window.EABookingForm = {
-        render: function (container, serviceId, slot, onBooked) {
+        render: function (container, serviceId, slot, onBooked, holdToken) {
             container.innerHTML = '';
             var html = '';
             html += '<form class="ea-booking-form-inner">';
@@ -32,6 +32,7 @@
                     slot_id: slot.id || null,
                     start: slot.start,
                     end: slot.end,
+                    hold_token: holdToken || null,
                     customer_name: formData.get('name'),
                     customer_email: formData.get('email'),
                     customer_phone: formData.get('phone'),
@@ -15,6 +15,21 @@
                 return data;
             });
         },
+        holdSlot: function (serviceId, start) {
+            // Reserve the slot while the booking form is filled in
+            return fetch('/api/appointments/hold', {
+                method: 'POST',
+                credentials: 'same-origin',
+                headers: { 'Content-Type': 'application/json', 'Accept': 'application/json' },
+                body: JSON.stringify({ service_id: parseInt(serviceId, 10), start: start })
+            }).then(function (r) { return r.json(); });
+        },
+        releaseHold: function (holdToken) {
+            return fetch('/api/appointments/hold/' + encodeURIComponent(holdToken), {
+                method: 'DELETE',
+                credentials: 'same-origin'
+            });
+        },
         bookAppointment: function (payload) {
             console.log('[AppointmentAPI] Booking appointment with payload:', payload);
             return fetch('/api/appointments/book', {
@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+
+"""Framework-agnostic helpers shared by models, controllers and adapters.
+
+Modules in this package must not import models or controllers so they can
+be imported from anywhere without circular import issues.
+"""
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+
+"""Small in-process caches used by the appointment scheduler.
+
+Each cache is a thread-safe LRU with a per-entry time-to-live. Keys are
+always tuples starting with the database name so multi-database servers
+never mix values.
+
+Odoo runs several worker processes, possibly on several nodes, each with
+its own copy of these caches. Data changes therefore go through
+:func:`invalidate`, which drops matching entries locally right away and,
+once the transaction commits, broadcasts the invalidation with Postgres
+``NOTIFY``. Every process runs a small listener thread (in the spirit of
+the bus dispatcher) that applies invalidations received from the others.
+The TTL only bounds staleness if the listener is unavailable.
+"""
+
+from collections import OrderedDict
+import json
+import logging
+import os
+import select
+import threading
+import time
+
+import odoo
+from odoo import sql_db
+
+__all__ = ["LocalCache", "get_cache", "invalidate", "cache_stats"]
+
+_logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+# Postgres channel used to broadcast invalidations between processes
+CHANNEL = 'external_appointment_cache'
+
+# NOTIFY payloads are limited to 8000 bytes
+_MAX_PAYLOAD = 7000
+
+
+class LocalCache:
+    """Thread-safe LRU cache with a time-to-live per entry."""
+
+    def __init__(self, name, ttl=300, max_size=2048):
+        self.name = name
+        self.ttl = ttl
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """Return the cached value for `key` or `default` if absent/expired."""
+        _ensure_listener()
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        """Store `value` under `key` for `ttl` seconds (default: cache TTL)."""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def pop(self, key):
+        """Remove `key` from the cache if present."""
+        with self._lock:
+            if self._data.pop(key, _MISSING) is not _MISSING:
+                self.invalidations += 1
+
+    def pop_prefix(self, prefix):
+        """Remove every entry whose key starts with the tuple `prefix`."""
+        size = len(prefix)
+        with self._lock:
+            keys = [key for key in self._data if key[:size] == prefix]
+            for key in keys:
+                del self._data[key]
+            self.invalidations += len(keys)
+
+    def clear(self):
+        """Drop every entry."""
+        with self._lock:
+            self.invalidations += len(self._data)
+            self._data.clear()
+
+    def stats(self):
+        """Return the hit, miss, invalidation and eviction counters of the cache."""
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+            'invalidations': self.invalidations,
+            'evictions': self.evictions,
+        }
+
+    def __len__(self):
+        return len(self._data)
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(name, ttl=300, max_size=2048):
+    """Return the process-wide cache called `name`, creating it on first use."""
+    cache = _caches.get(name)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.setdefault(name, LocalCache(name, ttl=ttl, max_size=max_size))
+    return cache
+
+
+def cache_stats():
+    """Return the counters of every cache of this process, keyed by cache name."""
+    stats = {name: cache.stats() for name, cache in _caches.items()}
+    stats['_listener'] = {
+        'running': _listener is not None and _listener.is_alive() and _listener_pid == os.getpid(),
+        'received': _listener.received if _listener else 0,
+    }
+    return stats
+
+
+def invalidate(cr, name, *prefix):
+    """Invalidate entries of cache `name` in every process once `cr` commits.
+
+    Entries whose key starts with ``(cr.dbname, *prefix)`` are dropped from
+    the local cache immediately; the invalidation is then broadcast to the
+    other workers after commit, so they never reload pre-commit data.
+
+    Args:
+        cr: Database cursor of the transaction making the change
+        name (str): Cache name, as given to :func:`get_cache`
+        prefix: JSON-serializable key components after the database name
+    """
+    key_prefix = (cr.dbname,) + prefix
+    get_cache(name).pop_prefix(key_prefix)
+    pending = cr.postcommit.data.setdefault('external_appointment_cache.invalidations', [])
+    if not pending:
+        cr.postcommit.add(lambda: _broadcast(pending))
+    if [name, list(key_prefix)] not in pending:
+        pending.append([name, list(key_prefix)])
+
+
+def _broadcast(invalidations):
+    """Send committed invalidations to every process over NOTIFY."""
+    payload = json.dumps(invalidations)
+    if len(payload) > _MAX_PAYLOAD:
+        # Too many keys: fall back to dropping whole databases per cache
+        scopes = sorted({(name, prefix[0]) for name, prefix in invalidations})
+        payload = json.dumps([[name, [dbname]] for name, dbname in scopes])
+    try:
+        with sql_db.db_connect('postgres').cursor() as cr:
+            cr.execute("SELECT pg_notify(%s, %s)", [CHANNEL, payload])
+    except Exception as e:
+        _logger.warning(f"Failed to broadcast cache invalidation: {e}")
+
+
+def _apply(invalidations):
+    """Apply invalidations received from NOTIFY (including our own)."""
+    for name, prefix in invalidations:
+        cache = _caches.get(name)
+        if cache is not None:
+            cache.pop_prefix(tuple(prefix))
+
+
+class _InvalidationListener(threading.Thread):
+    """Daemon thread applying invalidations broadcast by other processes."""
+
+    TIMEOUT = 50
+
+    def __init__(self):
+        super().__init__(name='external_appointment_cache_listener', daemon=True)
+        self.received = 0
+
+    def run(self):
+        while True:
+            try:
+                self._listen()
+            except Exception as e:
+                _logger.warning(f"Cache invalidation listener error, reconnecting: {e}")
+                time.sleep(self.TIMEOUT / 10)
+
+    def _listen(self):
+        with sql_db.db_connect('postgres').cursor() as cr:
+            conn = cr._cnx
+            cr.execute("LISTEN %s" % CHANNEL)
+            cr.commit()
+            # Invalidations sent while we were not listening are lost
+            for cache in list(_caches.values()):
+                cache.clear()
+            while True:
+                if select.select([conn], [], [], self.TIMEOUT) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    notification = conn.notifies.pop(0)
+                    self.received += 1
+                    try:
+                        _apply(json.loads(notification.payload))
+                    except ValueError:
+                        _logger.warning(f"Ignoring malformed cache invalidation: {notification.payload!r}")
+
+
+_listener = None
+_listener_pid = None
+_listener_lock = threading.Lock()
+
+
+def _ensure_listener():
+    """Start the listener thread of the current process if needed.
+
+    Checked on every cache read because prefork workers do not inherit the
+    threads of the process they were forked from.
+    """
+    global _listener, _listener_pid
+    if _listener_pid == os.getpid() or getattr(odoo, 'evented', False):
+        return
+    with _listener_lock:
+        if _listener_pid != os.getpid():
+            _listener = _InvalidationListener()
+            _listener.start()
+            _listener_pid = os.getpid()
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+"""Circuit breaker guarding calls to calendar providers.
+
+After `failure_threshold` consecutive failures the breaker opens and calls
+fail immediately with :class:`CircuitOpenError` instead of waiting for a
+provider that is down. Calls slower than `latency_threshold` seconds count
+as failures even when they succeed, so a provider that only got slow trips
+the breaker too. After `reset_timeout` seconds one trial call is let
+through (half-open); its outcome closes or re-opens the breaker.
+"""
+
+import threading
+import time
+
+__all__ = ["CircuitBreaker", "CircuitOpenError", "ProviderUnavailable", "get_breaker"]
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class ProviderUnavailable(Exception):
+    """The calendar provider could not be reached or answered with an error."""
+
+
+class CircuitOpenError(ProviderUnavailable):
+    """The breaker is open: the provider is not called at all."""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a latency threshold."""
+
+    # Exceptions caused by our own limits (time budget, client-side quota)
+    # rather than by the provider; they neither trip nor reset the breaker.
+    neutral_exceptions = ()
+
+    def __init__(self, name, failure_threshold=5, latency_threshold=3.0, reset_timeout=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.latency_threshold = latency_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Return True if a call may be attempted now."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self, duration):
+        """Record a completed call that took `duration` seconds."""
+        if self.latency_threshold and duration > self.latency_threshold:
+            self.record_failure()
+            return
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        """Record a failed (or too slow) call."""
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def call(self, func, *args, **kwargs):
+        """Call `func` through the breaker.
+
+        Raises:
+            CircuitOpenError: If the breaker is open
+        """
+        if not self.allow():
+            raise CircuitOpenError(f"Circuit {self.name} is open")
+        start = time.monotonic()
+        try:
+            result = func(*args, **kwargs)
+        except self.neutral_exceptions:
+            with self._lock:
+                self._trial_running = False
+            raise
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success(time.monotonic() - start)
+        return result
+
+    def stats(self):
+        """Return the current state of the breaker."""
+        return {'state': self.state, 'failures': self.failures}
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(key, failure_threshold=5, latency_threshold=3.0, reset_timeout=30):
+    """Return the process-wide breaker for `key`, applying current thresholds."""
+    breaker = _breakers.get(key)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.setdefault(key, CircuitBreaker(str(key)))
+    breaker.failure_threshold = failure_threshold
+    breaker.latency_threshold = latency_threshold
+    breaker.reset_timeout = reset_timeout
+    return breaker
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+"""Time budgets for request processing.
+
+A :class:`Deadline` is created when a request starts and passed down to the
+code doing the work (slot generation loops, provider HTTP calls), which
+checks it and stops with :class:`DeadlineExceeded` when the budget is spent,
+so a slow provider or a huge window cannot tie up a worker.
+"""
+
+import time
+
+__all__ = ["Deadline", "DeadlineExceeded"]
+
+
+class DeadlineExceeded(Exception):
+    """The time budget ran out before the work was complete.
+
+    Attributes:
+        resume_at: Where the interrupted work should continue (e.g. the
+            first datetime not processed), if known
+    """
+
+    def __init__(self, resume_at=None):
+        super().__init__(f"Time budget exceeded (resume at {resume_at})")
+        self.resume_at = resume_at
+
+
+class Deadline:
+    """Point in time after which work should stop."""
+
+    def __init__(self, budget_seconds):
+        self.budget = budget_seconds
+        self.expires_at = time.monotonic() + budget_seconds
+
+    @classmethod
+    def from_ms(cls, budget_ms):
+        """Return a deadline `budget_ms` milliseconds from now, or None if not positive."""
+        return cls(budget_ms / 1000) if budget_ms and budget_ms > 0 else None
+
+    def remaining(self):
+        """Return the seconds left, never negative."""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        """Return True once the budget is spent."""
+        return time.monotonic() >= self.expires_at
+
+    def check(self, resume_at=None):
+        """Raise :class:`DeadlineExceeded` if the budget is spent."""
+        if self.expired():
+            raise DeadlineExceeded(resume_at)
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+
+"""Low-overhead metrics shared by all workers, in Prometheus text format.
+
+Each process accumulates counters and latency histograms in memory (a dict
+update under a lock per observation). At most every `FLUSH_INTERVAL`
+seconds, the deltas are added to an UNLOGGED table of the database in one
+UPSERT, so the table holds totals across workers and nodes, and any worker
+can render them for a scrape. Histograms are stored as their cumulative
+``_bucket``, ``_sum`` and ``_count`` series, as in the exposition format.
+"""
+
+from contextlib import contextmanager
+import functools
+import logging
+import threading
+import time
+
+from odoo import sql_db
+from odoo.addons.external_appointment_scheduler.tools.cache import cache_stats
+from odoo.addons.external_appointment_scheduler.tools.single_flight import flight_stats
+from odoo.addons.external_appointment_scheduler.tools import profiling, tracing
+
+__all__ = [
+    "TABLE", "observe", "increment", "timed", "instrumented_cron",
+    "flush", "render", "LATENCY_BUCKETS",
+]
+
+_logger = logging.getLogger(__name__)
+
+# Table holding the totals of every series, created by the
+# external.appointment.metrics model
+TABLE = 'external_appointment_metrics'
+
+# Seconds between two flushes of a process
+FLUSH_INTERVAL = 10
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_pending = {}
+_kinds = {}
+_lock = threading.Lock()
+_last_flush = {}
+_reported = {}
+
+
+def _series(name, labels):
+    """Return the exposition key of a series, e.g. ``name{a="1",b="2"}``."""
+    if not labels:
+        return name
+    pairs = ','.join('%s="%s"' % (key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                     for key, value in sorted(labels.items()))
+    return '%s{%s}' % (name, pairs)
+
+
+def _add(dbname, name, kind, series, value):
+    pending = _pending.setdefault(dbname, {})
+    pending[series] = pending.get(series, 0) + value
+    _kinds[series] = (name, kind)
+
+
+def increment(dbname, name, value=1, **labels):
+    """Add `value` to the counter `name` of database `dbname`."""
+    series = _series(name, labels)
+    with _lock:
+        _add(dbname, name, 'counter', series, value)
+    _maybe_flush(dbname)
+
+
+def observe(dbname, name, seconds, **labels):
+    """Record one duration in the latency histogram `name`."""
+    with _lock:
+        for bound in LATENCY_BUCKETS:
+            if seconds <= bound:
+                _add(dbname, name, 'histogram', _series(name + '_bucket', dict(labels, le=bound)), 1)
+        _add(dbname, name, 'histogram', _series(name + '_bucket', dict(labels, le='+Inf')), 1)
+        _add(dbname, name, 'histogram', _series(name + '_sum', labels), seconds)
+        _add(dbname, name, 'histogram', _series(name + '_count', labels), 1)
+    _maybe_flush(dbname)
+
+
+@contextmanager
+def timed(dbname, name, **labels):
+    """Time the block into histogram `name`, labelled with its outcome.
+
+    The block may set ``outcome`` in the yielded dict, or ``discard`` to
+    record nothing; an exception escaping it records ``error``.
+    """
+    result = {'outcome': 'ok'}
+    start = time.perf_counter()
+    try:
+        yield result
+    except Exception:
+        result['outcome'] = 'error'
+        raise
+    finally:
+        if not result.get('discard'):
+            observe(dbname, name, time.perf_counter() - start, outcome=result['outcome'], **labels)
+
+
+def instrumented_cron(func):
+    """Decorate a model cron method to record its duration and failures.
+
+    Each run is also traced, so its adapter calls and mail sends are
+    correlated like those of a request, and profiled when ``cron`` or the
+    method name is listed in the profiling targets.
+    """
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        cron = '%s.%s' % (self._name, func.__name__)
+        exporter, sample_rate = tracing.get_trace_settings(self.env)
+        with tracing.start_trace('cron %s' % cron, exporter, sample_rate), \
+                timed(self.env.cr.dbname, 'external_appointment_cron_duration_seconds', cron=cron), \
+                profiling.profiled(self.env, 'cron', func.__name__):
+            return func(self, *args, **kwargs)
+    return wrapper
+
+
+def _collect_process_stats(dbname):
+    """Turn the counters of the local caches and single-flight groups into deltas.
+
+    These are shared by every database of the process, so their counters
+    are reported under the database that flushes first.
+    """
+    sources = [
+        ('cache', cache_stats(), ('hits', 'misses', 'evictions', 'invalidations')),
+        ('single_flight', flight_stats(), ('executions', 'coalesced')),
+    ]
+    for group, stats_by_name, fields in sources:
+        for name, stats in stats_by_name.items():
+            if name.startswith('_'):
+                continue
+            for field in fields:
+                key = (group, name, field)
+                delta = stats[field] - _reported.get(key, 0)
+                if delta > 0:
+                    metric = 'external_appointment_%s_%s_total' % (group, field)
+                    _add(dbname, metric, 'counter', _series(metric, {group: name}), delta)
+                    _reported[key] = stats[field]
+
+
+def _maybe_flush(dbname):
+    if time.monotonic() - _last_flush.get(dbname, 0) >= FLUSH_INTERVAL:
+        flush(dbname)
+
+
+def flush(dbname):
+    """Add the pending deltas of `dbname` to the shared table.
+
+    Deltas are kept for the next flush if the table cannot be written.
+    """
+    with _lock:
+        _last_flush[dbname] = time.monotonic()
+        _collect_process_stats(dbname)
+        pending = _pending.pop(dbname, None)
+        rows = [(series,) + _kinds[series] + (value,) for series, value in pending.items()] if pending else []
+    if not rows:
+        return
+    try:
+        with sql_db.db_connect(dbname).cursor() as cr:
+            # Sorted keys: concurrent flushes lock rows in the same order
+            cr.execute(f"""
+                INSERT INTO {TABLE} AS m (series, name, kind, value)
+                SELECT * FROM unnest(%s::varchar[], %s::varchar[], %s::varchar[], %s::float8[])
+                 ORDER BY 1
+                ON CONFLICT (series) DO UPDATE SET value = m.value + EXCLUDED.value
+            """, [list(column) for column in zip(*sorted(rows))])
+    except Exception as e:
+        _logger.warning("Failed to flush appointment metrics: %s", e)
+        with _lock:
+            merged = _pending.setdefault(dbname, {})
+            for series, _name, _kind, value in rows:
+                merged[series] = merged.get(series, 0) + value
+
+
+def _render_order(row):
+    """Sort key placing histogram buckets in increasing ``le`` order."""
+    name, _kind, series, _value = row
+    base, sep, rest = series.partition('le="')
+    if not sep:
+        return name, series, 0
+    bound, _quote, tail = rest.partition('"')
+    return name, base + tail, float('inf') if bound == '+Inf' else float(bound)
+
+
+def render(cr):
+    """Return the totals of the database of `cr` in Prometheus text format."""
+    cr.execute(f"SELECT name, kind, series, value FROM {TABLE}")
+    lines = []
+    current = None
+    for name, kind, series, value in sorted(cr.fetchall(), key=_render_order):
+        if name != current:
+            lines.append('# TYPE %s %s' % (name, kind))
+            current = name
+        lines.append('%s %s' % (series, repr(float(value))))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+
+"""On-demand profiling of API requests and cron runs.
+
+A profiled run executes under cProfile while every SQL query of the thread
+is recorded (through Odoo's per-thread query hooks). Profiling is opt-in:
+for one request with the ``X-Appointment-Profile`` header sent by a
+settings administrator, or for every run of the endpoints and crons listed
+in ``external_appointment_scheduler.profile_targets``, so a slow tenant can
+be diagnosed without restarting workers.
+
+The results are stored on the calendar configuration, through a separate
+cursor so failed runs keep their profile: the cProfile stats (``.prof``,
+readable with ``pstats`` or snakeviz) and a text report with the query log.
+"""
+
+from contextlib import contextmanager
+import cProfile
+import functools
+import io
+import logging
+import marshal
+import pstats
+import threading
+import time
+
+__all__ = ["PROFILE_HEADER", "QueryProfiler", "parse_targets", "profiled"]
+
+_logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'X-Appointment-Profile'
+
+# Queries kept in order in the report; all of them are counted and grouped
+MAX_LOGGED_QUERIES = 500
+
+# Functions listed in the report, by cumulative time
+MAX_REPORT_FUNCTIONS = 80
+
+_active = threading.local()
+
+
+@functools.lru_cache(maxsize=32)
+def parse_targets(spec):
+    """Return the set of targets in a comma-separated list, e.g. ``"availability,book,cron"``."""
+    return frozenset(item.strip() for item in (spec or '').split(',') if item.strip())
+
+
+class QueryProfiler:
+    """Run a block under cProfile and record the SQL queries of the thread."""
+
+    def __init__(self, name):
+        self.name = name
+        self.queries = []
+        self.query_groups = {}
+        self.query_count = 0
+        self.query_time = 0.0
+        self.duration = None
+        self._profile = cProfile.Profile()
+        self._start = None
+        # Query hooks receive wall clock start times
+        self._wall_start = None
+        self._hooks = None
+
+    def __enter__(self):
+        self._profile.enable()
+        thread = threading.current_thread()
+        self._hooks = getattr(thread, 'query_hooks', None)
+        thread.query_hooks = list(self._hooks or ()) + [self._on_query]
+        self._start = time.perf_counter()
+        self._wall_start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._profile.disable()
+        self.duration = time.perf_counter() - self._start
+        thread = threading.current_thread()
+        if self._hooks is None:
+            del thread.query_hooks
+        else:
+            thread.query_hooks = self._hooks
+
+    def _on_query(self, cr, query, params, start, delay, *args):
+        """Query hook called by the cursor after each query."""
+        if isinstance(query, bytes):
+            query = query.decode('utf-8', 'replace')
+        text = ' '.join(str(query).split())
+        self.query_count += 1
+        self.query_time += delay
+        if len(self.queries) < MAX_LOGGED_QUERIES:
+            self.queries.append((start - self._wall_start, delay, text))
+        count, total, longest = self.query_groups.get(text, (0, 0.0, 0.0))
+        self.query_groups[text] = (count + 1, total + delay, max(longest, delay))
+
+    def stats(self):
+        """Return the cProfile stats in the ``.prof`` format of `pstats`."""
+        self._profile.create_stats()
+        return marshal.dumps(self._profile.stats)
+
+    def report(self):
+        """Return the text report: summary, SQL queries grouped and in order, Python functions."""
+        out = io.StringIO()
+        out.write("Profile of %s\n" % self.name)
+        out.write("Duration: %.1f ms, SQL: %d queries in %.1f ms\n\n" % (
+            self.duration * 1000, self.query_count, self.query_time * 1000,
+        ))
+        out.write("== SQL queries by total time ==\n")
+        out.write("%6s %10s %10s  %s\n" % ('count', 'total ms', 'max ms', 'query'))
+        groups = sorted(self.query_groups.items(), key=lambda item: -item[1][1])
+        for text, (count, total, longest) in groups:
+            out.write("%6d %10.2f %10.2f  %s\n" % (count, total * 1000, longest * 1000, _shorten(text)))
+        out.write("\n== SQL queries in order (first %d) ==\n" % MAX_LOGGED_QUERIES)
+        for offset, delay, text in self.queries:
+            out.write("%10.2f %8.2f  %s\n" % (offset * 1000, delay * 1000, _shorten(text)))
+        out.write("\n== Python functions by cumulative time ==\n")
+        stats = pstats.Stats(self._profile, stream=out)
+        stats.sort_stats('cumulative').print_stats(MAX_REPORT_FUNCTIONS)
+        return out.getvalue()
+
+
+def _shorten(text, limit=400):
+    return text if len(text) <= limit else text[:limit] + '...'
+
+
+def _is_requested(env, targets, headers):
+    """Return True if the run of one of `targets` must be profiled."""
+    spec = env['ir.config_parameter'].sudo().get_param('external_appointment_scheduler.profile_targets', '')
+    if parse_targets(spec) & set(targets):
+        return True
+    return bool(headers and headers.get(PROFILE_HEADER)) and env.user._is_system()
+
+
+@contextmanager
+def profiled(env, *targets, headers=None, context=None):
+    """Profile the block if one of `targets` is configured or a header asks for it.
+
+    Nested blocks (a cron method called from a profiled request) are part
+    of the outer profile. Profiling failures never affect the block.
+
+    Args:
+        env: Environment of the profiled run
+        targets (str): Endpoint names as in the request logs (``availability``,
+            ``book``...), ``cron`` or a cron method name
+        headers: Request headers, checked for ``X-Appointment-Profile``
+        context (dict, optional): Request parameters, used to pick the
+            calendar configuration the profile is attached to
+    """
+    if getattr(_active, 'profiler', None) or not _is_requested(env, targets, headers):
+        yield None
+        return
+    profiler = QueryProfiler('%s (%s)' % (targets[-1], env.cr.dbname))
+    try:
+        profiler.__enter__()
+    except ValueError as e:
+        # Another profiler (e.g. Odoo's own) already runs in this thread
+        _logger.warning("Cannot profile %s: %s", profiler.name, e)
+        yield None
+        return
+    _active.profiler = profiler
+    try:
+        yield profiler
+    finally:
+        _active.profiler = None
+        profiler.__exit__(None, None, None)
+        try:
+            with env.registry.cursor() as cr:
+                env(cr=cr, su=True)['external.calendar.config']._attach_profile(
+                    targets[-1], profiler.stats(), profiler.report(), context or {},
+                )
+        except Exception as e:
+            _logger.warning("Failed to store profile of %s: %s", profiler.name, e)
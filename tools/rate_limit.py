@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+"""Client-side quota budget for calendar provider APIs.
+
+Each provider configuration gets a token bucket refilled at the rate of
+its API quota. Callers declare a priority class: higher classes may use
+the whole bucket while lower ones must leave a reserve, so when quota is
+tight booking calls are served before interactive reads, and those before
+background sync and cron traffic.
+
+The quota is per provider account, so the bucket must be shared by every
+worker: `SharedTokenBucket` keeps its state in a store such as the
+``external.appointment.rate.limit`` table instead of process memory.
+"""
+
+import threading
+import time
+
+from odoo.addons.external_appointment_scheduler.tools.circuit_breaker import ProviderUnavailable
+
+__all__ = [
+    "TokenBucket", "SharedTokenBucket", "QuotaExhausted",
+    "MIN_CAPACITY", "PRIORITY_RESERVE", "PRIORITY_WAIT", "REQUEST_MAX_WAIT",
+]
+
+# Share of the bucket a priority class must leave for higher classes
+PRIORITY_RESERVE = {
+    'booking': 0.0,
+    'interactive': 0.2,
+    'background': 0.5,
+}
+
+# Smallest bucket in which every class can take a token: a class may only
+# acquire while capacity * (1 - reserve) >= 1
+MIN_CAPACITY = 1 / (1 - max(PRIORITY_RESERVE.values()))
+
+# Longest a caller of each class waits for quota, in seconds
+PRIORITY_WAIT = {
+    'booking': 10,
+    'interactive': 2,
+    'background': 30,
+}
+
+# Longest a caller waits for quota while serving an HTTP request, whatever
+# its class: a worker must not sit idle for seconds in front of a client
+REQUEST_MAX_WAIT = 2
+
+
+class QuotaExhausted(ProviderUnavailable):
+    """No quota became available in time for the call."""
+
+
+class TokenBucket:
+    """Thread-safe token bucket with priority reserves."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_acquire(self, priority='interactive'):
+        """Take one token if the class may, else return the seconds to wait.
+
+        Returns:
+            float: 0 if a token was taken, otherwise the estimated wait
+        """
+        reserve = self.capacity * PRIORITY_RESERVE.get(priority, PRIORITY_RESERVE['interactive'])
+        with self._lock:
+            self._refill()
+            if self.tokens - 1 >= reserve:
+                self.tokens -= 1
+                return 0
+            return (reserve + 1 - self.tokens) / self.rate
+
+    def acquire(self, priority='interactive', timeout=None):
+        """Wait for a token for at most `timeout` seconds.
+
+        Returns:
+            bool: True if a token was taken
+        """
+        if timeout is None:
+            timeout = PRIORITY_WAIT.get(priority, PRIORITY_WAIT['interactive'])
+        give_up_at = time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire(priority)
+            if not wait:
+                return True
+            if time.monotonic() + wait > give_up_at:
+                return False
+            time.sleep(wait)
+
+    def penalize(self, seconds):
+        """Stop handing out tokens for about `seconds` (provider said slow down)."""
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+
+class SharedTokenBucket(TokenBucket):
+    """Token bucket whose state lives in a store shared by every worker.
+
+    The store refills and takes tokens atomically; it must provide
+    ``_take(key, rate, capacity, reserve)``, returning 0 if a token was
+    taken or else the seconds to wait, and ``_penalize(key, rate, seconds)``.
+    """
+
+    def __init__(self, store, key, rate, capacity):
+        super().__init__(rate, max(capacity, MIN_CAPACITY))
+        self.store = store
+        self.key = key
+
+    def try_acquire(self, priority='interactive'):
+        reserve = self.capacity * PRIORITY_RESERVE.get(priority, PRIORITY_RESERVE['interactive'])
+        return self.store._take(self.key, self.rate, self.capacity, reserve)
+
+    def penalize(self, seconds):
+        self.store._penalize(self.key, self.rate, seconds)
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+
+"""Structured, sampled logging of API requests and provider calls.
+
+Each request or provider call produces one event: a JSON object with the
+endpoint, outcome (``ok``, ``rejected`` for 4xx answers, ``error``) and
+latency, plus a few context fields, that a log pipeline can aggregate.
+
+To stay cheap on hot paths, nothing is formatted unless the record is
+actually emitted, and successful events can be sampled: with a sample rate
+of 0.1 only one in ten is logged (the rate is included in the event so
+counts can be scaled back). Errors are never sampled. Successful events of
+each endpoint are logged at their own level, so a noisy endpoint can be
+moved to DEBUG without silencing the others. Fields carrying personal data
+or secrets are redacted before they reach the log.
+"""
+
+from contextlib import contextmanager
+import functools
+import json
+import logging
+import random
+import time
+
+from odoo.addons.external_appointment_scheduler.tools import metrics, profiling, tracing
+
+__all__ = [
+    "LogPolicy", "StructuredEvent", "get_log_policy", "log_event",
+    "logged_endpoint", "outcome_of", "redact", "timed_event",
+]
+
+_logger = logging.getLogger('odoo.addons.external_appointment_scheduler.requests')
+
+# Field names (lower case) whose values never reach the log
+REDACTED_FIELDS = frozenset({
+    'name', 'email', 'phone', 'notes',
+    'customer_name', 'customer_email', 'customer_phone',
+    'partner_name', 'partner_email', 'partner_phone',
+    'authorization', 'cookie', 'x-api-key', 'password',
+    'token', 'access_token', 'refresh_token', 'hold_token', 'body',
+})
+
+# Longest field value logged, longer values are truncated
+MAX_VALUE_LENGTH = 64
+
+
+def redact(fields):
+    """Return `fields` with sensitive values masked and long values truncated."""
+    clean = {}
+    for key, value in fields.items():
+        if key.lower() in REDACTED_FIELDS:
+            value = '***' if value not in (None, '') else value
+        elif isinstance(value, dict):
+            value = redact(value)
+        elif isinstance(value, str) and len(value) > MAX_VALUE_LENGTH:
+            value = value[:MAX_VALUE_LENGTH] + '...'
+        elif not isinstance(value, (str, int, float, bool, type(None))):
+            value = type(value).__name__
+        clean[key] = value
+    return clean
+
+
+class StructuredEvent:
+    """Log message rendered as JSON only when the record is emitted."""
+
+    __slots__ = ('fields',)
+
+    def __init__(self, fields):
+        self.fields = fields
+
+    def __str__(self):
+        return json.dumps(self.fields, default=str, separators=(',', ':'))
+
+
+class LogPolicy:
+    """Level and sample rate of successful events, per endpoint."""
+
+    def __init__(self, levels=None, sample_rate=1.0, default_level=logging.INFO):
+        self.levels = levels or {}
+        self.sample_rate = min(max(sample_rate, 0.0), 1.0)
+        self.default_level = default_level
+
+    @classmethod
+    @functools.lru_cache(maxsize=32)
+    def parse(cls, levels_spec='', sample_rate=1.0):
+        """Build a policy from ``endpoint=LEVEL`` pairs separated by commas.
+
+        Unknown level names are ignored, e.g. ``"availability=DEBUG,book=INFO"``.
+        """
+        levels = {}
+        for item in (levels_spec or '').split(','):
+            endpoint, _sep, level = item.partition('=')
+            level = logging.getLevelName(level.strip().upper())
+            if endpoint.strip() and isinstance(level, int):
+                levels[endpoint.strip()] = level
+        return cls(levels, sample_rate)
+
+    def level_for(self, endpoint, outcome):
+        """Return the level to log an event at, or None to skip it.
+
+        Errors are logged at ERROR; other outcomes at the endpoint level,
+        subject to sampling.
+        """
+        if outcome == 'error':
+            return logging.ERROR
+        level = self.levels.get(endpoint, self.default_level)
+        if not _logger.isEnabledFor(level):
+            return None
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return None
+        return level
+
+
+def log_event(event, level, sample_rate=1.0, **fields):
+    """Log one structured event at `level`; the message is built lazily.
+
+    Events logged within a trace carry its ``correlation_id``.
+    """
+    if _logger.isEnabledFor(level):
+        fields = dict(event=event, **redact(fields))
+        cid = tracing.correlation_id()
+        if cid:
+            fields['correlation_id'] = cid
+        if sample_rate < 1:
+            fields['sample_rate'] = sample_rate
+        _logger.log(level, '%s', StructuredEvent(fields))
+
+
+@contextmanager
+def timed_event(policy, event, endpoint, **fields):
+    """Time the block and log it as one event of `endpoint` according to `policy`.
+
+    The block may add fields (e.g. ``status``, ``outcome``) to the yielded
+    dict, or set ``discard`` to log nothing; an exception escaping it sets
+    the outcome to ``error``.
+    """
+    fields['endpoint'] = endpoint
+    start = time.perf_counter()
+    try:
+        yield fields
+    except Exception as e:
+        fields['outcome'] = 'error'
+        fields['error_type'] = type(e).__name__
+        raise
+    finally:
+        outcome = fields.setdefault('outcome', 'ok')
+        level = None if fields.pop('discard', False) else policy.level_for(endpoint, outcome)
+        if level is not None:
+            fields['latency_ms'] = round((time.perf_counter() - start) * 1000, 2)
+            log_event(event, level, sample_rate=1.0 if outcome == 'error' else policy.sample_rate, **fields)
+
+
+def get_log_policy(env):
+    """Return the logging policy configured for the database of `env`.
+
+    Reads ``external_appointment_scheduler.log_levels`` and
+    ``external_appointment_scheduler.log_sample_rate``.
+    """
+    params = env['ir.config_parameter'].sudo()
+    return LogPolicy.parse(
+        params.get_param('external_appointment_scheduler.log_levels', ''),
+        float(params.get_param('external_appointment_scheduler.log_sample_rate', 1.0) or 1.0),
+    )
+
+
+def outcome_of(status):
+    """Return the outcome of an HTTP status code."""
+    if status >= 500:
+        return 'error'
+    return 'rejected' if status >= 400 else 'ok'
+
+
+# WSGI environ key counting the attempts of a request retried by Odoo
+_ATTEMPT_ENVIRON_KEY = 'external_appointment_scheduler.attempt'
+
+
+def logged_endpoint(endpoint):
+    """Decorate an HTTP controller method to log and trace each request.
+
+    The event carries the HTTP method, status, outcome, latency and the
+    (redacted) request parameters. The latency is also recorded in the
+    ``external_appointment_request_duration_seconds`` histogram. The
+    request runs in a trace whose correlation ID is taken from the
+    ``X-Correlation-ID`` request header and returned in the response, and
+    is profiled on demand (see `profiling.profiled`).
+
+    Odoo retries a request failing on a concurrency error (serialization
+    failure, deadlock) a few times: only the attempt that answers, or the
+    last one, is logged and counted.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            from odoo.http import request
+            from odoo.service.model import MAX_TRIES_ON_CONCURRENCY_FAILURE, PG_CONCURRENCY_EXCEPTIONS_TO_RETRY
+            policy = get_log_policy(request.env)
+            exporter, sample_rate = tracing.get_trace_settings(request.env)
+            httprequest = request.httprequest
+            attempt = httprequest.environ[_ATTEMPT_ENVIRON_KEY] = httprequest.environ.get(_ATTEMPT_ENVIRON_KEY, 0) + 1
+            with tracing.start_trace('http %s' % endpoint, exporter, sample_rate,
+                                     correlation=httprequest.headers.get(tracing.CORRELATION_HEADER),
+                                     kind='SERVER', endpoint=endpoint, **{
+                                         'http.method': httprequest.method, 'http.path': httprequest.path,
+                                     }) as root, \
+                    metrics.timed(request.env.cr.dbname, 'external_appointment_request_duration_seconds',
+                                  endpoint=endpoint) as result, \
+                    timed_event(policy, 'http_request', endpoint, method=httprequest.method,
+                                params=kwargs) as fields:
+                try:
+                    with profiling.profiled(request.env, endpoint, headers=httprequest.headers, context=kwargs):
+                        response = func(self, *args, **kwargs)
+                except PG_CONCURRENCY_EXCEPTIONS_TO_RETRY:
+                    if attempt < MAX_TRIES_ON_CONCURRENCY_FAILURE:
+                        result['discard'] = fields['discard'] = True
+                    raise
+                if isinstance(response, tuple):
+                    status = response[1]
+                else:
+                    status = getattr(response, 'status_code', 200)
+                fields['status'] = status
+                fields['outcome'] = result['outcome'] = outcome_of(status)
+                if root:
+                    root.set_tag('http.status_code', status)
+                if hasattr(response, 'headers'):
+                    response.headers[tracing.CORRELATION_HEADER] = tracing.correlation_id()
+                return response
+        return wrapper
+    return decorator
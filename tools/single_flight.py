@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+"""Coalescing of identical concurrent computations.
+
+When several threads of a worker ask for the same value at the same time,
+only the first one (the leader) computes it; the others wait for its
+result instead of repeating the work. This only helps where a process
+serves requests concurrently (threaded or evented servers); prefork
+workers handle one request at a time and need a shared store to coalesce
+(see ``external.appointment.slot.flight``).
+"""
+
+import threading
+
+__all__ = ["SingleFlight", "get_flight", "flight_stats"]
+
+
+class _Call:
+    """One in-flight computation and its outcome."""
+
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Run at most one computation per key at a time, sharing its result."""
+
+    def __init__(self, name, timeout=30):
+        self.name = name
+        self.timeout = timeout
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key, func, share=None):
+        """Return ``func()``, or the result of an identical call in flight.
+
+        Args:
+            key: Hashable identifier of the computation
+            func (callable): Computation to run if no call for `key` is in flight
+            share (callable, optional): Predicate telling whether the leader's
+                result may be handed to the callers waiting for it, e.g. not
+                when it is partial or stale
+
+        Returns:
+            The result of `func`, possibly computed by another thread. If the
+            leader does not finish within the timeout, or its result is not
+            to be shared, the caller computes its own result.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            if call.done.wait(self.timeout):
+                if call.error is not None:
+                    raise call.error
+                if share is None or share(call.result):
+                    return call.result
+            return func()
+
+        try:
+            call.result = func()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        """Return execution and coalescing counters."""
+        calls = self.executions + self.coalesced
+        return {
+            'calls': calls,
+            'executions': self.executions,
+            'coalesced': self.coalesced,
+            'coalescing_ratio': round(self.coalesced / calls, 4) if calls else None,
+            'in_flight': len(self._calls),
+        }
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def get_flight(name, timeout=30):
+    """Return the process-wide single-flight group called `name`."""
+    flight = _flights.get(name)
+    if flight is None:
+        with _flights_lock:
+            flight = _flights.setdefault(name, SingleFlight(name, timeout=timeout))
+    return flight
+
+
+def flight_stats():
+    """Return the counters of every single-flight group, keyed by name."""
+    return {name: flight.stats() for name, flight in _flights.items()}
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+"""Minute-resolution bitmaps for availability computations.
+
+A day is represented as a Python integer where bit ``i`` is set when the
+minute ``i`` after the day's origin is blocked (busy, booked at capacity,
+...). Checking whether a slot is free is then a single mask test, which
+makes per-day summaries over long ranges cheap.
+"""
+
+import math
+from datetime import datetime, time, timedelta
+
+__all__ = ["MINUTES_PER_DAY", "blocked_bitmap", "bitmaps_by_day", "is_free", "intervals_at_capacity"]
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def _minute_span(start, end, origin, minutes):
+    """Return the [first, last) minute cells covered by an interval."""
+    first = max(0, math.floor((start - origin).total_seconds() / 60))
+    last = min(minutes, math.ceil((end - origin).total_seconds() / 60))
+    return first, last
+
+
+def blocked_bitmap(intervals, origin, minutes=MINUTES_PER_DAY):
+    """Build the bitmap of minutes after `origin` overlapped by `intervals`.
+
+    Args:
+        intervals (iterable): (start, end) datetime pairs
+        origin (datetime): Datetime of bit 0
+        minutes (int): Number of minutes covered by the bitmap
+
+    Returns:
+        int: Bitmap with blocked minutes set
+    """
+    bitmap = 0
+    for start, end in intervals:
+        first, last = _minute_span(start, end, origin, minutes)
+        if last > first:
+            bitmap |= ((1 << (last - first)) - 1) << first
+    return bitmap
+
+
+def bitmaps_by_day(intervals):
+    """Build one bitmap per calendar day touched by `intervals`.
+
+    Args:
+        intervals (iterable): (start, end) datetime pairs
+
+    Returns:
+        dict: date -> bitmap with bit 0 at midnight of that day
+    """
+    bitmaps = {}
+    for start, end in intervals:
+        day = start.date()
+        while datetime.combine(day, time.min) < end:
+            origin = datetime.combine(day, time.min)
+            bitmaps[day] = bitmaps.get(day, 0) | blocked_bitmap([(start, end)], origin)
+            day += timedelta(days=1)
+    return bitmaps
+
+
+def is_free(bitmap, origin, start, end, minutes=MINUTES_PER_DAY):
+    """Return True if no blocked minute of `bitmap` overlaps [start, end)."""
+    first, last = _minute_span(start, end, origin, minutes)
+    if last <= first:
+        return True
+    return not bitmap & (((1 << (last - first)) - 1) << first)
+
+
+def intervals_at_capacity(intervals, capacity):
+    """Return the periods where at least `capacity` intervals overlap.
+
+    Args:
+        intervals (iterable): (start, end) datetime pairs
+        capacity (int): Number of simultaneous intervals that fills a period
+
+    Returns:
+        list: (start, end) pairs, sorted and non-overlapping
+    """
+    events = []
+    for start, end in intervals:
+        if end > start:
+            events.append((start, 1))
+            events.append((end, -1))
+    # Ends sort before starts at the same instant: back-to-back is no overlap
+    events.sort(key=lambda event: (event[0], event[1]))
+
+    blocked = []
+    depth = 0
+    opened_at = None
+    for instant, delta in events:
+        depth += delta
+        if depth >= capacity and opened_at is None:
+            opened_at = instant
+        elif depth < capacity and opened_at is not None:
+            if instant > opened_at:
+                blocked.append((opened_at, instant))
+            opened_at = None
+    return blocked
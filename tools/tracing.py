@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+
+"""Lightweight tracing of API requests down to provider calls.
+
+A trace is opened per API request (and per cron run) with `start_trace`;
+`span` opens child spans for the steps worth timing inside it: ORM
+batches, adapter calls, mail rendering. The current span is kept in a
+context variable, so code deep in the call stack joins the trace without
+it being passed around, and `span` costs nothing outside a sampled trace.
+
+Every trace has a correlation ID, taken from the caller's
+``X-Correlation-ID`` header when it sends one. It is added to the
+structured log events and to outgoing provider requests, whether or not
+spans are recorded.
+
+Each span records its duration plus the number and time of the SQL queries
+the thread ran meanwhile. Finished traces are exported as Zipkin v2 JSON
+spans, appended to a JSON lines file or posted to a collector (Zipkin, or
+an OpenTelemetry collector with a Zipkin receiver) from a background
+thread, so exporting never delays a request.
+"""
+
+from contextlib import contextmanager
+import contextvars
+import functools
+import json
+import logging
+import os
+import queue
+import random
+import re
+import secrets
+import threading
+import time
+
+__all__ = [
+    "CORRELATION_HEADER", "Span", "correlation_id", "current_span",
+    "get_exporter", "get_trace_settings", "outgoing_headers", "span", "start_trace",
+]
+
+_logger = logging.getLogger(__name__)
+
+CORRELATION_HEADER = 'X-Correlation-ID'
+
+SERVICE_NAME = 'external_appointment_scheduler'
+
+# Correlation IDs accepted from callers; anything else gets a fresh one
+_CORRELATION_RE = re.compile(r'[\w.:-]{1,64}')
+
+_correlation_id = contextvars.ContextVar('external_appointment_correlation_id', default=None)
+_current_span = contextvars.ContextVar('external_appointment_span', default=None)
+
+
+def _query_stats():
+    """Return the (count, seconds) of SQL queries run so far by this thread.
+
+    Odoo maintains these counters on request and cron threads.
+    """
+    thread = threading.current_thread()
+    return getattr(thread, 'query_count', 0), getattr(thread, 'query_time', 0.0)
+
+
+class _Trace:
+    """Spans finished so far in one trace, exported when the root span ends."""
+
+    __slots__ = ('trace_id', 'exporter', 'spans')
+
+    def __init__(self, exporter):
+        self.trace_id = secrets.token_hex(16)
+        self.exporter = exporter
+        self.spans = []
+
+
+class Span:
+    """One timed step of a trace."""
+
+    __slots__ = ('trace', 'span_id', 'parent_id', 'name', 'kind', 'tags',
+                 'timestamp', 'duration', '_start', '_queries')
+
+    def __init__(self, trace, name, parent_id=None, kind=None, tags=None):
+        self.trace = trace
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.tags = tags or {}
+        self.timestamp = time.time()
+        self.duration = None
+        self._start = time.perf_counter()
+        self._queries = _query_stats()
+
+    def set_tag(self, key, value):
+        """Attach `key` = `value` to the span."""
+        self.tags[key] = value
+
+    def _finish(self):
+        self.duration = time.perf_counter() - self._start
+        count, seconds = _query_stats()
+        self.tags['db.queries'] = count - self._queries[0]
+        self.tags['db.query_ms'] = round((seconds - self._queries[1]) * 1000, 2)
+        self.trace.spans.append(self)
+
+    def to_zipkin(self):
+        """Return the span in Zipkin v2 JSON format."""
+        data = {
+            'traceId': self.trace.trace_id,
+            'id': self.span_id,
+            'name': self.name,
+            'timestamp': int(self.timestamp * 1e6),
+            'duration': max(1, int(self.duration * 1e6)),
+            'localEndpoint': {'serviceName': SERVICE_NAME},
+            'tags': {key: str(value) for key, value in self.tags.items() if value is not None},
+        }
+        if self.parent_id:
+            data['parentId'] = self.parent_id
+        if self.kind:
+            data['kind'] = self.kind
+        return data
+
+
+def correlation_id():
+    """Return the correlation ID of the current request or cron run, if any."""
+    return _correlation_id.get()
+
+
+def current_span():
+    """Return the innermost open span, None outside a sampled trace."""
+    return _current_span.get()
+
+
+def outgoing_headers():
+    """Return the headers propagating the current trace to a provider request.
+
+    ``X-Correlation-ID`` is always sent within a trace; ``traceparent`` (W3C
+    Trace Context) only when spans are recorded.
+    """
+    headers = {}
+    cid = _correlation_id.get()
+    if cid:
+        headers[CORRELATION_HEADER] = cid
+    current = _current_span.get()
+    if current:
+        headers['traceparent'] = '00-%s-%s-01' % (current.trace.trace_id, current.span_id)
+    return headers
+
+
+@contextmanager
+def span(name, kind=None, **tags):
+    """Time the block as a child of the current span.
+
+    Yields the span, or None (and records nothing) outside a sampled trace.
+    An exception escaping the block is recorded in the ``error`` tag.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(parent.trace, name, parent_id=parent.span_id, kind=kind, tags=tags)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except Exception as e:
+        child.tags['error'] = type(e).__name__
+        raise
+    finally:
+        _current_span.reset(token)
+        child._finish()
+
+
+@contextmanager
+def start_trace(name, exporter=None, sample_rate=1.0, correlation=None, kind=None, **tags):
+    """Open a trace around the block, or a child span when one is already open.
+
+    The trace gets the `correlation` ID when it is a valid one, otherwise a
+    new one. Spans are only recorded, and exported to `exporter` when the
+    block ends, if an exporter is given and the trace is sampled.
+
+    Yields:
+        Span: Root span, None if spans are not recorded
+    """
+    if _correlation_id.get():
+        with span(name, kind=kind, **tags) as child:
+            yield child
+        return
+    if not (correlation and _CORRELATION_RE.fullmatch(correlation)):
+        correlation = secrets.token_hex(8)
+    cid_token = _correlation_id.set(correlation)
+    root = None
+    if exporter is not None and (sample_rate >= 1 or random.random() < sample_rate):
+        root = Span(_Trace(exporter), name, kind=kind, tags=dict(tags, correlation_id=correlation))
+    span_token = _current_span.set(root)
+    try:
+        yield root
+    except Exception as e:
+        if root:
+            root.tags['error'] = type(e).__name__
+        raise
+    finally:
+        _current_span.reset(span_token)
+        _correlation_id.reset(cid_token)
+        if root:
+            root._finish()
+            exporter.submit(root.trace.spans)
+
+
+class FileExporter:
+    """Append spans to a JSON lines file, one span per line."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def export(self, spans):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.writelines(json.dumps(data, separators=(',', ':')) + '\n' for data in spans)
+
+
+class HttpExporter:
+    """POST spans to a Zipkin-compatible collector, e.g. ``http://collector:9411/api/v2/spans``."""
+
+    def __init__(self, url, timeout=2):
+        self.url = url
+        self.timeout = timeout
+
+    def export(self, spans):
+        import requests
+        response = requests.post(self.url, json=spans, timeout=self.timeout)
+        response.raise_for_status()
+
+
+class BackgroundExporter:
+    """Hand finished traces to a target exporter from a daemon thread.
+
+    Traces are dropped, and counted in `dropped`, when the queue is full:
+    tracing must never slow requests down or grow the worker's memory.
+    The thread is started on first use in each (forked) process.
+    """
+
+    MAX_QUEUE = 1000
+    MAX_BATCH = 500
+
+    def __init__(self, target):
+        self.target = target
+        self.dropped = 0
+        self._queue = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def submit(self, spans):
+        """Queue the spans of one finished trace for export."""
+        if self._pid != os.getpid():
+            self._start()
+        try:
+            self._queue.put_nowait(spans)
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # Neither the queue nor the thread of a parent process survive a fork
+            self._queue = queue.Queue(self.MAX_QUEUE)
+            threading.Thread(target=self._run, args=(self._queue,),
+                             name='appointment-trace-export', daemon=True).start()
+            self._pid = os.getpid()
+
+    def _run(self, traces):
+        while True:
+            batch = list(traces.get())
+            while len(batch) < self.MAX_BATCH:
+                try:
+                    batch.extend(traces.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.target.export([item.to_zipkin() for item in batch])
+            except Exception as e:
+                _logger.warning("Failed to export appointment traces: %s", e)
+
+
+@functools.lru_cache(maxsize=8)
+def get_exporter(spec):
+    """Return the exporter for `spec`, None when tracing is disabled.
+
+    Args:
+        spec (str): Collector URL (``http://`` or ``https://``), or
+            ``file:<path>`` for a JSON lines file; empty disables export
+
+    Returns:
+        BackgroundExporter: Shared by all traces with the same `spec`
+    """
+    spec = (spec or '').strip()
+    if spec.startswith(('http://', 'https://')):
+        return BackgroundExporter(HttpExporter(spec))
+    if spec.startswith('file:'):
+        return BackgroundExporter(FileExporter(spec[len('file:'):]))
+    if spec:
+        _logger.warning("Ignoring unknown trace export target %r", spec)
+    return None
+
+
+def get_trace_settings(env):
+    """Return the (exporter, sample rate) configured for the database of `env`.
+
+    Reads ``external_appointment_scheduler.trace_export`` and
+    ``external_appointment_scheduler.trace_sample_rate``.
+    """
+    params = env['ir.config_parameter'].sudo()
+    return (
+        get_exporter(params.get_param('external_appointment_scheduler.trace_export', '')),
+        float(params.get_param('external_appointment_scheduler.trace_sample_rate', 1.0) or 1.0),
+    )
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+"""Bounded, streamed handling of files uploaded with bookings.
+
+Uploads are checked against count, type and declared size limits before
+they are copied anywhere, then copied in fixed-size chunks while their
+checksum is computed, so memory use does not grow with the file size.
+
+These checks cannot prevent receiving the request: the multipart body is
+parsed (and large files spooled to temporary files) by werkzeug before the
+controller runs. Bounding the bytes received is the job of Odoo's and the
+proxy's request size limits.
+"""
+
+import hashlib
+import os
+
+__all__ = ["ANY_TYPE", "UploadLimits", "UploadRejected", "copy_stream"]
+
+CHUNK_SIZE = 64 * 1024
+
+# Allowed types entry accepting every file type
+ANY_TYPE = '*'
+
+
+class UploadRejected(Exception):
+    """An upload exceeds the configured limits.
+
+    Attributes:
+        status: HTTP status to answer with (413 too large, 415 wrong type)
+    """
+
+    def __init__(self, message, status=413):
+        super().__init__(message)
+        self.status = status
+
+
+class UploadLimits:
+    """Size, count and type limits for the files of one request.
+
+    `allowed_types` lists extensions or MIME types; no types or `ANY_TYPE`
+    accepts every type.
+    """
+
+    def __init__(self, max_size, max_count, allowed_types=None):
+        self.max_size = max_size
+        self.max_count = max_count
+        types = {t.strip().lower().lstrip('.') for t in allowed_types or () if t.strip()}
+        self.allowed_types = set() if ANY_TYPE in types else types
+
+    def check(self, uploads, content_length=None):
+        """Reject a request whose files cannot all be within the limits.
+
+        Args:
+            uploads (list): (filename, mimetype) pairs
+            content_length (int, optional): Declared size of the whole request
+
+        Raises:
+            UploadRejected: On too many files, a disallowed type or a request
+                larger than all files at their maximum size
+        """
+        if len(uploads) > self.max_count:
+            raise UploadRejected(f"At most {self.max_count} files may be attached")
+        if content_length and uploads and content_length > self.max_size * len(uploads) + CHUNK_SIZE:
+            raise UploadRejected(f"Attachments may not exceed {self.max_size} bytes each")
+        if not self.allowed_types:
+            return
+        for filename, mimetype in uploads:
+            extension = os.path.splitext(filename or '')[1].lower().lstrip('.')
+            if extension not in self.allowed_types and (mimetype or '').lower() not in self.allowed_types:
+                raise UploadRejected(f"File type of {filename} is not allowed", status=415)
+
+
+def copy_stream(source, target, max_size, chunk_size=CHUNK_SIZE):
+    """Copy `source` into `target` in chunks, hashing on the way.
+
+    Args:
+        source: Readable binary file object
+        target: Writable binary file object
+        max_size (int): Largest accepted size in bytes
+
+    Returns:
+        tuple: (sha1 hex digest, size in bytes)
+
+    Raises:
+        UploadRejected: As soon as more than `max_size` bytes were read
+    """
+    sha1 = hashlib.sha1()
+    size = 0
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > max_size:
+            raise UploadRejected(f"Attachments may not exceed {max_size} bytes each")
+        sha1.update(chunk)
+        target.write(chunk)
+    return sha1.hexdigest(), size